@@ -1,20 +1,140 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from flask_mysqldb import MySQL
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-import MySQLdb.cursors
-import re
+import click
+import os
+
+from availability import AvailabilityCache
+from billing import Tariff, TariffTable
+from db import PoolTimeout, get_pool, get_repository, init_app as init_db
+from expiry import ExpiryScheduler
+from export import BOOKING_COLUMNS, csv_chunks
+from live_updates import SlotEventBroker
+from metrics import Metrics, init_app as init_metrics
+from nearby import NearbyLots, parse_coordinates
+from onboarding import import_users, read_users, registration_error
+from occupancy import SlotMap, SlotMaps, format_ranges, parse_slot_ranges
+from occupancy_history import DAY_NAMES, OccupancySampler
+from reservations import SlotSchedules
+from stats import StatsSnapshot
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
+# Storage backend: 'mysql', or 'sqlite' for an embedded database at SQLITE_PATH (a file,
+# or ':memory:'), created from scripts/sqlite_schema.sql when empty
+app.config['DB_BACKEND'] = os.environ.get('DB_BACKEND', 'mysql')
+app.config['SQLITE_PATH'] = os.environ.get('SQLITE_PATH', 'parking.db')
+
 # MySQL Configuration
 app.config['MYSQL_HOST'] = 'localhost'
 app.config['MYSQL_USER'] = 'root'
 app.config['MYSQL_PASSWORD'] = '2155'
 app.config['MYSQL_DB'] = 'parking_app'
 
-mysql = MySQL(app)
+# Booking expiry worker: 'thread' runs it inside each app process, 'off' leaves it
+# to a separate `flask expire-bookings --loop` process
+app.config['EXPIRY_SCHEDULER'] = 'thread'
+# Bookings settled per transaction; 'bulk' settles each chunk with set-based SQL,
+# 'row' uses the original per-booking updates
+app.config['EXPIRY_SETTLEMENT'] = 'bulk'
+app.config['EXPIRY_BATCH_SIZE'] = 500
+app.config['EXPIRY_MAX_SLEEP'] = 60
+
+# Occupancy history: 'thread' samples every lot's occupancy inside each app process,
+# 'off' leaves it to a separate `flask sample-occupancy --loop` process. Samples are
+# taken every OCCUPANCY_SAMPLE_INTERVAL seconds (a divisor of 3600) and kept for
+# OCCUPANCY_HISTORY_DAYS days: 2 bytes each, so 210 KB per lot and year at 300 seconds.
+app.config['OCCUPANCY_SAMPLER'] = 'thread'
+app.config['OCCUPANCY_SAMPLE_INTERVAL'] = 300
+app.config['OCCUPANCY_HISTORY_DAYS'] = 365
+# Weeks averaged by the admin occupancy heatmap unless the page asks for others
+app.config['OCCUPANCY_HEATMAP_WEEKS'] = 4
+
+# Where dashboards read slot counts from: 'table' uses the lot_occupancy summary
+# table (shared by all processes), 'cache' the in-memory per-process counters
+app.config['AVAILABILITY_SOURCE'] = 'table'
+# Seconds between full reconciles of the in-memory slot availability counts
+app.config['AVAILABILITY_RECONCILE_INTERVAL'] = 300
+# Seconds an admin dashboard statistics snapshot may be reused
+app.config['DASHBOARD_STATS_TTL'] = 10
+
+# Slot provisioning: rows per multi-row INSERT and the most slots one request may add
+app.config['SLOT_INSERT_CHUNK_SIZE'] = 1000
+app.config['MAX_SLOTS_PER_REQUEST'] = 10000
+# Most slots one bulk delete or restore may select
+app.config['MAX_BULK_SLOTS'] = 10000
+
+# Rows per page on the booking history pages
+app.config['BOOKINGS_PAGE_SIZE'] = 50
+
+# `flask archive-bookings` moves completed and cancelled bookings this many days old to
+# bookings_archive, in batches of ARCHIVE_BATCH_SIZE with a pause (seconds) in between
+app.config['ARCHIVE_AFTER_DAYS'] = 90
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+app.config['ARCHIVE_BATCH_PAUSE'] = 0.1
+
+# Slot grids render from an in-memory occupancy map per lot: lots kept per process,
+# and slots per page of the admin grid (booking details are only read for that page)
+app.config['SLOT_MAP_CACHE_LOTS'] = 200
+app.config['ADMIN_SLOTS_PAGE_SIZE'] = 200
+
+# Advance reservations: how many days ahead a slot can be reserved, the longest
+# reservation in hours, and how many minutes before its start one can be checked in
+app.config['RESERVATION_MAX_DAYS_AHEAD'] = 30
+app.config['RESERVATION_MAX_HOURS'] = 24
+app.config['RESERVATION_CHECK_IN_MINUTES'] = 15
+# Lots whose reservation schedule each process keeps in memory, and the seconds a
+# schedule may miss reservations made by other processes before it is reloaded
+app.config['SLOT_SCHEDULE_CACHE_LOTS'] = 50
+app.config['SLOT_SCHEDULE_MAX_STALENESS'] = 1
+
+# Nearest-lot search: seconds before the in-memory index of lot coordinates is rebuilt
+# (sooner after this process adds, deletes or moves a lot), and the lots a search
+# returns by default and at most
+app.config['NEARBY_LOTS_REFRESH_INTERVAL'] = 300
+app.config['NEARBY_LOTS_DEFAULT_COUNT'] = 10
+app.config['NEARBY_LOTS_MAX_COUNT'] = 50
+
+# `flask import-users`: processes hashing passwords (None for one per CPU) and users
+# per multi-row INSERT
+app.config['ONBOARDING_WORKERS'] = None
+app.config['ONBOARDING_CHUNK_SIZE'] = 1000
+
+# Connection pool: DB_POOL_SIZE connections per process, or DB_MAX_CONNECTIONS shared
+# across the gunicorn workers (WEB_CONCURRENCY) when it is not set
+app.config['DB_POOL_ENABLED'] = True
+app.config['DB_POOL_SIZE'] = None
+app.config['DB_MAX_CONNECTIONS'] = 40
+app.config['DB_POOL_TIMEOUT'] = 5
+app.config['DB_POOL_RECYCLE'] = 3600
+app.config['DB_POOL_PING_AFTER'] = 30
+
+# Request and query timing, exported at /metrics in the Prometheus text format
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Statements slower than this many seconds are logged with the route that ran them
+app.config['SLOW_QUERY_SECONDS'] = float(os.environ.get('SLOW_QUERY_SECONDS', 0.25))
+# Let scrapers on this host read /metrics without an admin login; turn off when a
+# reverse proxy on the same host forwards outside traffic
+app.config['METRICS_ALLOW_LOCALHOST'] = True
+
+# Live slot updates pushed to the booking page and the admin slot grid over
+# Server-Sent Events: seconds between polls of the slot_events log, seconds between
+# keep-alive comments, events kept per lot for reconnecting clients, and minutes of
+# log kept in the database
+app.config['LIVE_UPDATES_POLL_INTERVAL'] = 1
+app.config['LIVE_UPDATES_HEARTBEAT'] = 15
+app.config['LIVE_UPDATES_BUFFER'] = 256
+app.config['LIVE_UPDATES_RETENTION_MINUTES'] = 60
+
+init_db(app)
+if app.config['METRICS_ENABLED']:
+    init_metrics(app, Metrics(app.config['SLOW_QUERY_SECONDS'], app.logger))
+
+@app.errorhandler(PoolTimeout)
+def database_busy(error):
+    app.logger.warning('Database pool exhausted: %s', error)
+    return 'The server is busy right now, please try again in a moment.', 503
 
 # Make datetime available in all templates
 @app.context_processor
@@ -23,49 +143,282 @@ def inject_now():
 
 def check_expired_bookings():
     """Check and update expired bookings"""
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Find expired bookings
-    cursor.execute('''
-        SELECT b.*, p.price_per_hour 
-        FROM bookings b
-        JOIN parking_lots p ON b.parking_lot_id = p.id
-        WHERE b.status = 'active' AND b.end_time <= NOW()
-    ''')
-    expired_bookings = cursor.fetchall()
-    
-    for booking in expired_bookings:
-        # Calculate actual duration and cost
-        actual_start = booking['actual_start_time'] or booking['start_time']
-        actual_end = datetime.now()
-        
-        # Calculate duration in minutes
-        duration_minutes = (actual_end - actual_start).total_seconds() / 60
-        # Round up to nearest hour for billing
-        duration_hours = max(1, int((duration_minutes + 59) / 60))  # Round up
-        
-        actual_cost = booking['price_per_hour'] * duration_hours
-        
-        # Update booking as completed with actual cost
-        cursor.execute('''
-            UPDATE bookings 
-            SET status = 'completed', 
-                actual_end_time = %s,
-                actual_cost = %s,
-                updated_at = NOW()
-            WHERE id = %s
-        ''', (actual_end, actual_cost, booking['id']))
-        
-        # Free up the parking slot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET status = 'vacant', booking_id = NULL 
-            WHERE booking_id = %s
-        ''', (booking['id'],))
+    return expiry_scheduler.run_once()
+
+# Expired bookings are settled by a background worker, never on the request path.
+# Set EXPIRY_SCHEDULER to 'off' when running `flask expire-bookings --loop` as a
+# separate process instead.
+expiry_scheduler = ExpiryScheduler(app, get_repository,
+                                   batch_size=app.config['EXPIRY_BATCH_SIZE'],
+                                   max_sleep=app.config['EXPIRY_MAX_SLEEP'],
+                                   bulk=app.config['EXPIRY_SETTLEMENT'] == 'bulk')
+
+# Samples every lot's occupancy into the occupancy_history ring for the heatmaps
+occupancy_sampler = OccupancySampler(app, get_repository,
+                                     interval=app.config['OCCUPANCY_SAMPLE_INTERVAL'],
+                                     days=app.config['OCCUPANCY_HISTORY_DAYS'])
+
+# Per-lot slot counts for the dashboards, kept current by the write paths below
+availability_cache = AvailabilityCache(app.config['AVAILABILITY_RECONCILE_INTERVAL'])
+
+def release_expired_slots(settled):
+    for booking_id, lot_id, slot_id in settled:
+        if slot_id:
+            availability_cache.slot_freed(lot_id)
+    dashboard_stats.invalidate()
+
+expiry_scheduler.listeners.append(release_expired_slots)
+
+# Streams slot changes from the slot_events log to the open booking pages and grids
+live_updates = SlotEventBroker(app, get_repository,
+                               poll_interval=app.config['LIVE_UPDATES_POLL_INTERVAL'],
+                               buffer_size=app.config['LIVE_UPDATES_BUFFER'],
+                               retention_minutes=app.config['LIVE_UPDATES_RETENTION_MINUTES'])
+
+# Compact per-lot slot statuses for the slot grids and free slot lookups
+slot_maps = SlotMaps(app.config['SLOT_MAP_CACHE_LOTS'])
+
+# Per-lot interval schedules of the reservations, for free slot searches
+slot_schedules = SlotSchedules(app.config['SLOT_SCHEDULE_CACHE_LOTS'], app.config['SLOT_SCHEDULE_MAX_STALENESS'])
+
+# Spatial index of the lot coordinates, for nearest lot searches
+nearby_lots = NearbyLots(app.config['NEARBY_LOTS_REFRESH_INTERVAL'])
+
+def lots_with_availability(order_by, vacant_only=False, lot_ids=None):
+    """Fetch active parking lots (only those among ``lot_ids`` when given) with their
+    total, available and occupied slot counts"""
+    if app.config['AVAILABILITY_SOURCE'] == 'table':
+        return get_repository().lot_stats(order_by, vacant_only, lot_ids)
+    
+    parking_lots = get_repository().active_lots(order_by, lot_ids)
+    counts = availability_cache.counts(get_repository(), [lot['id'] for lot in parking_lots])
+    for lot in parking_lots:
+        lot_counts = counts.get(lot['id'], {'total': 0, 'vacant': 0, 'booked': 0})
+        lot['total_slots'] = lot_counts['total']
+        lot['available_slots'] = lot_counts['vacant']
+        lot['occupied_slots'] = lot_counts['booked']
+    if vacant_only:
+        parking_lots = [lot for lot in parking_lots if lot['available_slots'] > 0]
+    return parking_lots
+
+def nearest_lots(latitude, longitude, count=None, min_vacant=1, max_km=None):
+    """The nearest active lots with at least ``min_vacant`` vacant slots, nearest first,
+    each with its ``distance_km``"""
+    count = max(1, min(count or app.config['NEARBY_LOTS_DEFAULT_COUNT'], app.config['NEARBY_LOTS_MAX_COUNT']))
+    return nearby_lots.nearest(get_repository(), lambda lot_ids: lots_with_availability('id', lot_ids=lot_ids),
+                               latitude, longitude, count, min_vacant, max_km)
+
+def compute_dashboard_stats():
+    """Compute the admin dashboard lot list and statistics in two queries"""
+    # Get parking lots with slot counts (only count non-deleted slots)
+    parking_lots = lots_with_availability('created_at DESC')
+    
+    # Active bookings plus revenue per month (completed bookings only) from the rollup
+    active_bookings, months = get_repository().booking_summary()
+    total_revenue = sum(month['revenue'] for month in months) if months else 0
+    monthly_revenue = months[:6]
     
-    mysql.connection.commit()
-    cursor.close()
-    return len(expired_bookings)
+    total_slots = sum(lot['total_slots'] for lot in parking_lots)
+    available_slots = sum(lot['available_slots'] for lot in parking_lots)
+    stats = {
+        'total_lots': len(parking_lots),
+        'total_slots': total_slots,
+        'available_slots': available_slots,
+        'occupied_slots': total_slots - available_slots,
+        'active_bookings': active_bookings,
+        'total_revenue': total_revenue,
+        'monthly_revenue': monthly_revenue
+    }
+    return parking_lots, stats
+
+# Shared by concurrent dashboard requests; write paths drop it so changes show up at once
+dashboard_stats = StatsSnapshot(compute_dashboard_stats, app.config['DASHBOARD_STATS_TTL'])
+
+@app.before_request
+def start_background_workers():
+    if app.config['EXPIRY_SCHEDULER'] == 'thread':
+        expiry_scheduler.start()
+    if app.config['OCCUPANCY_SAMPLER'] == 'thread':
+        occupancy_sampler.start()
+
+@app.cli.command('expire-bookings')
+@click.option('--loop', is_flag=True, help='Keep running and settle bookings as they expire.')
+def expire_bookings_command(loop):
+    """Settle all bookings whose end time has passed"""
+    if loop:
+        expiry_scheduler.run()
+    else:
+        click.echo(f'{check_expired_bookings()} expired bookings processed.')
+
+@app.cli.command('sample-occupancy')
+@click.option('--loop', is_flag=True, help='Keep running and sample every OCCUPANCY_SAMPLE_INTERVAL seconds.')
+def sample_occupancy_command(loop):
+    """Record the current occupancy of every lot in the occupancy history"""
+    if loop:
+        occupancy_sampler.run()
+    else:
+        click.echo(f'{occupancy_sampler.run_once()} lots sampled.')
+
+@app.cli.command('revenue')
+@click.argument('action', type=click.Choice(['backfill', 'daily']))
+@click.option('--lot', 'lot_id', type=int, help='Only report this parking lot.')
+@click.option('--days', type=int, default=30, help='Days to report, counting back from today.')
+def revenue_command(action, lot_id, days):
+    """Backfill the revenue rollups from booking history, or print daily revenue per lot"""
+    if action == 'backfill':
+        click.echo(f'{get_repository().backfill_revenue()} daily revenue rows written.')
+        return
+    
+    start_date = datetime.now().date() - timedelta(days=days - 1)
+    for row in get_repository().lot_daily_revenue(lot_id, start_date):
+        click.echo(f"{row['day']} lot {row['lot_id']}: completed ${row['completed_revenue']} "
+                   f"({row['completed_bookings']}), cancelled ${row['cancelled_revenue']} "
+                   f"({row['cancelled_bookings']})")
+
+@app.cli.command('occupancy')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+def occupancy_command(action):
+    """Verify or rebuild the lot_occupancy summary table from parking_slots"""
+    if action == 'rebuild':
+        get_repository().rebuild_occupancy()
+    
+    mismatches = get_repository().verify_occupancy()
+    for row in mismatches:
+        click.echo(f"lot {row['lot_id']}: stored total={row['total_slots']} vacant={row['vacant']} "
+                   f"booked={row['booked']} deleted={row['deleted']}, actual "
+                   f"total={row['actual_total_slots']} vacant={row['actual_vacant']} "
+                   f"booked={row['actual_booked']} deleted={row['actual_deleted']}")
+    click.echo(f'{len(mismatches)} mismatched lots.')
+
+@app.cli.command('archive-bookings')
+@click.option('--older-than', 'days', type=int, help='Age in days of the bookings to archive (ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Bookings moved per transaction (ARCHIVE_BATCH_SIZE).')
+@click.option('--pause', type=float, help='Seconds to wait between batches (ARCHIVE_BATCH_PAUSE).')
+@click.option('--max-batches', type=int, help='Stop after this many batches.')
+def archive_bookings_command(days, batch_size, pause, max_batches):
+    """Move old completed and cancelled bookings from the live table to the archive"""
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    before = datetime.now() - timedelta(days=days)
+    moved = get_repository().archive_bookings(
+        before, batch_size or app.config['ARCHIVE_BATCH_SIZE'],
+        app.config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause, max_batches)
+    counts = get_repository().booking_tier_counts()
+    click.echo(f"{moved} bookings made before {before:%Y-%m-%d %H:%M} archived; "
+               f"{counts['bookings']} live, {counts['bookings_archive']} archived.")
+
+@app.cli.command('export-bookings')
+@click.option('--status', type=click.Choice(['active', 'completed', 'cancelled']))
+@click.option('--lot', 'lot_id', type=int, help='Only bookings of this parking lot.')
+@click.option('--from', 'date_from', help='First day of bookings made (YYYY-MM-DD).')
+@click.option('--to', 'date_to', help='Last day of bookings made (YYYY-MM-DD).')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--output', type=click.File('wb'), default='-', help='File to write, standard output by default.')
+def export_bookings_command(status, lot_id, date_from, date_to, compress, output):
+    """Write the bookings matching the filters as CSV, streamed in constant memory"""
+    filters = {'status': status, 'lot_id': lot_id, 'date_from': date_from, 'date_to': date_to}
+    rows = get_repository().export_bookings(filters)
+    for chunk in csv_chunks(BOOKING_COLUMNS, rows, compress):
+        output.write(chunk)
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='File format; by default .jsonl/.ndjson files are JSON lines, others CSV.')
+@click.option('--workers', type=int, help='Processes hashing passwords (ONBOARDING_WORKERS).')
+@click.option('--chunk-size', type=int, help='Users per INSERT (ONBOARDING_CHUNK_SIZE).')
+@click.option('--report', type=click.File('w'), help='Write the rejected rows and reasons to this CSV file.')
+@click.option('--dry-run', is_flag=True, help='Only check the rows; create nobody.')
+def import_users_command(path, file_format, workers, chunk_size, report, dry_run):
+    """Create users in bulk from a CSV file (username, email, password, phone) or JSON lines"""
+    if file_format is None:
+        file_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        try:
+            result = import_users(get_repository(), read_users(stream, file_format),
+                                  workers or app.config['ONBOARDING_WORKERS'],
+                                  chunk_size or app.config['ONBOARDING_CHUNK_SIZE'], dry_run=dry_run)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+    if report:
+        result.write_csv(report)
+    
+    seconds = sum(result.seconds.values())
+    click.echo(f'{result.read} rows read, {len(result.rejected)} rejected, '
+               + (f'{result.read - len(result.rejected)} would be created.' if dry_run else
+                  f'{result.created} users created in {seconds:.1f}s.'))
+    for reason, count in result.reasons().most_common():
+        click.echo(f'  {count} x {reason}')
+
+def tariff_with(tariff, rates=None, daily_cap=None, grace_minutes=None):
+    """``tariff`` with the given parts replaced"""
+    return Tariff(tariff.price_per_hour,
+                  rates.split(',') if rates else tariff.hourly_rates,
+                  daily_cap if daily_cap is not None else tariff.daily_cap,
+                  grace_minutes if grace_minutes is not None else tariff.grace_minutes)
+
+@app.cli.command('tariff')
+@click.argument('lot_id', type=int)
+@click.option('--rates', help='Prices of the 1st, 2nd, ... hour of each day, e.g. 5,5,3; the last repeats.')
+@click.option('--daily-cap', type=float, help='Most charged per 24 hours.')
+@click.option('--grace', 'grace_minutes', type=int, help='Stays up to this many minutes are free.')
+@click.option('--clear', is_flag=True, help="Go back to the lot's flat price per hour.")
+def tariff_command(lot_id, rates, daily_cap, grace_minutes, clear):
+    """Show or change the tariff a parking lot charges"""
+    tariffs = get_repository().lot_tariffs([lot_id])
+    if lot_id not in tariffs.tariffs:
+        raise click.ClickException(f'Parking lot {lot_id} not found.')
+    if clear:
+        get_repository().set_lot_tariff(lot_id, None)
+    elif rates or daily_cap is not None or grace_minutes is not None:
+        get_repository().set_lot_tariff(lot_id, tariff_with(tariffs[lot_id], rates, daily_cap, grace_minutes))
+    
+    tariff = get_repository().lot_tariffs([lot_id])[lot_id]
+    click.echo(f"lot {lot_id}: hourly rates {tariff.rates_text()}, daily cap {tariff.daily_cap or 'none'}, "
+               f"grace {tariff.grace_minutes} minutes")
+
+@app.cli.command('lot-coordinates')
+@click.argument('lot_id', type=int)
+@click.option('--lat', 'latitude', type=float, help='Latitude in degrees, e.g. 40.7128.')
+@click.option('--lon', 'longitude', type=float, help='Longitude in degrees, e.g. -74.006.')
+@click.option('--clear', is_flag=True, help='Take the lot off the map.')
+def lot_coordinates_command(lot_id, latitude, longitude, clear):
+    """Set where a parking lot is, for the nearest lot search"""
+    if clear:
+        latitude = longitude = None
+    else:
+        try:
+            latitude, longitude = parse_coordinates(latitude, longitude)
+        except (TypeError, ValueError):
+            raise click.UsageError('Give --lat and --lon in degrees, or --clear.')
+    if not get_repository().set_lot_coordinates(lot_id, latitude, longitude):
+        raise click.ClickException(f'Parking lot {lot_id} not found.')
+    # Other processes pick the change up within NEARBY_LOTS_REFRESH_INTERVAL
+    nearby_lots.invalidate()
+    click.echo(f'lot {lot_id}: ' + (f'at {latitude}, {longitude}' if latitude is not None else 'not on the map'))
+
+@app.cli.command('rerate')
+@click.option('--lot', 'lot_id', type=int, help='Only re-rate this parking lot.')
+@click.option('--from', 'start_date', type=click.DateTime(['%Y-%m-%d']), help='First day of bookings ending.')
+@click.option('--to', 'end_date', type=click.DateTime(['%Y-%m-%d']), help='Last day of bookings ending.')
+@click.option('--rates', help='What-if hourly rates for every lot re-rated, e.g. 5,5,3.')
+@click.option('--daily-cap', type=float, help='What-if daily cap.')
+@click.option('--grace', 'grace_minutes', type=int, help='What-if grace period in minutes.')
+def rerate_command(lot_id, start_date, end_date, rates, daily_cap, grace_minutes):
+    """Price finished bookings again under the current or a what-if tariff and compare
+    with what they were charged; nothing is written"""
+    tariffs = get_repository().lot_tariffs([lot_id] if lot_id else None)
+    if rates or daily_cap is not None or grace_minutes is not None:
+        tariffs = TariffTable({tariff_lot_id: tariff_with(tariff, rates, daily_cap, grace_minutes)
+                               for tariff_lot_id, tariff in tariffs.tariffs.items()})
+    
+    totals = tariffs.rerate(get_repository().booking_stays(lot_id, start_date, end_date))
+    for row_lot_id, row in sorted(totals.items()):
+        click.echo(f"lot {row_lot_id}: {row['bookings']} bookings, charged ${row['charged']}, "
+                   f"re-rated ${row['rerated']} ({row['rerated'] - row['charged']:+})")
+    charged = sum(row['charged'] for row in totals.values())
+    rerated = sum(row['rerated'] for row in totals.values())
+    click.echo(f"{sum(row['bookings'] for row in totals.values())} bookings: charged ${charged}, "
+               f"re-rated ${rerated} ({rerated - charged:+})")
 
 def require_admin():
     """Decorator function to require admin authentication"""
@@ -92,8 +445,6 @@ def is_admin_logged_in():
 # Home route
 @app.route('/')
 def index():
-    # Check for expired bookings on each page load
-    check_expired_bookings()
     return render_template('index.html')
 
 # Admin Login
@@ -136,83 +487,7 @@ def admin_dashboard():
     if auth_check:
         return auth_check
     
-    # Check expired bookings
-    expired_count = check_expired_bookings()
-    if expired_count > 0:
-        flash(f'{expired_count} expired bookings have been processed.', 'info')
-    
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Get parking lots with slot counts (only count non-deleted slots)
-    cursor.execute('''
-        SELECT p.*, 
-               COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END) as total_slots,
-               SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as available_slots,
-               SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as occupied_slots
-        FROM parking_lots p
-        LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
-        WHERE p.deleted_at IS NULL
-        GROUP BY p.id
-        ORDER BY p.created_at DESC
-    ''')
-    parking_lots = cursor.fetchall()
-    
-    # Get dashboard statistics (only count non-deleted items)
-    cursor.execute('SELECT COUNT(*) as total_lots FROM parking_lots WHERE deleted_at IS NULL')
-    total_lots = cursor.fetchone()['total_lots']
-    
-    cursor.execute('''
-        SELECT COUNT(*) as total_slots 
-        FROM parking_slots 
-        WHERE deleted_at IS NULL
-    ''')
-    total_slots_result = cursor.fetchone()
-    total_slots = total_slots_result['total_slots'] if total_slots_result['total_slots'] else 0
-    
-    cursor.execute('''
-        SELECT COUNT(*) as available_slots 
-        FROM parking_slots 
-        WHERE status = 'vacant' AND deleted_at IS NULL
-    ''')
-    available_slots_result = cursor.fetchone()
-    available_slots = available_slots_result['available_slots'] if available_slots_result['available_slots'] else 0
-    
-    cursor.execute('SELECT COUNT(*) as active_bookings FROM bookings WHERE status = "active"')
-    active_bookings = cursor.fetchone()['active_bookings']
-    
-    # Calculate revenue from completed bookings only
-    cursor.execute('''
-        SELECT SUM(actual_cost) as total_revenue 
-        FROM bookings 
-        WHERE status = 'completed' AND actual_cost IS NOT NULL
-    ''')
-    revenue_result = cursor.fetchone()
-    total_revenue = revenue_result['total_revenue'] if revenue_result['total_revenue'] else 0
-    
-    # Monthly revenue data for chart (completed bookings only)
-    cursor.execute('''
-        SELECT 
-            DATE_FORMAT(actual_end_time, '%Y-%m') as month,
-            SUM(actual_cost) as revenue
-        FROM bookings 
-        WHERE status = 'completed' AND actual_cost IS NOT NULL
-        GROUP BY DATE_FORMAT(actual_end_time, '%Y-%m')
-        ORDER BY month DESC
-        LIMIT 6
-    ''')
-    monthly_revenue = cursor.fetchall()
-    
-    cursor.close()
-    
-    stats = {
-        'total_lots': total_lots,
-        'total_slots': total_slots,
-        'available_slots': available_slots,
-        'occupied_slots': total_slots - available_slots,
-        'active_bookings': active_bookings,
-        'total_revenue': total_revenue,
-        'monthly_revenue': monthly_revenue
-    }
+    parking_lots, stats = dashboard_stats.get()
     
     return render_template('admin/dashboard.html', parking_lots=parking_lots, stats=stats)
 
@@ -230,31 +505,67 @@ def add_parking_lot():
         total_slots = int(request.form['total_slots'])
         price_per_hour = float(request.form['price_per_hour'])
         
-        cursor = mysql.connection.cursor()
-        
-        # Create parking lot
-        cursor.execute('''
-            INSERT INTO parking_lots (name, location, price_per_hour)
-            VALUES (%s, %s, %s)
-        ''', (name, location, price_per_hour))
-        
-        lot_id = cursor.lastrowid
-        
-        # Create individual parking slots
-        for slot_number in range(1, total_slots + 1):
-            cursor.execute('''
-                INSERT INTO parking_slots (parking_lot_id, slot_number, status)
-                VALUES (%s, %s, 'vacant')
-            ''', (lot_id, slot_number))
+        # Coordinates are optional; lots without them are left out of the nearest lot search
+        latitude = request.form.get('latitude', '').strip()
+        longitude = request.form.get('longitude', '').strip()
+        if latitude or longitude:
+            try:
+                latitude, longitude = parse_coordinates(latitude, longitude)
+            except ValueError:
+                flash('Latitude must be between -90 and 90 and longitude between -180 and 180!', 'error')
+                return render_template('admin/add_parking_lot.html')
+        else:
+            latitude = longitude = None
         
-        mysql.connection.commit()
-        cursor.close()
+        # Create the parking lot and its individual slots in multi-row batches
+        lot_id = get_repository().create_lot(name, location, price_per_hour, total_slots,
+                                             app.config['SLOT_INSERT_CHUNK_SIZE'], latitude, longitude)
+        availability_cache.lot_added(lot_id, total_slots)
+        dashboard_stats.invalidate()
+        if latitude is not None:
+            nearby_lots.invalidate()
         
         flash(f'Parking lot "{name}" with {total_slots} slots added successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('admin/add_parking_lot.html')
 
+# Admin: Add Slots to an Existing Parking Lot
+@app.route('/admin/add-slots/<int:lot_id>', methods=['POST'])
+def add_parking_slots(lot_id):
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    count = request.form.get('count', type=int) or 0
+    if count < 1 or count > app.config['MAX_SLOTS_PER_REQUEST']:
+        flash(f'Number of slots must be between 1 and {app.config["MAX_SLOTS_PER_REQUEST"]}!', 'error')
+        return redirect(url_for('admin_parking_slots', lot_id=lot_id))
+    
+    added = get_repository().add_slots(lot_id, count, app.config['SLOT_INSERT_CHUNK_SIZE'])
+    if not added:
+        flash('Parking lot not found!', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    first, last = added
+    availability_cache.slots_added(lot_id, count)
+    dashboard_stats.invalidate()
+    
+    flash(f'Added slots #{first} to #{last} successfully!', 'success')
+    return redirect(url_for('admin_parking_slots', lot_id=lot_id))
+
+def booking_filters(values):
+    """The admin booking filters from query or form ``values``"""
+    return {
+        'status': values.get('status', ''),
+        'lot_id': values.get('lot_id', type=int),
+        'user': values.get('user', '').strip(),
+        'vehicle_number': values.get('vehicle_number', '').strip(),
+        'date_from': values.get('date_from', ''),
+        'date_to': values.get('date_to', '')
+    }
+
 # Admin: View All Bookings
 @app.route('/admin/bookings')
 def admin_bookings():
@@ -263,24 +574,33 @@ def admin_bookings():
     if auth_check:
         return auth_check
     
-    # Check expired bookings
-    check_expired_bookings()
-    
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute('''
-        SELECT b.*, u.username, u.email, u.phone, 
-               p.name as parking_lot_name, p.location,
-               ps.slot_number
-        FROM bookings b
-        JOIN users u ON b.user_id = u.id
-        JOIN parking_lots p ON b.parking_lot_id = p.id
-        LEFT JOIN parking_slots ps ON b.slot_id = ps.id
-        ORDER BY b.created_at DESC
-    ''')
-    bookings = cursor.fetchall()
-    cursor.close()
-    
-    return render_template('admin/bookings.html', bookings=bookings)
+    # Optional filters, all applied in SQL
+    filters = booking_filters(request.args)
+    bookings, next_cursor, prev_cursor = get_repository().search_bookings(
+        filters, after=request.args.get('after'), before=request.args.get('before'),
+        page_size=app.config['BOOKINGS_PAGE_SIZE'])
+    
+    return render_template('admin/bookings.html', bookings=bookings, filters=filters,
+                         next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+# Admin: Export Bookings Matching The Filters As CSV
+@app.route('/admin/bookings/export')
+def admin_export_bookings():
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    # Rows are streamed from an unbuffered cursor as they are encoded; the request
+    # keeps its database connection until the download ends
+    compress = request.args.get('gzip') == '1'
+    rows = get_repository().export_bookings(booking_filters(request.args))
+    filename = f'bookings-{datetime.now():%Y%m%d-%H%M%S}.csv' + ('.gz' if compress else '')
+    response = app.response_class(stream_with_context(csv_chunks(BOOKING_COLUMNS, rows, compress)),
+                                  mimetype='application/gzip' if compress else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # Admin: Cancel Any Booking
 @app.route('/admin/cancel-booking/<int:booking_id>')
@@ -290,50 +610,48 @@ def admin_cancel_booking(booking_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute('''
-        SELECT b.*, p.price_per_hour 
-        FROM bookings b
-        JOIN parking_lots p ON b.parking_lot_id = p.id
-        WHERE b.id = %s AND b.status = 'active'
-    ''', (booking_id,))
-    booking = cursor.fetchone()
+    booking = get_repository().cancel_booking(booking_id)
     
     if booking:
-        # Calculate cost for time used (if any)
-        actual_cost = 0
-        if booking['actual_start_time']:
-            duration_minutes = (datetime.now() - booking['actual_start_time']).total_seconds() / 60
-            if duration_minutes > 0:
-                duration_hours = max(1, int((duration_minutes + 59) / 60))  # Round up
-                actual_cost = booking['price_per_hour'] * duration_hours
-        
-        # Cancel booking
-        cursor.execute('''
-            UPDATE bookings 
-            SET status = 'cancelled', 
-                actual_end_time = NOW(),
-                actual_cost = %s,
-                updated_at = NOW()
-            WHERE id = %s
-        ''', (actual_cost, booking_id))
-        
-        # Free up the parking slot
-        if booking['slot_id']:
-            cursor.execute('''
-                UPDATE parking_slots 
-                SET status = 'vacant', booking_id = NULL 
-                WHERE id = %s
-            ''', (booking['slot_id'],))
-        
-        mysql.connection.commit()
+        if booking['slot_freed']:
+            availability_cache.slot_freed(booking['parking_lot_id'])
+        dashboard_stats.invalidate()
         flash('Booking cancelled successfully!', 'success')
     else:
         flash('Booking not found or already cancelled!', 'error')
     
-    cursor.close()
     return redirect(url_for('admin_bookings'))
 
+# Admin: Cancel All Active Bookings Matching The Filters
+@app.route('/admin/cancel-bookings', methods=['POST'])
+def admin_cancel_bookings():
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    filters = booking_filters(request.form)
+    try:
+        cancelled = get_repository().cancel_bookings(filters)
+    except ValueError:
+        flash('Filter by lot, user, vehicle or date before cancelling bookings in bulk!', 'error')
+        return redirect(url_for('admin_bookings'))
+    
+    for booking in cancelled:
+        if booking['slot_freed']:
+            availability_cache.slot_freed(booking['parking_lot_id'])
+    dashboard_stats.invalidate()
+    
+    if cancelled:
+        freed = sum(1 for booking in cancelled if booking['slot_freed'])
+        charged = sum(booking['actual_cost'] or 0 for booking in cancelled)
+        flash(f'Cancelled {len(cancelled)} bookings ({format_ranges(booking["booking_id"] for booking in cancelled)}): '
+              f'{freed} slots freed, ${charged:.2f} charged for time used.', 'success')
+    else:
+        flash('No active bookings match these filters!', 'info')
+    
+    return redirect(url_for('admin_bookings', **{key: value for key, value in filters.items() if value}))
+
 # Admin: Soft Delete Parking Lot
 @app.route('/admin/delete-parking-lot/<int:lot_id>')
 def delete_parking_lot(lot_id):
@@ -342,37 +660,15 @@ def delete_parking_lot(lot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Check if there are active bookings
-    cursor.execute('''
-        SELECT COUNT(*) as count 
-        FROM bookings b
-        JOIN parking_slots ps ON b.slot_id = ps.id
-        WHERE ps.parking_lot_id = %s AND b.status = 'active'
-    ''', (lot_id,))
-    active_bookings = cursor.fetchone()
-    
-    if active_bookings['count'] > 0:
-        flash('Cannot delete parking lot with active bookings!', 'error')
+    # Lots with active bookings or upcoming reservations are left alone
+    if not get_repository().delete_lot(lot_id):
+        flash('Cannot delete parking lot with active bookings or reservations!', 'error')
     else:
-        # Soft delete the parking lot and all its slots
-        cursor.execute('''
-            UPDATE parking_lots 
-            SET deleted_at = NOW() 
-            WHERE id = %s
-        ''', (lot_id,))
-        
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET deleted_at = NOW(), status = 'deleted'
-            WHERE parking_lot_id = %s AND deleted_at IS NULL
-        ''', (lot_id,))
-        
-        mysql.connection.commit()
+        availability_cache.invalidate(lot_id)
+        dashboard_stats.invalidate()
+        nearby_lots.invalidate()
         flash('Parking lot and all its slots deleted successfully!', 'success')
     
-    cursor.close()
     return redirect(url_for('admin_dashboard'))
 
 # Admin: Restore Parking Lot
@@ -383,38 +679,51 @@ def restore_parking_lot(lot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Check if parking lot is deleted
-    cursor.execute('''
-        SELECT * FROM parking_lots 
-        WHERE id = %s AND deleted_at IS NOT NULL
-    ''', (lot_id,))
-    parking_lot = cursor.fetchone()
+    # Restore the parking lot and all slots that were deleted with it
+    parking_lot = get_repository().restore_lot(lot_id)
     
     if parking_lot:
-        # Restore the parking lot
-        cursor.execute('''
-            UPDATE parking_lots 
-            SET deleted_at = NULL 
-            WHERE id = %s
-        ''', (lot_id,))
-        
-        # Restore all slots that were deleted with this lot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET deleted_at = NULL, status = 'vacant'
-            WHERE parking_lot_id = %s AND status = 'deleted'
-        ''', (lot_id,))
-        
-        mysql.connection.commit()
+        availability_cache.invalidate(lot_id)
+        dashboard_stats.invalidate()
+        nearby_lots.invalidate()
         flash(f'Parking lot "{parking_lot["name"]}" and all its slots restored successfully!', 'success')
     else:
         flash('Parking lot not found or not deleted!', 'error')
     
-    cursor.close()
     return redirect(url_for('admin_dashboard'))
 
+# Admin: Occupancy heatmap and peaks of a lot, from the sampled history
+@app.route('/admin/occupancy/<int:lot_id>')
+def admin_lot_occupancy(lot_id):
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    parking_lot = get_repository().get_lot(lot_id)
+    if not parking_lot:
+        flash('Parking lot not found!', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    days = app.config['OCCUPANCY_HISTORY_DAYS']
+    weeks = request.args.get('weeks', app.config['OCCUPANCY_HEATMAP_WEEKS'], type=int)
+    weeks = max(1, min(weeks, days // 7 or 1))
+    now = datetime.now()
+    ring = occupancy_sampler.ring(lot_id, now - timedelta(days=days))
+    peaks = [(label, ring.peak(now - span, now)) for label, span in (
+        ('Last 24 hours', timedelta(days=1)),
+        ('Last 7 days', timedelta(days=7)),
+        (f'Last {weeks} weeks', timedelta(weeks=weeks)),
+        (f'Last {days} days', timedelta(days=days)))]
+    
+    return render_template('admin/occupancy.html',
+                         parking_lot=parking_lot,
+                         heatmap=zip(DAY_NAMES, ring.heatmap(now - timedelta(weeks=weeks), now)),
+                         peaks=peaks,
+                         weeks=weeks,
+                         interval_minutes=app.config['OCCUPANCY_SAMPLE_INTERVAL'] / 60,
+                         last_sample=occupancy_sampler.last_sample)
+
 # Admin: View Deleted Parking Lots
 @app.route('/admin/deleted-lots')
 def admin_deleted_lots():
@@ -423,25 +732,57 @@ def admin_deleted_lots():
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
     # Get deleted parking lots with slot counts
-    cursor.execute('''
-        SELECT p.*, 
-               COUNT(ps.id) as total_slots,
-               p.deleted_at as deletion_date
-        FROM parking_lots p
-        LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
-        WHERE p.deleted_at IS NOT NULL
-        GROUP BY p.id
-        ORDER BY p.deleted_at DESC
-    ''')
-    deleted_lots = cursor.fetchall()
-    
-    cursor.close()
+    deleted_lots = get_repository().deleted_lots()
     
     return render_template('admin/deleted_lots.html', deleted_lots=deleted_lots)
 
+# Admin: Availability cache, slot map, slot schedule and lot index statistics
+@app.route('/admin/cache-stats')
+def admin_cache_stats():
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    return jsonify(dict(availability_cache.stats(), slot_maps=slot_maps.stats(),
+                        slot_schedules=slot_schedules.stats(), nearby_lots=nearby_lots.stats()))
+
+# Admin: Database connection pool statistics
+@app.route('/admin/pool-stats')
+def admin_pool_stats():
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    return jsonify(get_pool().stats())
+
+# Request and query latency histograms for Prometheus
+@app.route('/metrics')
+def prometheus_metrics():
+    metrics = app.extensions.get('metrics')
+    if metrics is None:
+        return 'Metrics are disabled.', 404
+    # Local scrapers need no login; everyone else must be the admin
+    local = request.remote_addr in ('127.0.0.1', '::1')
+    if not (local and app.config['METRICS_ALLOW_LOCALHOST']):
+        auth_check = require_admin()
+        if auth_check:
+            return auth_check
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Admin: Live slot update stream statistics
+@app.route('/admin/live-stats')
+def admin_live_stats():
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    return jsonify(live_updates.stats())
+
 # Admin: View Parking Slots Details
 @app.route('/admin/parking-slots/<int:lot_id>')
 def admin_parking_slots(lot_id):
@@ -450,36 +791,34 @@ def admin_parking_slots(lot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
     # Get parking lot details
-    cursor.execute('''
-        SELECT * FROM parking_lots 
-        WHERE id = %s AND deleted_at IS NULL
-    ''', (lot_id,))
-    parking_lot = cursor.fetchone()
+    parking_lot = get_repository().get_lot(lot_id)
     
     if not parking_lot:
         flash('Parking lot not found!', 'error')
         return redirect(url_for('admin_dashboard'))
     
-    # Get all slots for this parking lot (including deleted ones for admin view)
-    cursor.execute('''
-        SELECT ps.*, b.id as booking_id, b.vehicle_number, b.vehicle_type,
-               b.start_time, b.end_time, u.username, u.email, u.phone
-        FROM parking_slots ps
-        LEFT JOIN bookings b ON ps.booking_id = b.id AND b.status = 'active'
-        LEFT JOIN users u ON b.user_id = u.id
-        WHERE ps.parking_lot_id = %s
-        ORDER BY ps.slot_number
-    ''', (lot_id,))
-    parking_slots = cursor.fetchall()
-    
-    cursor.close()
+    # The grid shows one page of slot numbers (deleted slots included) from the lot's
+    # occupancy map; booking details are only read for the slots on that page
+    live_updates.start()
+    live_position = live_updates.position()
+    slot_map = slot_maps.get(get_repository(), lot_id) or SlotMap(lot_id, None, ())
+    page_size = app.config['ADMIN_SLOTS_PAGE_SIZE']
+    first = max(request.args.get('first', 1, type=int), 1)
+    first -= (first - 1) % page_size
+    last = first + page_size - 1
+    bookings = get_repository().slot_bookings(lot_id, first, last)
+    parking_slots = [dict(bookings.get(slot_number, {}), id=slot_id, slot_number=slot_number, status=status)
+                     for slot_number, slot_id, status in slot_map.slots(first=first, last=last)]
     
     return render_template('admin/parking_slots.html', 
                          parking_lot=parking_lot, 
-                         parking_slots=parking_slots)
+                         parking_slots=parking_slots,
+                         slot_counts=slot_map.summary(),
+                         slot_pages=slot_map.ranges(page_size),
+                         page_first=first,
+                         slot_codes=slot_map.codes(),
+                         live_position=live_position)
 
 # Admin: Delete Individual Slot
 @app.route('/admin/delete-slot/<int:slot_id>')
@@ -489,30 +828,20 @@ def delete_parking_slot(slot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
     # Check if slot has active booking
-    cursor.execute('''
-        SELECT ps.*, b.status
-        FROM parking_slots ps
-        LEFT JOIN bookings b ON ps.booking_id = b.id
-        WHERE ps.id = %s
-    ''', (slot_id,))
-    slot = cursor.fetchone()
-    
-    if slot and slot['status'] == 'active':
+    slot = get_repository().get_slot(slot_id)
+    
+    if not slot:
+        flash('Slot not found!', 'error')
+    elif slot['booking_status'] == 'active':
         flash('Cannot delete slot with active booking!', 'error')
     else:
         # Soft delete the slot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET deleted_at = NOW(), status = 'deleted'
-            WHERE id = %s
-        ''', (slot_id,))
-        mysql.connection.commit()
+        if get_repository().delete_slot(slot):
+            availability_cache.slot_deleted(slot['parking_lot_id'], slot['status'])
+            dashboard_stats.invalidate()
         flash(f'Parking slot #{slot["slot_number"]} deleted successfully!', 'success')
     
-    cursor.close()
     return redirect(request.referrer or url_for('admin_dashboard'))
 
 # Admin: Restore Individual Slot
@@ -523,30 +852,63 @@ def restore_parking_slot(slot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Check if slot is deleted
-    cursor.execute('''
-        SELECT * FROM parking_slots 
-        WHERE id = %s AND deleted_at IS NOT NULL
-    ''', (slot_id,))
-    slot = cursor.fetchone()
+    # Restore the slot if it is deleted
+    slot = get_repository().restore_slot(slot_id)
     
     if slot:
-        # Restore the slot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET deleted_at = NULL, status = 'vacant', booking_id = NULL
-            WHERE id = %s
-        ''', (slot_id,))
-        mysql.connection.commit()
+        availability_cache.slot_restored(slot['parking_lot_id'])
+        dashboard_stats.invalidate()
         flash(f'Parking slot #{slot["slot_number"]} restored successfully!', 'success')
     else:
         flash('Slot not found or not deleted!', 'error')
     
-    cursor.close()
     return redirect(request.referrer or url_for('admin_dashboard'))
 
+# Admin: Delete Or Restore Many Slots
+@app.route('/admin/parking-slots/<int:lot_id>/bulk', methods=['POST'])
+def bulk_parking_slots(lot_id):
+    # Check admin authentication
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+    
+    action = request.form.get('action')
+    slot_ids = request.form.getlist('slot_id', type=int)
+    try:
+        ranges = parse_slot_ranges(request.form.get('slots', ''))
+    except ValueError:
+        ranges = None
+    back = request.referrer or url_for('admin_parking_slots', lot_id=lot_id)
+    
+    if action not in ('delete', 'restore') or ranges is None or not (ranges or slot_ids):
+        flash('Enter slot numbers such as 1-300, 412!', 'error')
+        return redirect(back)
+    if sum(last - first + 1 for first, last in ranges) + len(slot_ids) > app.config['MAX_BULK_SLOTS']:
+        flash(f'At most {app.config["MAX_BULK_SLOTS"]} slots can be changed at once!', 'error')
+        return redirect(back)
+    
+    # One transaction; slots with active bookings are never deleted
+    if action == 'delete':
+        results = get_repository().delete_slots(lot_id, ranges, slot_ids)
+    else:
+        results = get_repository().restore_slots(lot_id, ranges, slot_ids)
+    availability_cache.invalidate(lot_id)
+    dashboard_stats.invalidate()
+    
+    # Summarize the outcome per slot, grouped by result
+    outcomes = {}
+    for item in results:
+        outcomes.setdefault(item['result'], []).append(item['slot_number'])
+    if not outcomes:
+        flash('No slots match that selection!', 'error')
+    else:
+        changed = 'deleted' in outcomes or 'restored' in outcomes
+        summary = '; '.join(f'{result.capitalize()}: {format_ranges(numbers)}'
+                            for result, numbers in outcomes.items())
+        flash(summary, 'success' if changed else 'info')
+    
+    return redirect(back)
+
 # User Registration
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -566,32 +928,21 @@ def register():
         password = request.form['password']
         phone = request.form['phone']
         
-        # Validation
-        if not re.match(r'[^@]+@[^@]+\.[^@]+', email):
-            flash('Invalid email address!', 'error')
-            return render_template('register.html')
-        
-        if len(password) < 6:
-            flash('Password must be at least 6 characters long!', 'error')
+        # Validation, shared with `flask import-users`
+        error = registration_error(username, email, password, phone)
+        if error:
+            flash(error + '!', 'error')
             return render_template('register.html')
         
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute('SELECT * FROM users WHERE username = %s OR email = %s', (username, email))
-        account = cursor.fetchone()
+        account = get_repository().find_account(username, email)
         
         if account:
             flash('Account already exists!', 'error')
         else:
             hashed_password = generate_password_hash(password)
-            cursor.execute('''
-                INSERT INTO users (username, email, password, phone)
-                VALUES (%s, %s, %s, %s)
-            ''', (username, email, hashed_password, phone))
-            mysql.connection.commit()
+            get_repository().create_user(username, email, hashed_password, phone)
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
-        
-        cursor.close()
     
     return render_template('register.html')
 
@@ -612,10 +963,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
-        account = cursor.fetchone()
-        cursor.close()
+        account = get_repository().find_user(username)
         
         if account and check_password_hash(account['password'], password):
             # Clear any existing session data
@@ -627,11 +975,6 @@ def login():
             session['username'] = account['username']
             session['user_type'] = 'user'
             
-            # Check for expired bookings and notify user
-            expired_count = check_expired_bookings()
-            if expired_count > 0:
-                flash(f'You have {expired_count} booking(s) that have ended. Please check your booking history.', 'info')
-            
             flash('Login successful!', 'success')
             return redirect(url_for('user_dashboard'))
         else:
@@ -647,25 +990,20 @@ def user_dashboard():
     if auth_check:
         return auth_check
     
-    # Check expired bookings
-    check_expired_bookings()
-    
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute('''
-        SELECT p.*, 
-               COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END) as total_slots,
-               SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as available_slots
-        FROM parking_lots p
-        LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
-        WHERE p.deleted_at IS NULL
-        GROUP BY p.id
-        HAVING available_slots > 0
-        ORDER BY p.name
-    ''')
-    parking_lots = cursor.fetchall()
-    cursor.close()
-    
-    return render_template('user/dashboard.html', parking_lots=parking_lots)
+    # With a position, the nearest lots that have room; otherwise every lot with room by name
+    near = None
+    if request.args.get('lat') or request.args.get('lon'):
+        try:
+            near = parse_coordinates(request.args.get('lat'), request.args.get('lon'))
+        except (TypeError, ValueError):
+            flash('Invalid location!', 'error')
+    min_vacant = max(request.args.get('min_vacant', type=int) or 1, 1)
+    if near:
+        parking_lots = nearest_lots(*near, min_vacant=min_vacant)
+    else:
+        parking_lots = lots_with_availability('name', vacant_only=True)
+    
+    return render_template('user/dashboard.html', parking_lots=parking_lots, near=near, min_vacant=min_vacant)
 
 # Book Parking Slot
 @app.route('/book-slot/<int:lot_id>', methods=['GET', 'POST'])
@@ -675,79 +1013,114 @@ def book_slot(lot_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    
     # Get parking lot details
-    cursor.execute('''
-        SELECT * FROM parking_lots 
-        WHERE id = %s AND deleted_at IS NULL
-    ''', (lot_id,))
-    parking_lot = cursor.fetchone()
+    parking_lot = get_repository().get_lot(lot_id)
     
     if not parking_lot:
         flash('Parking lot not found!', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Get available slots (only non-deleted)
-    cursor.execute('''
-        SELECT * FROM parking_slots 
-        WHERE parking_lot_id = %s AND status = 'vacant' AND deleted_at IS NULL
-        ORDER BY slot_number
-    ''', (lot_id,))
-    available_slots = cursor.fetchall()
-    
     if request.method == 'POST':
         vehicle_number = request.form['vehicle_number']
         vehicle_type = request.form['vehicle_type']
         hours = int(request.form['hours'])
-        slot_id = int(request.form['slot_id'])
+        # 'any' (or no selection) lets the allocator pick the first free slot
+        slot_id = request.form.get('slot_id', 'any')
+        slot_id = None if slot_id in ('', 'any') else int(slot_id)
         
-        if not available_slots:
-            flash('No available slots!', 'error')
-            return redirect(url_for('user_dashboard'))
+        # Claim the slot atomically; concurrent requests can never get the same slot
+        booking = get_repository().create_booking(session['user_id'], lot_id,
+                                                  vehicle_number, vehicle_type, hours, slot_id)
         
-        # Verify slot is still available
-        cursor.execute('''
-            SELECT * FROM parking_slots 
-            WHERE id = %s AND status = 'vacant' AND deleted_at IS NULL
-        ''', (slot_id,))
-        selected_slot = cursor.fetchone()
-        
-        if not selected_slot:
-            flash('Selected slot is no longer available!', 'error')
+        if not booking:
+            if slot_id is None:
+                flash('No available slots!', 'error')
+                return redirect(url_for('user_dashboard'))
+            slot_map = slot_maps.get(get_repository(), lot_id) or SlotMap(lot_id, None, ())
+            nearest = slot_map.nearest_free(slot_map.slot_number(slot_id) or 1)
+            if nearest:
+                flash(f'Selected slot is no longer available! The nearest free slot is #{nearest}.', 'error')
+            else:
+                flash('Selected slot is no longer available!', 'error')
             return redirect(url_for('book_slot', lot_id=lot_id))
         
-        estimated_cost = parking_lot['price_per_hour'] * hours
-        start_time = datetime.now()
-        end_time = start_time + timedelta(hours=hours)
-        
-        # Create booking (no actual cost yet)
-        cursor.execute('''
-            INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type, 
-                                start_time, end_time, estimated_cost, status, actual_start_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'active', %s)
-        ''', (session['user_id'], lot_id, slot_id, vehicle_number, vehicle_type, 
-              start_time, end_time, estimated_cost, start_time))
-        
-        booking_id = cursor.lastrowid
+        # Let the expiry worker and availability counts know about the booking
+        expiry_scheduler.schedule(booking['booking_id'], booking['end_time'])
+        availability_cache.slot_booked(lot_id)
+        dashboard_stats.invalidate()
         
-        # Update slot status
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET status = 'booked', booking_id = %s 
-            WHERE id = %s
-        ''', (booking_id, slot_id))
-        
-        mysql.connection.commit()
-        cursor.close()
-        
-        flash(f'Parking slot #{selected_slot["slot_number"]} booked successfully!', 'success')
+        flash(f'Parking slot #{booking["slot_number"]} booked successfully!', 'success')
         return redirect(url_for('my_bookings'))
     
-    cursor.close()
+    # Vacant slots come from the lot's occupancy map; the page then follows changes live
+    live_updates.start()
+    live_position = live_updates.position()
+    slot_map = slot_maps.get(get_repository(), lot_id) or SlotMap(lot_id, None, ())
+    available_slots = [{'id': slot_id, 'slot_number': slot_number}
+                       for slot_number, slot_id, status in slot_map.slots('vacant')]
+    
+    # Estimated cost of booking 1 to 24 hours under the lot's tariff
+    now = datetime.now()
+    estimates = get_repository().lot_tariffs([lot_id]).price(
+        [lot_id] * 24, [now] * 24, [now + timedelta(hours=hours) for hours in range(1, 25)])
+    
+    # Window a reservation may start in
+    reserve_until = now + timedelta(days=app.config['RESERVATION_MAX_DAYS_AHEAD'])
+    
     return render_template('user/book_slot.html', 
                          parking_lot=parking_lot, 
-                         available_slots=available_slots)
+                         available_slots=available_slots,
+                         estimates=[float(estimate) for estimate in estimates],
+                         live_position=live_position,
+                         reserve_from=now.strftime('%Y-%m-%dT%H:%M'),
+                         reserve_until=reserve_until.strftime('%Y-%m-%dT%H:%M'),
+                         max_reservation_hours=app.config['RESERVATION_MAX_HOURS'])
+
+# Reserve Parking Slot in advance
+@app.route('/reserve-slot/<int:lot_id>', methods=['POST'])
+def reserve_slot(lot_id):
+    # Check user authentication
+    auth_check = require_user()
+    if auth_check:
+        return auth_check
+    
+    if not get_repository().get_lot(lot_id):
+        flash('Parking lot not found!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    try:
+        start_time = datetime.strptime(request.form['start_time'], '%Y-%m-%dT%H:%M')
+        hours = int(request.form['hours'])
+    except (KeyError, ValueError):
+        flash('Please enter a valid start time and duration!', 'error')
+        return redirect(url_for('book_slot', lot_id=lot_id))
+    
+    now = datetime.now().replace(second=0, microsecond=0)
+    if not now <= start_time <= now + timedelta(days=app.config['RESERVATION_MAX_DAYS_AHEAD']):
+        flash(f'Reservations can start from now up to {app.config["RESERVATION_MAX_DAYS_AHEAD"]} days ahead!', 'error')
+        return redirect(url_for('book_slot', lot_id=lot_id))
+    if not 1 <= hours <= app.config['RESERVATION_MAX_HOURS']:
+        flash(f'Reservations can last 1 to {app.config["RESERVATION_MAX_HOURS"]} hours!', 'error')
+        return redirect(url_for('book_slot', lot_id=lot_id))
+    end_time = start_time + timedelta(hours=hours)
+    
+    # Candidate slots come from the lot's in-memory schedule; the repository checks each
+    # one again under its row lock, so a stale schedule only costs a retry
+    schedule = slot_schedules.get(get_repository(), lot_id)
+    candidates = ([slot_id for _, slot_id in schedule.free_slots(start_time, end_time, limit=20)]
+                  if schedule is not None else [])
+    reservation = get_repository().create_reservation(session['user_id'], lot_id,
+                                                      request.form['vehicle_number'], request.form['vehicle_type'],
+                                                      start_time, end_time, candidates)
+    
+    if not reservation:
+        flash('No slot is free for that time, please try another one!', 'error')
+        return redirect(url_for('book_slot', lot_id=lot_id))
+    
+    slot_schedules.reserved(reservation)
+    flash(f'Parking slot #{reservation["slot_number"]} reserved from {start_time:%Y-%m-%d %H:%M} '
+          f'to {end_time:%Y-%m-%d %H:%M}!', 'success')
+    return redirect(url_for('my_bookings'))
 
 # My Bookings
 @app.route('/my-bookings')
@@ -757,23 +1130,26 @@ def my_bookings():
     if auth_check:
         return auth_check
     
-    # Check expired bookings
-    check_expired_bookings()
+    user_id = session['user_id']
+    after = request.args.get('after')
+    before = request.args.get('before')
+    
+    # Upcoming reservations and active bookings come first, on the first page only
+    reservations = []
+    active_bookings = []
+    if not after and not before:
+        reservations = get_repository().user_reservations(user_id)
+        active_bookings = get_repository().user_active_bookings(user_id)
+    
+    # Then one page of finished bookings, newest first
+    history, next_cursor, prev_cursor = get_repository().user_booking_history(
+        user_id, after=after, before=before, page_size=app.config['BOOKINGS_PAGE_SIZE'])
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute('''
-        SELECT b.*, p.name as parking_lot_name, p.location,
-               ps.slot_number
-        FROM bookings b
-        JOIN parking_lots p ON b.parking_lot_id = p.id
-        LEFT JOIN parking_slots ps ON b.slot_id = ps.id
-        WHERE b.user_id = %s
-        ORDER BY b.created_at DESC
-    ''', (session['user_id'],))
-    bookings = cursor.fetchall()
-    cursor.close()
+    bookings = active_bookings + history
     
-    return render_template('user/my_bookings.html', bookings=bookings)
+    return render_template('user/my_bookings.html', bookings=bookings, reservations=reservations,
+                         check_in_from=datetime.now() + timedelta(minutes=app.config['RESERVATION_CHECK_IN_MINUTES']),
+                         next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 # Cancel Booking
 @app.route('/cancel-booking/<int:booking_id>')
@@ -783,50 +1159,156 @@ def cancel_booking(booking_id):
     if auth_check:
         return auth_check
     
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute('''
-        SELECT b.*, p.price_per_hour 
-        FROM bookings b
-        JOIN parking_lots p ON b.parking_lot_id = p.id
-        WHERE b.id = %s AND b.user_id = %s AND b.status = 'active'
-    ''', (booking_id, session['user_id']))
-    booking = cursor.fetchone()
+    booking = get_repository().cancel_booking(booking_id, user_id=session['user_id'])
     
     if booking:
-        # Calculate cost for time used (if any)
-        actual_cost = 0
-        if booking['actual_start_time']:
-            duration_minutes = (datetime.now() - booking['actual_start_time']).total_seconds() / 60
-            if duration_minutes > 0:
-                duration_hours = max(1, int((duration_minutes + 59) / 60))  # Round up
-                actual_cost = booking['price_per_hour'] * duration_hours
-        
-        # Cancel booking
-        cursor.execute('''
-            UPDATE bookings 
-            SET status = 'cancelled', 
-                actual_end_time = NOW(),
-                actual_cost = %s,
-                updated_at = NOW()
-            WHERE id = %s
-        ''', (actual_cost, booking_id))
-        
-        # Free up the parking slot
-        if booking['slot_id']:
-            cursor.execute('''
-                UPDATE parking_slots 
-                SET status = 'vacant', booking_id = NULL 
-                WHERE id = %s
-            ''', (booking['slot_id'],))
-        
-        mysql.connection.commit()
+        if booking['slot_freed']:
+            availability_cache.slot_freed(booking['parking_lot_id'])
+        dashboard_stats.invalidate()
         flash('Booking cancelled successfully!', 'success')
     else:
         flash('Booking not found or already cancelled!', 'error')
     
-    cursor.close()
     return redirect(url_for('my_bookings'))
 
+# Check In a Reservation: it becomes an active booking until its end time
+@app.route('/check-in/<int:reservation_id>')
+def check_in_reservation(reservation_id):
+    # Check user authentication
+    auth_check = require_user()
+    if auth_check:
+        return auth_check
+    
+    early = timedelta(minutes=app.config['RESERVATION_CHECK_IN_MINUTES'])
+    reservation = get_repository().get_reservation(reservation_id, user_id=session['user_id'])
+    if not reservation or reservation['status'] != 'reserved' or reservation['end_time'] <= datetime.now():
+        flash('Reservation not found or no longer open!', 'error')
+        return redirect(url_for('my_bookings'))
+    if datetime.now() < reservation['start_time'] - early:
+        flash(f'Check-in opens at {reservation["start_time"] - early:%Y-%m-%d %H:%M}!', 'error')
+        return redirect(url_for('my_bookings'))
+    
+    booking = get_repository().check_in_reservation(reservation_id, user_id=session['user_id'], early=early)
+    
+    if not booking:
+        flash('No slot is free right now, please try again in a moment!', 'error')
+        return redirect(url_for('my_bookings'))
+    
+    expiry_scheduler.schedule(booking['booking_id'], booking['end_time'])
+    availability_cache.slot_booked(reservation['parking_lot_id'])
+    dashboard_stats.invalidate()
+    slot_schedules.released(booking['reservation'])
+    
+    flash(f'Checked in: parking slot #{booking["slot_number"]} is yours until '
+          f'{booking["end_time"]:%Y-%m-%d %H:%M}!', 'success')
+    return redirect(url_for('my_bookings'))
+
+# Cancel Reservation (free of charge)
+@app.route('/cancel-reservation/<int:reservation_id>')
+def cancel_reservation(reservation_id):
+    # Check user authentication
+    auth_check = require_user()
+    if auth_check:
+        return auth_check
+    
+    reservation = get_repository().cancel_reservation(reservation_id, user_id=session['user_id'])
+    
+    if reservation:
+        slot_schedules.released(reservation)
+        flash('Reservation cancelled successfully!', 'success')
+    else:
+        flash('Reservation not found or no longer open!', 'error')
+    
+    return redirect(url_for('my_bookings'))
+
+# Availability API for entrance kiosks and the mobile app: read-only JSON, no login.
+# Every response carries an ETag made from the lot change counters in lot_occupancy,
+# so a poll whose If-None-Match still matches costs one summary-table lookup and gets
+# an empty 304. The version is read before the data, which is therefore never older
+# than the ETag it is sent with.
+def lot_json(lot):
+    return {
+        'id': lot['id'],
+        'name': lot['name'],
+        'location': lot['location'],
+        'latitude': float(lot['latitude']) if lot.get('latitude') is not None else None,
+        'longitude': float(lot['longitude']) if lot.get('longitude') is not None else None,
+        'price_per_hour': float(lot['price_per_hour'])
+    }
+
+def versioned_json(etag, build):
+    """304 when the client already holds ``etag``, else the JSON of ``build()`` (404 when
+    that returns None)"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        payload = build()
+        if payload is None:
+            return jsonify({'error': 'Parking lot not found'}), 404
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/lots')
+def api_lots():
+    etag = 'lots-' + get_repository().lots_version()
+    
+    def build():
+        return {'lots': [dict(lot_json(lot), total_slots=int(lot['total_slots']),
+                              available_slots=int(lot['available_slots']))
+                         for lot in get_repository().lot_stats('name')]}
+    
+    return versioned_json(etag, build)
+
+@app.route('/api/lots/nearest')
+def api_nearest_lots():
+    # Vacancy is read live for every search, so these responses carry no ETag
+    try:
+        latitude, longitude = parse_coordinates(request.args.get('lat'), request.args.get('lon'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'lat and lon must be given in degrees'}), 400
+    lots = nearest_lots(latitude, longitude, request.args.get('count', type=int),
+                        max(request.args.get('min_vacant', 1, type=int), 1),
+                        request.args.get('max_km', type=float))
+    return jsonify({'lots': [dict(lot_json(lot), total_slots=int(lot['total_slots']),
+                                  available_slots=int(lot['available_slots']),
+                                  distance_km=lot['distance_km']) for lot in lots]})
+
+@app.route('/api/lots/<int:lot_id>')
+def api_lot(lot_id):
+    version = get_repository().lot_version(lot_id)
+    if version is None:
+        return jsonify({'error': 'Parking lot not found'}), 404
+    
+    def build():
+        parking_lot = get_repository().get_lot(lot_id)
+        if not parking_lot:
+            return None
+        slots = get_repository().slot_statuses(lot_id)
+        return {
+            'lot': dict(lot_json(parking_lot), total_slots=len(slots),
+                        available_slots=sum(1 for slot in slots if slot['status'] == 'vacant')),
+            'slots': slots
+        }
+    
+    return versioned_json(f'lot-{lot_id}-{version}', build)
+
+@app.route('/api/lots/<int:lot_id>/events')
+def api_lot_events(lot_id):
+    if not get_repository().get_lot(lot_id):
+        return jsonify({'error': 'Parking lot not found'}), 404
+    live_updates.start()
+    
+    # A reconnecting EventSource sends the last id it saw; pages pass the position
+    # they were rendered at. The stream holds no database connection.
+    position = request.headers.get('Last-Event-ID') or request.args.get('after')
+    response = app.response_class(live_updates.subscribe(lot_id, position, app.config['LIVE_UPDATES_HEARTBEAT']),
+                                  mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # Logout routes
 @app.route('/logout')
 def logout():
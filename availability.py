@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+class AvailabilityCache:
+    """In-memory total/vacant/booked slot counts per parking lot.
+
+    Write paths apply small deltas (``slot_booked``, ``slot_freed`` ...) after they commit,
+    so dashboards can read availability in O(lots) without aggregating ``parking_slots``.
+    Lots that are not cached yet are loaded on demand, and the whole cache is reconciled
+    against the database every ``reconcile_interval`` seconds to repair any drift (for
+    example from writes made by another process).
+    """
+
+    def __init__(self, reconcile_interval=300):
+        self.reconcile_interval = reconcile_interval
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._last_reconcile = None
+        self.hits = 0
+        self.misses = 0
+        self.reconciles = 0
+        self.repaired_lots = 0
+
+    def counts(self, repository, lot_ids):
+        """Return {lot_id: {'total', 'vacant', 'booked'}} for the given lots"""
+        if self._last_reconcile is None or time.time() - self._last_reconcile > self.reconcile_interval:
+            self.reconcile(repository)
+
+        with self._lock:
+            missing = [lot_id for lot_id in lot_ids if lot_id not in self._counts]
+            self.hits += len(lot_ids) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = repository.slot_counts(missing)
+            with self._lock:
+                for lot_id in missing:
+                    self._counts[lot_id] = loaded.get(lot_id, {'total': 0, 'vacant': 0, 'booked': 0})
+
+        with self._lock:
+            return {lot_id: dict(self._counts[lot_id]) for lot_id in lot_ids if lot_id in self._counts}
+
+    def reconcile(self, repository):
+        """Reload every lot from the database and count the lots that had drifted"""
+        loaded = repository.slot_counts()
+        with self._lock:
+            for lot_id, counts in self._counts.items():
+                if loaded.get(lot_id, {'total': 0, 'vacant': 0, 'booked': 0}) != counts:
+                    self.repaired_lots += 1
+            self._counts = loaded
+            self._last_reconcile = time.time()
+            self.reconciles += 1
+
+    def _apply(self, lot_id, total=0, vacant=0, booked=0):
+        with self._lock:
+            counts = self._counts.get(lot_id)
+            if counts is None:
+                # Not cached yet, it will be loaded with correct numbers on first read
+                return
+            counts['total'] += total
+            counts['vacant'] += vacant
+            counts['booked'] += booked
+
+    # Write-through hooks, called after the corresponding transaction has committed
+
+    def slot_booked(self, lot_id, count=1):
+        self._apply(lot_id, vacant=-count, booked=count)
+
+    def slot_freed(self, lot_id, count=1):
+        self._apply(lot_id, vacant=count, booked=-count)
+
+    def slot_deleted(self, lot_id, previous_status):
+        if previous_status in ('vacant', 'booked'):
+            self._apply(lot_id, total=-1, **{previous_status: -1})
+
+    def slot_restored(self, lot_id):
+        self._apply(lot_id, total=1, vacant=1)
+
+    def slots_added(self, lot_id, count):
+        self._apply(lot_id, total=count, vacant=count)
+
+    def lot_added(self, lot_id, total_slots):
+        with self._lock:
+            self._counts[lot_id] = {'total': total_slots, 'vacant': total_slots, 'booked': 0}
+
+    def invalidate(self, lot_id):
+        """Drop a lot so the next read reloads it from the database"""
+        with self._lock:
+            self._counts.pop(lot_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'lots_cached': len(self._counts),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'reconciles': self.reconciles,
+            'repaired_lots': self.repaired_lots,
+            'staleness_seconds': round(time.time() - self._last_reconcile, 1) if self._last_reconcile else None
+        }
@@ -0,0 +1,72 @@
+"""Admin booking list: keyset pages vs. the old unbounded query and OFFSET paging.
+
+    python benchmarks/admin_bookings_pagination.py --bookings 10000 100000 1000000
+
+For each table size the script inserts benchmark bookings and times the first page,
+a page roughly 90% of the way through the history (reached through its cursor, as the
+'Older' link would), the same depth with LIMIT/OFFSET, and the old full query.
+"""
+import argparse
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+from pagination import encode_cursor, keyset_page
+
+QUERY = '''
+    SELECT b.*, u.username, u.email, u.phone,
+           p.name as parking_lot_name, p.location,
+           ps.slot_number
+    FROM bookings b
+    JOIN users u ON b.user_id = u.id
+    JOIN parking_lots p ON b.parking_lot_id = p.id
+    LEFT JOIN parking_slots ps ON b.slot_id = ps.id
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--skip-full', action='store_true', help='Do not time the unbounded query.')
+    args = parser.parse_args()
+
+    connection = connect()
+    cursor = repository(connection).cursor(dictionary=True)
+    print(f'{"bookings":>10} {"first page":>12} {"deep page":>12} {"offset":>12} {"full list":>12}')
+    for total in args.bookings:
+        cleanup(connection)
+        lots = 100
+        create_lots(connection, lots, slots_per_lot=10, bookings_per_lot=total // lots,
+                    user_id=create_user(connection))
+
+        depth = int(total * 0.9)
+        cursor.execute('''
+            SELECT id, created_at FROM bookings
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1 OFFSET %s
+        ''', (depth,))
+        deep_cursor = encode_cursor(cursor.fetchone())
+
+        first = timed(lambda: keyset_page(cursor, QUERY, [], [], 'b.created_at', page_size=args.page_size))
+        deep = timed(lambda: keyset_page(cursor, QUERY, [], [], 'b.created_at', after=deep_cursor,
+                                         page_size=args.page_size))
+
+        def offset_page():
+            cursor.execute(QUERY + ' ORDER BY b.created_at DESC, b.id DESC LIMIT %s OFFSET %s',
+                           (args.page_size, depth))
+            cursor.fetchall()
+
+        def full_list():
+            cursor.execute(QUERY + ' ORDER BY b.created_at DESC')
+            cursor.fetchall()
+
+        offset = timed(offset_page, repeat=3)
+        full = float('nan') if args.skip_full else timed(full_list, repeat=1)
+        print(f'{total:>10} {first:>10.2f}ms {deep:>10.2f}ms {offset:>10.2f}ms {full:>10.2f}ms')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Advance reservations: free slot searches in SQL vs. the in-memory slot schedule.
+
+    python benchmarks/advance_reservations.py --slots 5000 --reservations 100000
+
+Creates a benchmark lot with --slots slots and seeds --reservations reservations over
+the next --days days, never overlapping on a slot (as the app keeps them). Then, for
+--windows random windows of 1 to 8 hours, it reports the best-of-5 time to list the
+lot's free slots:
+  * with an overlap scan of the lot's reservations (every reservation ending after the
+    window starts), the slots that are not taken computed in Python;
+  * with Repository.free_slots, one NOT EXISTS probe of the per-slot index each;
+  * with SlotSchedule.free_slots, one bisection per slot in memory;
+along with the cost of one SlotSchedule.is_free check and of loading the schedule. All
+three searches must agree.
+
+Finally --threads workers, each with its own connection, race to reserve the same
+window through create_reservation, with candidates from one shared SlotSchedules, and
+the script checks that no slot ended up with overlapping reservations.
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+from reservations import SlotSchedules
+
+CHUNK_SIZE = 5000
+
+
+def seed_reservations(connection, lot_id, user_id, count, days, seed=3):
+    """``count`` reservations of 1 to 8 hours spread evenly over the lot's slots, each
+    slot's horizon cut into equal stretches holding one reservation each"""
+    repo = repository(connection)
+    cursor = repo.cursor()
+    cursor.execute('SELECT id FROM parking_slots WHERE parking_lot_id = %s ORDER BY slot_number', (lot_id,))
+    slot_ids = [row[0] for row in cursor.fetchall()]
+    rng = random.Random(seed)
+    origin = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+    per_slot = -(-count // len(slot_ids))
+    stretch = days * 86400 // per_slot
+
+    rows = []
+    for index in range(count):
+        slot_id = slot_ids[index % len(slot_ids)]
+        hours = rng.randint(1, min(8, stretch // 3600))
+        offset = (index // len(slot_ids)) * stretch + rng.randrange(stretch - hours * 3600 + 1)
+        start = origin + timedelta(seconds=offset)
+        rows.append((user_id, lot_id, slot_id, 'BENCH', 'car', start, start + timedelta(hours=hours),
+                     10, 'reserved'))
+        if len(rows) == CHUNK_SIZE or index == count - 1:
+            cursor.executemany('''
+                INSERT INTO reservations (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                                          start_time, end_time, estimated_cost, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', rows)
+            rows = []
+    cursor.execute('UPDATE lot_occupancy SET reservation_version = reservation_version + 1 WHERE lot_id = %s',
+                   (lot_id,))
+    connection.commit()
+    cursor.close()
+    return origin
+
+
+def scan_free_slots(repo, lot_id, slots, start_time, end_time):
+    """Free slots from the reservations overlapping the window, found by range scan"""
+    cursor = repo.cursor()
+    cursor.execute('''
+        SELECT DISTINCT slot_id FROM reservations
+        WHERE parking_lot_id = %s AND status = 'reserved' AND end_time > %s AND start_time < %s
+    ''', (lot_id, start_time, end_time))
+    taken = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return [slot for slot in slots if slot[1] not in taken]
+
+
+def race(lot_id, user_id, start_time, end_time, threads, per_thread):
+    """Reserve the window from ``threads`` connections at once; returns (reserved,
+    refused, seconds, schedule stats)"""
+    schedules = SlotSchedules()
+    results = []
+
+    def worker():
+        connection = connect()
+        repo = repository(connection)
+        made = refused = 0
+        for _ in range(per_thread):
+            schedule = schedules.get(repo, lot_id)
+            candidates = [slot_id for _, slot_id in schedule.free_slots(start_time, end_time, limit=20)]
+            reservation = repo.create_reservation(user_id, lot_id, 'BENCH', 'car', start_time, end_time, candidates)
+            if reservation:
+                schedules.reserved(reservation)
+                made += 1
+            else:
+                refused += 1
+        connection.close()
+        results.append((made, refused))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return (sum(made for made, _ in results), sum(refused for _, refused in results), seconds,
+            schedules.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, default=5000)
+    parser.add_argument('--reservations', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--windows', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=100)
+    args = parser.parse_args()
+
+    connection = connect()
+    repo = repository(connection)
+    cleanup(connection)
+    user_id = create_user(connection)
+    lot_id = create_lots(connection, 1, slots_per_lot=args.slots)[0]
+    started = time.perf_counter()
+    origin = seed_reservations(connection, lot_id, user_id, args.reservations, args.days)
+    print(f'{args.reservations} reservations over {args.slots} slots seeded in {time.perf_counter() - started:.0f}s')
+
+    started = time.perf_counter()
+    schedule = SlotSchedules().get(repo, lot_id)
+    load_ms = (time.perf_counter() - started) * 1000
+    print(f'schedule loaded in {load_ms:.0f}ms: {len(schedule)} reservations in {schedule.nbytes() / 2 ** 20:.1f} MB')
+
+    rng = random.Random(11)
+    slots = [(slot_number, slot_id) for slot_number, slot_id, _, _ in repo.schedule_slots(lot_id)]
+    totals = [0, 0, 0]
+    free_counts = []
+    for _ in range(args.windows):
+        start = origin + timedelta(minutes=rng.randrange(args.days * 24 * 60))
+        end = start + timedelta(hours=rng.randint(1, 8))
+        found = [scan_free_slots(repo, lot_id, slots, start, end), repo.free_slots(lot_id, start, end),
+                 schedule.free_slots(start, end)]
+        if found[0] != found[1] or found[1] != found[2]:
+            raise SystemExit(f'free slot searches disagree for {start} - {end}')
+        free_counts.append(len(found[2]))
+        for index, search in enumerate((lambda: scan_free_slots(repo, lot_id, slots, start, end),
+                                        lambda: repo.free_slots(lot_id, start, end),
+                                        lambda: schedule.free_slots(start, end))):
+            totals[index] += timed(search)
+
+    scan_ms, sql_ms, schedule_ms = (total / args.windows for total in totals)
+    print(f'\n{args.windows} windows, {sum(free_counts) / len(free_counts):.0f} of {args.slots} slots free on average')
+    print(f'{"search":<28} {"per window":>12} {"speedup":>8}')
+    for label, elapsed in (('overlap scan (SQL)', scan_ms), ('per-slot probe (free_slots)', sql_ms),
+                           ('SlotSchedule.free_slots', schedule_ms)):
+        print(f'{label:<28} {elapsed:>10.2f}ms {scan_ms / elapsed:>7.1f}x')
+
+    slot_id = slots[len(slots) // 2][1]
+    checks = 100000
+    started = time.perf_counter()
+    for _ in range(checks):
+        schedule.is_free(slot_id, start, end)
+    print(f'SlotSchedule.is_free: {(time.perf_counter() - started) / checks * 1e6:.2f}us per check')
+
+    start = origin + timedelta(days=args.days // 2, hours=3)
+    end = start + timedelta(hours=4)
+    free = len(repo.free_slots(lot_id, start, end))
+    reserved, refused, seconds, stats = race(lot_id, user_id, start, end, args.threads, args.per_thread)
+    overlaps = repo.overlapping_reservations(lot_id)
+    print(f'\n{args.threads} threads x {args.per_thread} reservations of one window ({free} slots free): '
+          f'{reserved} made, {refused} refused in {seconds:.1f}s ({(reserved + refused) / seconds:.0f}/s); '
+          f'schedule loads {stats["loads"]}, overlapping pairs {len(overlaps)}')
+    if overlaps or reserved != min(free, args.threads * args.per_thread):
+        raise SystemExit('concurrent reservations went wrong')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Concurrency stress test for the slot allocation engine.
+
+Many threads book the same parking lot at once, each with its own database connection.
+Afterwards the script checks that no slot ended up with more than one active booking
+and reports the booking throughput.
+
+    python benchmarks/allocation_stress.py --threads 32 --slots 500 --mode any
+    python benchmarks/allocation_stress.py --threads 32 --slots 500 --mode pick
+
+``--mode pick`` makes every thread choose a random slot from a stale listing, which
+is the worst case for conflicts. A temporary lot and user are created and removed.
+"""
+import argparse
+import random
+import threading
+import time
+
+from common import connect, create_user, repository
+
+
+def setup(slots):
+    connection = connect()
+    user_id = create_user(connection, 'stress_user')
+    lot_id = repository(connection).create_lot('Stress Test Lot', 'benchmarks/allocation_stress.py',
+                                               1.00, slots)
+    connection.close()
+    return user_id, lot_id
+
+
+def teardown(user_id, lot_id):
+    connection = connect()
+    cursor = repository(connection).cursor()
+    cursor.execute('DELETE FROM bookings WHERE parking_lot_id = %s', (lot_id,))
+    cursor.execute('DELETE FROM parking_lots WHERE id = %s', (lot_id,))
+    cursor.execute('DELETE FROM users WHERE id = %s', (user_id,))
+    connection.commit()
+    connection.close()
+
+
+def worker(user_id, lot_id, mode, results):
+    connection = connect()
+    cursor = repository(connection).cursor()
+    cursor.execute('SELECT id FROM parking_slots WHERE parking_lot_id = %s', (lot_id,))
+    slot_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    booked = conflicts = 0
+    misses = 0
+    while misses < 20:
+        slot_id = random.choice(slot_ids) if mode == 'pick' else None
+        booking = repository(connection).create_booking(user_id, lot_id, 'STRESS-1', 'car', 1, slot_id)
+        if booking:
+            booked += 1
+            misses = 0
+        else:
+            conflicts += 1
+            if mode == 'any':
+                break
+            # Stop picking once the lot looks full
+            misses += 1
+            cursor = repository(connection).cursor()
+            cursor.execute('''
+                SELECT id FROM parking_slots
+                WHERE parking_lot_id = %s AND status = 'vacant'
+            ''', (lot_id,))
+            slot_ids = [row[0] for row in cursor.fetchall()] or slot_ids
+            connection.commit()
+            cursor.close()
+    connection.close()
+    results.append((booked, conflicts))
+
+
+def verify(lot_id):
+    connection = connect()
+    cursor = repository(connection).cursor()
+    cursor.execute('''
+        SELECT slot_id, COUNT(*)
+        FROM bookings
+        WHERE parking_lot_id = %s AND status = 'active'
+        GROUP BY slot_id
+        HAVING COUNT(*) > 1
+    ''', (lot_id,))
+    double_booked = cursor.fetchall()
+    cursor.execute('''
+        SELECT COUNT(*)
+        FROM parking_slots ps
+        JOIN bookings b ON ps.booking_id = b.id
+        WHERE ps.parking_lot_id = %s AND ps.status = 'booked'
+          AND b.slot_id = ps.id AND b.status = 'active'
+    ''', (lot_id,))
+    consistent_slots = cursor.fetchone()[0]
+    cursor.execute('''
+        SELECT COUNT(*) FROM bookings WHERE parking_lot_id = %s AND status = 'active'
+    ''', (lot_id,))
+    active_bookings = cursor.fetchone()[0]
+    connection.close()
+    return double_booked, consistent_slots, active_bookings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--slots', type=int, default=500)
+    parser.add_argument('--mode', choices=['any', 'pick'], default='any')
+    args = parser.parse_args()
+
+    user_id, lot_id = setup(args.slots)
+    try:
+        results = []
+        threads = [threading.Thread(target=worker, args=(user_id, lot_id, args.mode, results))
+                   for _ in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        booked = sum(r[0] for r in results)
+        conflicts = sum(r[1] for r in results)
+        double_booked, consistent_slots, active_bookings = verify(lot_id)
+
+        print(f'threads={args.threads} slots={args.slots} mode={args.mode}')
+        print(f'bookings={booked} conflicts={conflicts} elapsed={elapsed:.2f}s '
+              f'bookings/sec={booked / elapsed:.1f}')
+        print(f'active bookings={active_bookings} consistent slots={consistent_slots} '
+              f'double booked slots={len(double_booked)}')
+
+        assert not double_booked, f'double bookings found: {double_booked}'
+        assert booked == active_bookings == consistent_slots
+        if args.mode == 'any':
+            assert booked == args.slots, 'lot was not filled completely'
+    finally:
+        teardown(user_id, lot_id)
+
+
+if __name__ == '__main__':
+    main()
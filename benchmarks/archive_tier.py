@@ -0,0 +1,136 @@
+"""Hot-path booking queries with settled history in the live table vs. archived.
+
+    python benchmarks/archive_tier.py --history 10000000 --active 2000
+
+Seeds --history completed and cancelled bookings (made 100-400 days ago) and --active
+running ones over a set of benchmark lots, then reports the best-of-5 time of the
+queries that run on every request or expiry tick:
+  * the expiry scan (active bookings ending soon), the active-booking check of a lot
+    delete and a user's active bookings, and the active count of the dashboard;
+  * the first page of the admin booking list (active only, and everything) and of a
+    user's booking history, which read both tiers once history is archived.
+Every query is timed with all history in bookings, then again after archive_bookings
+has moved it to bookings_archive. The archive run's rate and the size of the live
+table with its indexes, before and after, are reported too: the indexes the hot path
+reads stay small enough to remain in memory however much history there is.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+CHUNK_SIZE = 5000
+
+
+def seed_history(connection, lot_ids, user_id, count, seed=1):
+    rng = random.Random(seed)
+    oldest = datetime.now() - timedelta(days=400)
+    spacing = 300 * 86400 / count
+    cursor = repository(connection).cursor()
+    for offset in range(0, count, CHUNK_SIZE):
+        rows = []
+        for index in range(offset, min(offset + CHUNK_SIZE, count)):
+            # In creation order, as real history is inserted
+            start = oldest + timedelta(seconds=index * spacing)
+            end = start + timedelta(hours=rng.randrange(1, 9))
+            status = 'cancelled' if rng.random() < 0.08 else 'completed'
+            rows.append((user_id, rng.choice(lot_ids), 'BENCH', 'car', start, end, start, end, 10, 10,
+                         status, start, end))
+        cursor.executemany('''
+            INSERT INTO bookings (user_id, parking_lot_id, vehicle_number, vehicle_type, start_time,
+                                  end_time, actual_start_time, actual_end_time, estimated_cost,
+                                  actual_cost, status, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ''', rows)
+        connection.commit()
+    cursor.close()
+
+
+def live_table_mb(repo):
+    """Size of the bookings table with its indexes, in MB"""
+    cursor = repo.cursor()
+    if repo.backend == 'sqlite':
+        cursor.execute('''
+            SELECT SUM(pgsize) FROM dbstat
+            WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'bookings')
+        ''')
+    else:
+        cursor.execute('ANALYZE TABLE bookings')
+        cursor.fetchall()
+        cursor.execute('''
+            SELECT data_length + index_length FROM information_schema.TABLES
+            WHERE table_schema = DATABASE() AND table_name = 'bookings'
+        ''')
+    size = cursor.fetchone()[0]
+    cursor.close()
+    return size / 2 ** 20
+
+
+def hot_path_queries(repo, lot_id, user_id):
+    def active_check():
+        cursor = repo.cursor()
+        cursor.execute('''
+            SELECT COUNT(*)
+            FROM bookings b
+            JOIN parking_slots ps ON b.slot_id = ps.id
+            WHERE ps.parking_lot_id = %s AND b.status = 'active'
+        ''', (lot_id,))
+        cursor.fetchone()
+        cursor.close()
+
+    return (
+        ('expiry scan', lambda: repo.upcoming_expiries(3600)),
+        ('lot delete check', active_check),
+        ('user active', lambda: repo.user_active_bookings(user_id)),
+        ('dashboard active', repo.booking_summary),
+        ('admin page active', lambda: repo.search_bookings({'status': 'active'})),
+        ('admin page all', lambda: repo.search_bookings({})),
+        ('user history page', lambda: repo.user_booking_history(user_id)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, default=10000000)
+    parser.add_argument('--active', type=int, default=2000)
+    parser.add_argument('--lots', type=int, default=20)
+    args = parser.parse_args()
+
+    connection = connect()
+    repo = repository(connection)
+    cleanup(connection)
+    user_id = create_user(connection)
+    lot_ids = create_lots(connection, args.lots, slots_per_lot=args.active // args.lots + 1)
+
+    started = time.perf_counter()
+    seed_history(connection, lot_ids, user_id, args.history)
+    print(f'{args.history} settled bookings seeded in {time.perf_counter() - started:.0f}s')
+    for index in range(args.active):
+        repo.create_booking(user_id, lot_ids[index % len(lot_ids)], 'BENCH', 'car', 1 + index % 8)
+
+    queries = hot_path_queries(repo, lot_ids[0], user_id)
+    before = [timed(query) for _, query in queries]
+    before_mb = live_table_mb(repo)
+
+    started = time.perf_counter()
+    moved = repo.archive_bookings(datetime.now() - timedelta(days=90), batch_size=5000, pause=0)
+    seconds = time.perf_counter() - started
+    print(f'{moved} bookings archived in {seconds:.0f}s ({moved / seconds:.0f} rows/s); '
+          f'tiers now {repo.booking_tier_counts()}')
+
+    after = [timed(query) for _, query in queries]
+    print(f'live bookings table and indexes: {before_mb:.1f} MB before, {live_table_mb(repo):.1f} MB after')
+    print(f'\n{"query":<20} {"live table":>12} {"archived":>12} {"speedup":>8}')
+    for (label, _), live_ms, archived_ms in zip(queries, before, after):
+        print(f'{label:<20} {live_ms:>10.2f}ms {archived_ms:>10.2f}ms {live_ms / archived_ms:>7.1f}x')
+
+    if repo.verify_occupancy():
+        raise SystemExit('lot_occupancy drifted from parking_slots')
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
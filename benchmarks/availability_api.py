@@ -0,0 +1,60 @@
+"""Kiosk polling: the JSON availability API with and without a matching ETag.
+
+    python benchmarks/availability_api.py --lots 50 500 --polls 2000
+
+For every lot count the script creates benchmark lots (100 slots each) and reports
+polls per second through the test client for:
+  * /dashboard, the HTML page the kiosks used to scrape;
+  * /api/lots and /api/lots/<id> when the data changed since the last poll (no
+    matching ETag: full query and JSON);
+  * the same endpoints when nothing changed (If-None-Match matches: 304).
+"""
+import argparse
+import time
+
+from common import app, cleanup, connect, create_lots, create_user
+
+
+def polls_per_second(client, path, polls, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    started = time.perf_counter()
+    for _ in range(polls):
+        response = client.get(path, headers=headers)
+    elapsed = time.perf_counter() - started
+    expected = 304 if etag else 200
+    if response.status_code != expected:
+        raise SystemExit(f'{path} answered {response.status_code}, expected {expected}')
+    return polls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, nargs='+', default=[50, 500])
+    parser.add_argument('--polls', type=int, default=2000, help='Requests per measurement.')
+    args = parser.parse_args()
+
+    connection = connect()
+    print(f'{"lots":>6} {"endpoint":<18} {"changed":>12} {"unchanged":>12}')
+    for lots in args.lots:
+        cleanup(connection)
+        user_id = create_user(connection)
+        lot_ids = create_lots(connection, lots, slots_per_lot=100)
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session.update(logged_in=True, user_id=user_id, username='bench_user', user_type='user')
+        dashboard = polls_per_second(client, '/dashboard', args.polls)
+        print(f'{lots:>6} {"/dashboard (HTML)":<18} {dashboard:>8.0f}/s {"-":>12}')
+
+        for label, path in (('/api/lots', '/api/lots'), ('/api/lots/<id>', f'/api/lots/{lot_ids[0]}')):
+            etag = client.get(path).headers['ETag']
+            changed = polls_per_second(client, path, args.polls)
+            unchanged = polls_per_second(client, path, args.polls, etag)
+            print(f'{lots:>6} {label:<18} {changed:>8.0f}/s {unchanged:>10.0f}/s')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
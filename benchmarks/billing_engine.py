@@ -0,0 +1,116 @@
+"""Billing: pricing stays one by one vs. a column at a time with NumPy.
+
+    python benchmarks/billing_engine.py --stays 100000 1000000 --settle 1000 5000
+
+Pricing runs on synthetic stay durations spread over 50 lots with stepped hourly
+rates, a daily cap and a grace period. For every stay count the script reports the time to
+price them all with ``Tariff.price_cents`` per stay (what the pure-Python fallback
+does) vs. ``TariffTable.price_cents`` over arrays, and to re-rate them into per-lot
+totals. For every settlement size the script creates that many expired bookings in
+a benchmark lot with a tariff and times ``settle_expired`` booking by booking vs. in
+bulk (one priced batch and one CASE update per chunk).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import cleanup, connect, create_lots, create_user, repository
+
+import billing
+from billing import Tariff, TariffTable
+
+LOTS = 50
+
+
+def elapsed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def synthetic_stays(count, seed=7):
+    """(lot_ids, durations, charged) columns as ``Repository.booking_stays`` yields them"""
+    rng = random.Random(seed)
+    lot_ids = [rng.randrange(1, LOTS + 1) for _ in range(count)]
+    durations = [rng.randrange(60, 3 * 86400) * 10 ** 6 if rng.random() > 0.05 else -1 for _ in range(count)]
+    charged = [rng.randrange(100, 20000) for _ in range(count)]
+    return lot_ids, durations, charged
+
+
+def tariffs():
+    return {lot_id: Tariff(5, ['5', '4', '3'], 30 + lot_id % 10, 10) for lot_id in range(1, LOTS + 1)}
+
+
+def book_expired(connection, lot_id, user_id):
+    cursor = repository(connection).cursor()
+    cursor.execute('SELECT id FROM parking_slots WHERE parking_lot_id = %s', (lot_id,))
+    end = datetime.now() - timedelta(minutes=5)
+    rows = [(user_id, lot_id, row[0], 'BENCH', 'car', end - timedelta(minutes=37 * (index % 60) + 20), end,
+             10, 'active', end - timedelta(minutes=37 * (index % 60) + 20))
+            for index, row in enumerate(cursor.fetchall())]
+    cursor.executemany('''
+        INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                              start_time, end_time, estimated_cost, status, actual_start_time)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ''', rows)
+    cursor.execute('''
+        UPDATE parking_slots
+        SET status = 'booked',
+            booking_id = (SELECT b.id FROM bookings b
+                          WHERE b.slot_id = parking_slots.id AND b.status = 'active')
+        WHERE parking_lot_id = %s
+    ''', (lot_id,))
+    connection.commit()
+    cursor.close()
+    repository(connection).rebuild_occupancy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stays', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--settle', type=int, nargs='+', default=[1000, 5000])
+    args = parser.parse_args()
+
+    numpy = billing.np
+    if numpy is None:
+        print('NumPy is not installed: both columns below use the pure-Python path.')
+    print(f'{"stays":>9} {"operation":<8} {"per stay":>12} {"columns":>12} {"speedup":>8}')
+    for count in args.stays:
+        lot_ids, durations, charged = synthetic_stays(count)
+        billing.np = None
+        python_table = TariffTable(tariffs())
+        python_price, python_cents = elapsed(lambda: python_table.price_cents(lot_ids, durations))
+        python_rerate, python_totals = elapsed(lambda: python_table.rerate([(lot_ids, durations, charged)]))
+        billing.np = numpy
+        table = TariffTable(tariffs())
+        price, column_cents = elapsed(lambda: table.price_cents(lot_ids, durations))
+        rerate, totals = elapsed(lambda: table.rerate([(lot_ids, durations, charged)]))
+        if list(column_cents) != python_cents or totals != python_totals:
+            raise SystemExit('NumPy and pure-Python prices differ')
+        for label, per_stay, columns in (('price', python_price, price), ('rerate', python_rerate, rerate)):
+            print(f'{count:>9} {label:<8} {per_stay:>10.1f}ms {columns:>10.1f}ms {per_stay / columns:>7.1f}x')
+
+    connection = connect()
+    repo = repository(connection)
+    print(f'\n{"bookings":>9} {"settle":<8} {"per row":>12} {"bulk":>12} {"speedup":>8}')
+    for count in args.settle:
+        cleanup(connection)
+        user_id = create_user(connection)
+        lot_id = create_lots(connection, 1, slots_per_lot=count)[0]
+        repo.set_lot_tariff(lot_id, Tariff(5, ['5', '4', '3'], 30, 10))
+        timings = []
+        for bulk in (False, True):
+            book_expired(connection, lot_id, user_id)
+            settle_ms, settled = elapsed(lambda: repo.settle_expired(limit=count, bulk=bulk))
+            if settled != count or repo.verify_occupancy():
+                raise SystemExit(f'settled {settled} of {count} bookings')
+            timings.append(settle_ms)
+        print(f'{count:>9} {"":<8} {timings[0]:>10.1f}ms {timings[1]:>10.1f}ms {timings[0] / timings[1]:>7.1f}x')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bulk admin operations: one request per item vs. one set-based transaction.
+
+    python benchmarks/bulk_admin.py --items 100 300 1000
+
+For every item count the script creates a benchmark lot and reports the time to:
+  * delete that many slots one by one (get_slot + delete_slot, as the per-slot
+    route does) vs. delete_slots over their number range;
+  * restore them again with restore_slot per slot vs. restore_slots;
+  * cancel that many active bookings with cancel_booking each vs. cancel_bookings
+    filtered by the lot.
+"""
+import argparse
+import time
+
+from common import cleanup, connect, create_lots, create_user, repository
+
+
+def elapsed(function):
+    started = time.perf_counter()
+    function()
+    return (time.perf_counter() - started) * 1000
+
+
+def book_slots(repo, lot_id, user_id, count):
+    return [repo.create_booking(user_id, lot_id, 'BENCH', 'car', 2)['booking_id']
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[100, 300, 1000])
+    args = parser.parse_args()
+
+    connection = connect()
+    repo = repository(connection)
+    print(f'{"items":>6} {"operation":<10} {"per item":>12} {"bulk":>12} {"speedup":>8}')
+    for items in args.items:
+        cleanup(connection)
+        user_id = create_user(connection)
+        lot_id = create_lots(connection, 1, slots_per_lot=items)[0]
+        slot_ids = [row['id'] for row in repo.slot_statuses(lot_id)]
+
+        def delete_each():
+            for slot_id in slot_ids:
+                repo.delete_slot(repo.get_slot(slot_id))
+
+        def restore_each():
+            for slot_id in slot_ids:
+                repo.restore_slot(slot_id)
+
+        timings = [('delete', elapsed(delete_each)), ('restore', elapsed(restore_each))]
+        bulk = [elapsed(lambda: repo.delete_slots(lot_id, [(1, items)])),
+                elapsed(lambda: repo.restore_slots(lot_id, [(1, items)]))]
+
+        booking_ids = book_slots(repo, lot_id, user_id, items)
+        each = elapsed(lambda: [repo.cancel_booking(booking_id) for booking_id in booking_ids])
+        book_slots(repo, lot_id, user_id, items)
+        timings.append(('cancel', each))
+        bulk.append(elapsed(lambda: repo.cancel_bookings({'lot_id': lot_id})))
+
+        for (label, per_item), together in zip(timings, bulk):
+            print(f'{items:>6} {label:<10} {per_item:>10.1f}ms {together:>10.1f}ms {per_item / together:>7.1f}x')
+
+        if repo.verify_occupancy():
+            raise SystemExit('lot_occupancy drifted from parking_slots')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
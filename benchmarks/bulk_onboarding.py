@@ -0,0 +1,97 @@
+"""Onboarding users: one register() POST per user vs. `flask import-users`.
+
+    python benchmarks/bulk_onboarding.py --users 100000 --baseline 500 --workers 4
+
+The script writes --users benchmark drivers to a CSV file, with about 1% duplicate
+and invalid rows mixed in, then reports users per second for:
+  * looping register(): the first --baseline users POSTed one by one to /register
+    through the test client (lookup, hash and INSERT per user), as the form does;
+  * import_users over the whole file: in-memory checks, passwords hashed by --workers
+    processes, multi-row INSERTs of --chunk-size users.
+Both hash with --hash-method; Werkzeug's default (hundreds of milliseconds per hash)
+makes a 100k run take hours on a small machine, so pass a cheaper one such as
+'pbkdf2:sha256:1000' to compare the rest of the work.
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from functools import partial
+
+from common import cleanup, connect, repository
+
+from werkzeug.security import generate_password_hash
+
+import app as parking_app
+from onboarding import import_users, read_users
+
+
+def write_users(path, count, rng):
+    """Benchmark drivers, with a duplicate username, a duplicate email or a bad email
+    in about 1% of the rows"""
+    with open(path, 'w', newline='') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(('username', 'email', 'password', 'phone'))
+        for n in range(count):
+            username, email = f'bench_driver_{n:07d}', f'bench_driver_{n:07d}@fleet.example.com'
+            flaw = rng.random()
+            if n and flaw < 0.004:
+                username = f'bench_driver_{rng.randrange(n):07d}'
+            elif n and flaw < 0.008:
+                email = f'bench_driver_{rng.randrange(n):07d}@fleet.example.com'
+            elif flaw < 0.01:
+                email = 'not-an-email'
+            writer.writerow((username, email, f'pw-{rng.getrandbits(48):012x}', f'555{n:07d}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--baseline', type=int, default=500, help='Users registered one by one.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--hash-method', help="e.g. 'pbkdf2:sha256:1000'; Werkzeug's default when omitted.")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.hash_method:
+        # register() hashes through the name it imported
+        parking_app.generate_password_hash = partial(generate_password_hash, method=args.hash_method)
+    path = os.path.join(tempfile.mkdtemp(), 'drivers.csv')
+    write_users(path, args.users, random.Random(args.seed))
+    connection = connect()
+    cleanup(connection)
+
+    client = parking_app.app.test_client()
+    with open(path, newline='') as stream:
+        rows = [row for _, row in zip(range(args.baseline), csv.DictReader(stream))]
+    started = time.perf_counter()
+    for row in rows:
+        client.post('/register', data=row)
+    baseline_seconds = time.perf_counter() - started
+    baseline_rate = len(rows) / baseline_seconds
+    print(f'register() loop: {len(rows)} users in {baseline_seconds:.1f}s, {baseline_rate:.0f} users/s '
+          f'({args.users / baseline_rate / 60:.1f} min for {args.users})')
+    cleanup(connection)
+
+    started = time.perf_counter()
+    with open(path, newline='') as stream:
+        report = import_users(repository(connection), read_users(stream, 'csv'), args.workers,
+                              args.chunk_size, args.hash_method)
+    seconds = time.perf_counter() - started
+    steps = ', '.join(f'{step} {step_seconds:.1f}s' for step, step_seconds in report.seconds.items())
+    print(f'import_users ({args.workers} workers): {report.created} users created, '
+          f'{len(report.rejected)} rejected in {seconds:.1f}s ({steps}), '
+          f'{report.created / seconds:.0f} users/s, {report.created / seconds / baseline_rate:.1f}x')
+    for reason, count in report.reasons().most_common():
+        print(f'  {count} x {reason}')
+
+    cleanup(connection)
+    connection.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
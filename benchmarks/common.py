@@ -0,0 +1,100 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against the database configured in app.py, MySQL or SQLite (e.g.
+``DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db``; use a file rather than ':memory:' so
+the benchmark and the app share one database). Everything they create is tagged with
+the location BENCH_LOCATION (lots) or the username prefix 'bench_' (users) and removed
+again by ``cleanup``.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from db import connect as open_connection
+from repository import create_repository
+
+BENCH_LOCATION = 'benchmark fixture'
+
+
+def connect():
+    return open_connection(app.config)
+
+
+def repository(connection):
+    """Repository of the configured backend over ``connection``"""
+    return create_repository(app.config['DB_BACKEND'], connection)
+
+
+def timed(function, repeat=5):
+    """Run ``function`` ``repeat`` times and return the best wall time in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def create_user(connection, name='bench_user'):
+    account = repository(connection).find_user(name)
+    if account:
+        return account['id']
+    return repository(connection).create_user(name, f'{name}@example.com', '-', '0000000000')
+
+
+def create_lots(connection, lots, slots_per_lot=20, bookings_per_lot=0, user_id=None):
+    """Create ``lots`` benchmark lots with slots and completed historical bookings"""
+    cursor = repository(connection).cursor()
+    cursor.executemany('''
+        INSERT INTO parking_lots (name, location, price_per_hour)
+        VALUES (%s, %s, %s)
+    ''', [(f'Bench Lot {n}', BENCH_LOCATION, 5) for n in range(lots)])
+    cursor.execute('SELECT id FROM parking_lots WHERE location = %s', (BENCH_LOCATION,))
+    lot_ids = [row[0] for row in cursor.fetchall()]
+
+    for lot_id in lot_ids:
+        cursor.executemany('''
+            INSERT INTO parking_slots (parking_lot_id, slot_number, status)
+            VALUES (%s, %s, %s)
+        ''', [(lot_id, n, 'vacant') for n in range(1, slots_per_lot + 1)])
+
+    if bookings_per_lot:
+        now = datetime.now()
+        rows = []
+        for lot_id in lot_ids:
+            for _ in range(bookings_per_lot):
+                start = now - timedelta(days=random.randint(1, 365), hours=random.randint(0, 23))
+                end = start + timedelta(hours=random.randint(1, 8))
+                rows.append((user_id, lot_id, 'BENCH', 'car', start, end, start, end, 5, 5,
+                             'completed', start))
+        for offset in range(0, len(rows), 5000):
+            cursor.executemany('''
+                INSERT INTO bookings (user_id, parking_lot_id, vehicle_number, vehicle_type,
+                                      start_time, end_time, actual_start_time, actual_end_time,
+                                      estimated_cost, actual_cost, status, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', rows[offset:offset + 5000])
+
+    connection.commit()
+    cursor.close()
+    repository(connection).rebuild_occupancy()
+    return lot_ids
+
+
+def cleanup(connection):
+    cursor = repository(connection).cursor()
+    for table in ('bookings', 'bookings_archive', 'reservations'):
+        cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE parking_lot_id IN (SELECT id FROM parking_lots WHERE location = %s)
+        ''', (BENCH_LOCATION,))
+    cursor.execute('DELETE FROM parking_lots WHERE location = %s', (BENCH_LOCATION,))
+    cursor.execute('DELETE FROM users WHERE SUBSTR(username, 1, 6) = %s', ('bench_',))
+    connection.commit()
+    cursor.close()
@@ -0,0 +1,71 @@
+"""Requests/sec on /dashboard with and without the connection pool.
+
+    python benchmarks/connection_pool.py --threads 16 --requests 2000
+
+Drives the app through Flask's test client from several threads, first opening a
+new MySQL connection per request (DB_POOL_ENABLED = False, the old behaviour) and
+then with the pool, and prints throughput plus the pool statistics.
+"""
+import argparse
+import threading
+import time
+
+from common import cleanup, connect, create_lots
+
+import app as parking_app
+from db import get_pool
+
+
+def run(threads, total_requests):
+    per_thread = total_requests // threads
+
+    def client_loop():
+        client = parking_app.app.test_client()
+        with client.session_transaction() as session:
+            session['logged_in'] = True
+            session['user_id'] = 0
+            session['username'] = 'bench'
+            session['user_type'] = 'user'
+        for _ in range(per_thread):
+            response = client.get('/dashboard')
+            assert response.status_code == 200, response.status_code
+
+    workers = [threading.Thread(target=client_loop) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    connection = connect()
+    cleanup(connection)
+    create_lots(connection, 50)
+
+    parking_app.app.config['EXPIRY_SCHEDULER'] = 'off'
+    parking_app.app.config['DB_POOL_SIZE'] = args.threads
+
+    parking_app.app.config['DB_POOL_ENABLED'] = False
+    without_pool = run(args.threads, args.requests)
+    parking_app.app.config['DB_POOL_ENABLED'] = True
+    with_pool = run(args.threads, args.requests)
+
+    print(f'threads={args.threads} requests={args.requests}')
+    print(f'without pool: {without_pool:.1f} req/s')
+    print(f'with pool:    {with_pool:.1f} req/s ({with_pool / without_pool:.1f}x)')
+    with parking_app.app.app_context():
+        print(f'pool stats:   {get_pool().stats()}')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
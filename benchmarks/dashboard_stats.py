@@ -0,0 +1,104 @@
+"""Admin dashboard statistics: the original seven queries vs. the two-query snapshot.
+
+    python benchmarks/dashboard_stats.py --lots 100 1000 10000
+
+For every lot count the script creates benchmark lots (20 slots and 5 completed
+bookings each), then reports the best-of-5 latency of the old query sequence, of a
+fresh snapshot computation, and of a cached snapshot read, plus how many computations
+50 concurrent dashboard loads triggered.
+"""
+import argparse
+import threading
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+import app as parking_app
+
+
+def original_queries(connection):
+    """The query sequence admin_dashboard() used to run on every load"""
+    cursor = repository(connection).cursor(dictionary=True)
+    cursor.execute('''
+        SELECT p.*,
+               COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END) as total_slots,
+               SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as available_slots,
+               SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as occupied_slots
+        FROM parking_lots p
+        LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+        WHERE p.deleted_at IS NULL
+        GROUP BY p.id
+        ORDER BY p.created_at DESC
+    ''')
+    cursor.fetchall()
+    cursor.execute('SELECT COUNT(*) as total_lots FROM parking_lots WHERE deleted_at IS NULL')
+    cursor.fetchone()
+    cursor.execute('SELECT COUNT(*) as total_slots FROM parking_slots WHERE deleted_at IS NULL')
+    cursor.fetchone()
+    cursor.execute('''
+        SELECT COUNT(*) as available_slots
+        FROM parking_slots
+        WHERE status = 'vacant' AND deleted_at IS NULL
+    ''')
+    cursor.fetchone()
+    cursor.execute('SELECT COUNT(*) as active_bookings FROM bookings WHERE status = "active"')
+    cursor.fetchone()
+    cursor.execute('''
+        SELECT SUM(actual_cost) as total_revenue
+        FROM bookings
+        WHERE status = 'completed' AND actual_cost IS NOT NULL
+    ''')
+    cursor.fetchone()
+    cursor.execute('''
+        SELECT DATE_FORMAT(actual_end_time, '%Y-%m') as month, SUM(actual_cost) as revenue
+        FROM bookings
+        WHERE status = 'completed' AND actual_cost IS NOT NULL
+        GROUP BY DATE_FORMAT(actual_end_time, '%Y-%m')
+        ORDER BY month DESC
+        LIMIT 6
+    ''')
+    cursor.fetchall()
+    cursor.close()
+
+
+def concurrent_loads(clients=50):
+    """Invalidate the snapshot and let ``clients`` threads load the dashboard at once"""
+    parking_app.dashboard_stats.invalidate()
+    before = parking_app.dashboard_stats.computations
+    barrier = threading.Barrier(clients)
+
+    def load():
+        with parking_app.app.app_context():
+            barrier.wait()
+            parking_app.dashboard_stats.get()
+
+    threads = [threading.Thread(target=load) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return parking_app.dashboard_stats.computations - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    connection = connect()
+    print(f'{"lots":>8} {"7 queries":>12} {"snapshot":>12} {"cached":>12} {"computations/50":>16}')
+    for lots in args.lots:
+        cleanup(connection)
+        create_lots(connection, lots, bookings_per_lot=5, user_id=create_user(connection))
+        with parking_app.app.app_context():
+            before = timed(lambda: original_queries(connection))
+            after = timed(parking_app.compute_dashboard_stats)
+            parking_app.dashboard_stats.get()
+            cached = timed(parking_app.dashboard_stats.get)
+        computations = concurrent_loads()
+        print(f'{lots:>8} {before:>10.2f}ms {after:>10.2f}ms {cached:>10.4f}ms {computations:>16}')
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""Synthetic data at production scale: users, lots, slots and booking history.
+
+    python benchmarks/datagen.py --users 5000 --lots 200 --slots 20 400 --bookings 1000000
+    python benchmarks/datagen.py --clear
+
+Lot sizes are drawn from the --slots range. Demand is skewed: a few popular lots and
+frequent users account for most bookings. Start times follow a weekday rush-hour
+pattern over the last --days days, stays are mostly short, and about 8% of bookings
+are cancelled part way. Costs use the app's billing rules. On top of the history,
+--occupancy of every lot's slots get an active booking that is running now.
+
+Rows go in with chunked multi-row inserts. Afterwards the lot_occupancy summary and
+the revenue rollups are rebuilt. Generated users are named 'load_user_NNNNNN' with
+the password LOAD_PASSWORD, and lots carry the location LOAD_LOCATION. --clear removes
+exactly that data, and every run starts by clearing it.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from common import connect, repository
+
+from billing import billed_hours
+
+LOAD_LOCATION = 'load test fixture'
+LOAD_USER_PREFIX = 'load_user_'
+LOAD_PASSWORD = 'loadtest'
+CHUNK_SIZE = 5000
+
+# Relative booking demand per hour of the day: morning and evening peaks
+HOURLY_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 11, 8, 7,
+                  8, 7, 7, 8, 10, 12, 11, 8, 5, 3, 2, 1]
+WEEKEND_FACTOR = 0.6
+# Booked stay lengths in hours
+DURATION_WEIGHTS = {1: 30, 2: 25, 3: 15, 4: 10, 5: 6, 6: 5, 8: 5, 10: 2, 12: 2}
+VEHICLE_TYPE_WEIGHTS = {'car': 75, 'motorcycle': 15, 'van': 6, 'truck': 4}
+CANCELLED_SHARE = 0.08
+
+
+def clear(connection):
+    """Remove everything a previous run generated"""
+    cursor = repository(connection).cursor()
+    for table in ('bookings', 'bookings_archive'):
+        cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE parking_lot_id IN (SELECT id FROM parking_lots WHERE location = %s)
+               OR user_id IN (SELECT id FROM users WHERE SUBSTR(username, 1, %s) = %s)
+        ''', (LOAD_LOCATION, len(LOAD_USER_PREFIX), LOAD_USER_PREFIX))
+    cursor.execute('DELETE FROM parking_lots WHERE location = %s', (LOAD_LOCATION,))
+    cursor.execute('DELETE FROM users WHERE SUBSTR(username, 1, %s) = %s',
+                   (len(LOAD_USER_PREFIX), LOAD_USER_PREFIX))
+    connection.commit()
+    cursor.close()
+
+
+def insert_chunked(cursor, query, rows):
+    for offset in range(0, len(rows), CHUNK_SIZE):
+        cursor.executemany(query, rows[offset:offset + CHUNK_SIZE])
+
+
+def skewed_weights(count, exponent):
+    """Zipf-like weights: item n gets 1 / n**exponent"""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def vehicle_number(rng):
+    letters = 'ABCDEFGHJKLMNPRSTUVWXYZ'
+    return '{}{:02d}{}{}{:04d}'.format(rng.choice(letters) + rng.choice(letters), rng.randint(1, 99),
+                                     rng.choice(letters), rng.choice(letters), rng.randint(1, 9999))
+
+
+def start_times(rng, count, days, now):
+    """``count`` booking start times over the last ``days`` days, busier on weekdays and
+    at rush hour"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_offsets = list(range(1, days + 1))
+    day_weights = [WEEKEND_FACTOR if (today - timedelta(days=offset)).weekday() >= 5 else 1
+                   for offset in day_offsets]
+    days_drawn = rng.choices(day_offsets, day_weights, k=count)
+    hours_drawn = rng.choices(range(24), HOURLY_WEIGHTS, k=count)
+    return [today - timedelta(days=offset, hours=-hour, minutes=-rng.randint(0, 59),
+                              seconds=-rng.randint(0, 59))
+            for offset, hour in zip(days_drawn, hours_drawn)]
+
+
+def generate(connection, users=1000, lots=50, slots=(20, 200), bookings=100000, days=180,
+             occupancy=0.3, seed=1, password_hash='-'):
+    """Clear previous load data and generate a fresh set; returns row counts and timings"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    timings = {}
+    clear(connection)
+    cursor = repository(connection).cursor()
+
+    started = time.perf_counter()
+    insert_chunked(cursor, '''
+        INSERT INTO users (username, email, password, phone)
+        VALUES (%s, %s, %s, %s)
+    ''', [(f'{LOAD_USER_PREFIX}{n:06d}', f'{LOAD_USER_PREFIX}{n:06d}@example.com', password_hash,
+           f'555{rng.randint(1000000, 9999999)}') for n in range(1, users + 1)])
+    cursor.execute('SELECT id FROM users WHERE SUBSTR(username, 1, %s) = %s ORDER BY id',
+                   (len(LOAD_USER_PREFIX), LOAD_USER_PREFIX))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    timings['users'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    insert_chunked(cursor, '''
+        INSERT INTO parking_lots (name, location, price_per_hour)
+        VALUES (%s, %s, %s)
+    ''', [(f'Load Lot {n}', LOAD_LOCATION, rng.choice([1.5, 2, 2.5, 3, 3.5, 4, 5, 6, 8, 10]))
+          for n in range(1, lots + 1)])
+    cursor.execute('SELECT id, price_per_hour FROM parking_lots WHERE location = %s ORDER BY id',
+                   (LOAD_LOCATION,))
+    lot_prices = dict(cursor.fetchall())
+    lot_ids = list(lot_prices)
+
+    slot_rows = []
+    for lot_id in lot_ids:
+        slot_rows.extend((lot_id, number, 'vacant') for number in range(1, rng.randint(*slots) + 1))
+    insert_chunked(cursor, '''
+        INSERT INTO parking_slots (parking_lot_id, slot_number, status)
+        VALUES (%s, %s, %s)
+    ''', slot_rows)
+    cursor.execute('''
+        SELECT ps.id, ps.parking_lot_id
+        FROM parking_slots ps
+        JOIN parking_lots p ON ps.parking_lot_id = p.id
+        WHERE p.location = %s
+        ORDER BY ps.id
+    ''', (LOAD_LOCATION,))
+    lot_slots = {lot_id: [] for lot_id in lot_ids}
+    for slot_id, lot_id in cursor.fetchall():
+        lot_slots[lot_id].append(slot_id)
+    timings['lots_and_slots'] = time.perf_counter() - started
+
+    # Booking history: popular lots and frequent users get most of it
+    started = time.perf_counter()
+    history_lots = rng.choices(lot_ids, skewed_weights(len(lot_ids), 0.8), k=bookings)
+    history_users = rng.choices(user_ids, skewed_weights(len(user_ids), 0.7), k=bookings)
+    durations = rng.choices(list(DURATION_WEIGHTS), list(DURATION_WEIGHTS.values()), k=bookings)
+    vehicle_types = rng.choices(list(VEHICLE_TYPE_WEIGHTS), list(VEHICLE_TYPE_WEIGHTS.values()), k=bookings)
+    rows = []
+    for lot_id, user_id, hours, vehicle_type, start in zip(history_lots, history_users, durations,
+                                                           vehicle_types, start_times(rng, bookings, days, now)):
+        price = lot_prices[lot_id]
+        end = start + timedelta(hours=hours)
+        if rng.random() < CANCELLED_SHARE:
+            status = 'cancelled'
+            actual_end = start + timedelta(minutes=rng.randint(1, hours * 60))
+        else:
+            status = 'completed'
+            # The expiry worker settles a booking shortly after it ends
+            actual_end = end + timedelta(seconds=rng.randint(0, 90))
+        actual_end = min(actual_end, now)
+        rows.append((user_id, lot_id, rng.choice(lot_slots[lot_id]) if lot_slots[lot_id] else None,
+                     vehicle_number(rng), vehicle_type, start, end, start, actual_end,
+                     price * hours, price * billed_hours(start, actual_end), status, start))
+    insert_chunked(cursor, '''
+        INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                              start_time, end_time, actual_start_time, actual_end_time,
+                              estimated_cost, actual_cost, status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ''', rows)
+    timings['bookings'] = time.perf_counter() - started
+
+    # Bookings running right now on a share of every lot's slots
+    started = time.perf_counter()
+    rows = []
+    for lot_id in lot_ids:
+        for slot_id in rng.sample(lot_slots[lot_id], round(len(lot_slots[lot_id]) * occupancy)):
+            start = now - timedelta(minutes=rng.randint(0, 120))
+            hours = rng.choices(list(DURATION_WEIGHTS), list(DURATION_WEIGHTS.values()))[0]
+            end = max(start + timedelta(hours=hours), now + timedelta(minutes=rng.randint(5, 60)))
+            rows.append((rng.choice(user_ids), lot_id, slot_id, vehicle_number(rng),
+                         rng.choice(list(VEHICLE_TYPE_WEIGHTS)), start, end, start,
+                         lot_prices[lot_id] * hours, 'active', start))
+    insert_chunked(cursor, '''
+        INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                              start_time, end_time, actual_start_time, estimated_cost,
+                              status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ''', rows)
+    cursor.execute('''
+        SELECT b.id, b.slot_id
+        FROM bookings b
+        JOIN parking_lots p ON b.parking_lot_id = p.id
+        WHERE p.location = %s AND b.status = 'active'
+    ''', (LOAD_LOCATION,))
+    insert_chunked(cursor, '''
+        UPDATE parking_slots
+        SET status = 'booked', booking_id = %s
+        WHERE id = %s
+    ''', cursor.fetchall())
+    active_bookings = len(rows)
+    connection.commit()
+    cursor.close()
+    timings['active_bookings'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    repository(connection).rebuild_occupancy()
+    repository(connection).backfill_revenue()
+    timings['rollups'] = time.perf_counter() - started
+
+    return {
+        'users': len(user_ids),
+        'lots': len(lot_ids),
+        'slots': len(slot_rows),
+        'bookings': bookings,
+        'active_bookings': active_bookings,
+        'seconds': {step: round(seconds, 2) for step, seconds in timings.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--lots', type=int, default=50)
+    parser.add_argument('--slots', type=int, nargs=2, default=[20, 200], metavar=('MIN', 'MAX'),
+                        help='Range of slots per lot.')
+    parser.add_argument('--bookings', type=int, default=100000, help='Settled bookings in the history.')
+    parser.add_argument('--days', type=int, default=180, help='Days of booking history.')
+    parser.add_argument('--occupancy', type=float, default=0.3,
+                        help='Share of slots with a booking running now.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clear', action='store_true', help='Only remove previously generated data.')
+    args = parser.parse_args()
+
+    connection = connect()
+    if args.clear:
+        clear(connection)
+        print('Generated load test data removed.')
+    else:
+        # One hash for everybody: hashing each password would dominate the run
+        summary = generate(connection, args.users, args.lots, tuple(args.slots), args.bookings,
+                           args.days, args.occupancy, args.seed, generate_password_hash(LOAD_PASSWORD))
+        print(summary)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
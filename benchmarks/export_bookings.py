@@ -0,0 +1,106 @@
+"""Bookings CSV export: buffered rows vs. streaming from an unbuffered cursor.
+
+    python benchmarks/export_bookings.py --bookings 1000000
+    python benchmarks/export_bookings.py --reuse
+
+Seeds the booking history with datagen (unless --reuse keeps what is there), then
+exports every booking as CSV to /dev/null, plain and gzip-compressed, two ways:
+  * buffered: the admin bookings join read with fetchall, then encoded (what copying
+    /admin/bookings amounts to);
+  * streamed: Repository.export_bookings through export.csv_chunks, as the
+    /admin/bookings/export endpoint and `flask export-bookings` do.
+Each export runs in a fresh process. The peak RSS of that process is reported next to
+its RSS after importing the app and connecting, before the export started.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import connect, repository
+
+from datagen import generate
+from export import BOOKING_COLUMNS, csv_chunks
+
+
+def rss_kb():
+    """Peak resident memory of this process so far, in KB (Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def buffered_rows(repo):
+    cursor = repo.cursor()
+    cursor.execute('''
+        SELECT b.id, b.created_at, b.status, b.user_id, u.username, u.email,
+               b.parking_lot_id, p.name, ps.slot_number, b.vehicle_number, b.vehicle_type,
+               b.start_time, b.end_time, b.actual_start_time, b.actual_end_time,
+               b.estimated_cost, b.actual_cost
+        FROM bookings b
+        JOIN users u ON b.user_id = u.id
+        JOIN parking_lots p ON b.parking_lot_id = p.id
+        LEFT JOIN parking_slots ps ON b.slot_id = ps.id
+        ORDER BY b.id
+    ''')
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def run_export(mode, compress):
+    """Export once in this process and print the result as JSON"""
+    connection = connect()
+    repo = repository(connection)
+    baseline = rss_kb()
+    started = time.perf_counter()
+    rows = buffered_rows(repo) if mode == 'buffered' else repo.export_bookings({})
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    written = 0
+    with open(os.devnull, 'wb') as output:
+        for chunk in csv_chunks(BOOKING_COLUMNS, counted(rows), compress):
+            output.write(chunk)
+            written += len(chunk)
+    seconds = time.perf_counter() - started
+    print(json.dumps({'rows': count, 'seconds': seconds, 'bytes': written,
+                      'start_rss_kb': baseline, 'peak_rss_kb': rss_kb()}))
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--reuse', action='store_true', help='Export the bookings already in the database.')
+    parser.add_argument('--run', choices=['buffered', 'streamed'], help=argparse.SUPPRESS)
+    parser.add_argument('--gzip', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_export(args.run, args.gzip)
+        return
+
+    if not args.reuse:
+        connection = connect()
+        print(generate(connection, users=5000, lots=200, bookings=args.bookings))
+        connection.close()
+
+    print(f'{"mode":<10} {"format":<6} {"rows":>9} {"seconds":>8} {"rows/s":>9} {"MB out":>7} {"start RSS":>10} {"peak RSS":>10}')
+    for compress in (False, True):
+        for mode in ('buffered', 'streamed'):
+            command = [sys.executable, __file__, '--run', mode] + (['--gzip'] if compress else [])
+            result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+            print(f'{mode:<10} {"gzip" if compress else "csv":<6} {result["rows"]:>9} {result["seconds"]:>8.2f} '
+                  f'{result["rows"] / result["seconds"]:>9.0f} {result["bytes"] / 2 ** 20:>7.1f} '
+                  f'{result["start_rss_kb"] / 1024:>8.1f}MB {result["peak_rss_kb"] / 1024:>8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
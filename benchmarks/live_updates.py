@@ -0,0 +1,109 @@
+"""Fan-out of live slot updates to many idle Server-Sent Events subscribers.
+
+    python benchmarks/live_updates.py --subscribers 100 1000 5000 --lots 1 50 --events 50
+
+For every subscriber count the script opens that many streams on one broker, spread
+evenly over --lots lots, with one thread per stream like a gthread worker. It then
+publishes --events events to the first lot and reports:
+  * memory per idle subscriber (Python objects, not counting thread stacks);
+  * how long it took from publishing an event until every subscriber of that lot had
+    it, and the p50/p99 delivery latency per subscriber;
+  * how many streams woke up for it, which should only be the subscribers of that lot.
+
+The database is not involved: events are handed straight to SlotEventBroker.publish,
+which is what the poller does with each row it reads from slot_events.
+"""
+import argparse
+import json
+import threading
+import time
+import tracemalloc
+
+from common import app
+
+from live_updates import SlotEventBroker
+
+
+class Subscriber(threading.Thread):
+    def __init__(self, broker, lot_id, ready):
+        super().__init__(daemon=True)
+        self.stream = broker.subscribe(lot_id, broker.position(), heartbeat=3600)
+        self.ready = ready
+        self.latencies = []
+        self.wakeups = 0
+
+    def run(self):
+        next(self.stream)  # retry hint
+        self.ready.release()
+        for chunk in self.stream:
+            received = time.perf_counter()
+            self.wakeups += 1
+            for message in chunk.split('\n\n'):
+                if message.startswith('id:'):
+                    sent = json.loads(message.split('data: ', 1)[1])['sent']
+                    self.latencies.append(received - sent)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(subscribers, lots, events):
+    broker = SlotEventBroker(app, None)
+    ready = threading.Semaphore(0)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    threads = [Subscriber(broker, 1 + n % lots, ready) for n in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        ready.acquire()
+    time.sleep(0.2)  # let every stream block in its wait
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_subscriber = sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / subscribers
+
+    listeners = [thread for n, thread in enumerate(threads) if n % lots == 0]
+    fan_out = []
+    for sequence in range(events):
+        started = time.perf_counter()
+        broker.publish(1, {'slot_id': sequence, 'status': 'vacant', 'sent': started})
+        while any(len(thread.latencies) <= sequence for thread in listeners):
+            time.sleep(0.0005)
+        fan_out.append(time.perf_counter() - started)
+
+    latencies = [latency for thread in listeners for latency in thread.latencies]
+    woken = sum(1 for thread in threads if thread.wakeups)
+    broker.stop()
+    return {
+        'per_subscriber_kb': per_subscriber / 1024,
+        'fan_out_ms': sum(fan_out) / len(fan_out) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'listeners': len(listeners),
+        'woken': woken
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--lots', type=int, nargs='+', default=[1, 50])
+    parser.add_argument('--events', type=int, default=50)
+    args = parser.parse_args()
+
+    # Idle streams mostly sit in a wait; a small stack keeps thousands of threads cheap
+    threading.stack_size(256 * 1024)
+    print(f'{"subscribers":>11} {"lots":>5} {"KB/sub":>7} {"fan-out":>10} {"p50":>9} {"p99":>9} {"woken":>13}')
+    for subscribers in args.subscribers:
+        for lots in args.lots:
+            result = run(subscribers, lots, args.events)
+            print(f'{subscribers:>11} {lots:>5} {result["per_subscriber_kb"]:>7.1f} '
+                  f'{result["fan_out_ms"]:>8.2f}ms {result["p50_ms"]:>7.2f}ms {result["p99_ms"]:>7.2f}ms '
+                  f'{result["woken"]:>6} of {subscribers:<5}')
+
+
+if __name__ == '__main__':
+    main()
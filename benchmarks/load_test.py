@@ -0,0 +1,320 @@
+"""End-to-end load test: a mixed workload of users and admins against the Flask app.
+
+    python benchmarks/datagen.py --users 2000 --lots 100 --bookings 500000
+    python benchmarks/load_test.py --users 32 --admins 4 --duration 60
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 64 --duration 120
+    python benchmarks/load_test.py --compare results/load-before.json results/load-after.json
+
+Each virtual user logs in as one of the generated 'load_user_NNNNNN' accounts. It then
+keeps picking actions from the user mix below: dashboard, booking page, booking,
+my-bookings, cancellation and now and then logging in again. Virtual admins browse
+the admin pages instead. Without --url every client runs in-process through
+app.test_client(). With --url it talks HTTP to a running server, for example
+`gunicorn -w 4 app:app`.
+
+Latency is recorded per route (ids in paths are folded), redirects are not followed,
+and any 5xx response or exception counts as an error. The report shows throughput
+and p50/p95/p99 latency per route. It is also written as JSON under
+benchmarks/results/ (or --output) so runs can be compared with --compare.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from common import app, connect, repository
+
+from datagen import LOAD_LOCATION, LOAD_PASSWORD, LOAD_USER_PREFIX
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+USER_MIX = {
+    'dashboard': 30,
+    'book_page': 15,
+    'book': 12,
+    'my_bookings': 25,
+    'cancel': 8,
+    'login': 5,
+}
+
+ADMIN_MIX = {
+    'admin_dashboard': 35,
+    'admin_bookings': 30,
+    'admin_bookings_filtered': 15,
+    'admin_slots': 20,
+}
+
+
+class TestClientSession:
+    """One in-process browser session through Flask's test client"""
+
+    def __init__(self, base_url=None):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One browser session against a running server, with its own cookie jar"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, body, method=method)) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read().decode(errors='replace')
+
+
+class Recorder:
+    """Latency samples and error counts per route, shared by all virtual clients"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, error=False):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if error:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class VirtualClient:
+    """Runs one user's or admin's actions until the deadline"""
+
+    def __init__(self, session, recorder, rng, lot_ids):
+        self.session = session
+        self.recorder = recorder
+        self.rng = rng
+        self.lot_ids = lot_ids
+        self.cancellable = []
+
+    def call(self, route, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, data)
+        except Exception:
+            self.recorder.record(route, time.perf_counter() - started, error=True)
+            return None
+        self.recorder.record(route, time.perf_counter() - started, error=status >= 500)
+        return body
+
+    def run(self, mix, deadline):
+        actions = list(mix)
+        weights = list(mix.values())
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+
+    # User actions
+
+    def login(self):
+        self.session.request('GET', '/logout')
+        username = f'{LOAD_USER_PREFIX}{self.rng.randint(1, self.user_count):06d}'
+        self.call('POST /login', 'POST', '/login', {'username': username, 'password': LOAD_PASSWORD})
+        self.cancellable = []
+
+    def dashboard(self):
+        self.call('GET /dashboard', 'GET', '/dashboard')
+
+    def book_page(self):
+        self.call('GET /book-slot/<lot_id>', 'GET', f'/book-slot/{self.rng.choice(self.lot_ids)}')
+
+    def book(self):
+        self.call('POST /book-slot/<lot_id>', 'POST', f'/book-slot/{self.rng.choice(self.lot_ids)}', {
+            'vehicle_number': f'LT{self.rng.randint(1000, 9999)}',
+            'vehicle_type': 'car',
+            'hours': self.rng.randint(1, 4),
+            'slot_id': 'any'
+        })
+
+    def my_bookings(self):
+        body = self.call('GET /my-bookings', 'GET', '/my-bookings')
+        if body:
+            self.cancellable = re.findall(r'/cancel-booking/(\d+)', body)
+
+    def cancel(self):
+        if not self.cancellable:
+            return self.my_bookings()
+        booking_id = self.cancellable.pop(self.rng.randrange(len(self.cancellable)))
+        self.call('GET /cancel-booking/<id>', 'GET', f'/cancel-booking/{booking_id}')
+
+    # Admin actions
+
+    def admin_login(self):
+        self.call('POST /admin/login', 'POST', '/admin/login', {'username': 'admin', 'password': 'admin123'})
+
+    def admin_dashboard(self):
+        self.call('GET /admin/dashboard', 'GET', '/admin/dashboard')
+
+    def admin_bookings(self):
+        self.call('GET /admin/bookings', 'GET', '/admin/bookings')
+
+    def admin_bookings_filtered(self):
+        status = self.rng.choice(['active', 'completed', 'cancelled'])
+        self.call('GET /admin/bookings?status&lot_id', 'GET',
+                  f'/admin/bookings?status={status}&lot_id={self.rng.choice(self.lot_ids)}')
+
+    def admin_slots(self):
+        self.call('GET /admin/parking-slots/<lot_id>', 'GET',
+                  f'/admin/parking-slots/{self.rng.choice(self.lot_ids)}')
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_samples[max(0, math.ceil(fraction * len(sorted_samples)) - 1)]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        routes[route] = {
+            'requests': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'throughput': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+            'max_ms': round(samples[-1] * 1000, 2)
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return routes, {
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'throughput': round(total / elapsed, 2)
+    }
+
+
+def print_report(result):
+    print(f'{"route":<38} {"requests":>9} {"errors":>7} {"req/s":>8} '
+          f'{"p50":>9} {"p95":>9} {"p99":>9}')
+    for route, stats in result['routes'].items():
+        print(f'{route:<38} {stats["requests"]:>9} {stats["errors"]:>7} {stats["throughput"]:>8.1f} '
+              f'{stats["p50_ms"]:>7.1f}ms {stats["p95_ms"]:>7.1f}ms {stats["p99_ms"]:>7.1f}ms')
+    total = result['total']
+    print(f'{"total":<38} {total["requests"]:>9} {total["errors"]:>7} {total["throughput"]:>8.1f}')
+
+
+def compare(before_path, after_path):
+    """Print the change in throughput and p95 per route between two saved runs"""
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    print(f'{"route":<38} {"req/s before":>13} {"after":>9} {"p95 before":>12} {"after":>10} {"change":>8}')
+    for route in sorted(set(before['routes']) | set(after['routes'])):
+        old, new = before['routes'].get(route), after['routes'].get(route)
+        if not old or not new:
+            print(f'{route:<38} only in {"after" if new else "before"}')
+            continue
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+        print(f'{route:<38} {old["throughput"]:>13.1f} {new["throughput"]:>9.1f} '
+              f'{old["p95_ms"]:>10.1f}ms {new["p95_ms"]:>8.1f}ms {change:>+7.1f}%')
+
+
+def load_fixture():
+    """Ids of the generated lots and the number of generated users"""
+    connection = connect()
+    cursor = repository(connection).cursor()
+    cursor.execute('SELECT id FROM parking_lots WHERE location = %s AND deleted_at IS NULL',
+                   (LOAD_LOCATION,))
+    lot_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT COUNT(*) FROM users WHERE SUBSTR(username, 1, %s) = %s',
+                   (len(LOAD_USER_PREFIX), LOAD_USER_PREFIX))
+    user_count = cursor.fetchone()[0]
+    cursor.close()
+    connection.close()
+    return lot_ids, user_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users.')
+    parser.add_argument('--admins', type=int, default=2, help='Concurrent virtual admins.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run.')
+    parser.add_argument('--url', help='Base URL of a running server instead of the test client.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON file for the results.')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two saved result files and exit.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    lot_ids, user_count = load_fixture()
+    if not lot_ids or not user_count:
+        parser.error('no load test data, run benchmarks/datagen.py first')
+
+    session_class = HttpSession if args.url else TestClientSession
+    recorder = Recorder()
+    clients = []
+    for number in range(args.users + args.admins):
+        client = VirtualClient(session_class(args.url), recorder, random.Random(args.seed + number), lot_ids)
+        client.user_count = user_count
+        clients.append((client, USER_MIX if number < args.users else ADMIN_MIX))
+
+    # Everybody logs in first; those requests are part of the report
+    for client, mix in clients:
+        if mix is USER_MIX:
+            client.login()
+        else:
+            client.admin_login()
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=client.run, args=(mix, deadline)) for client, mix in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    routes, total = summarize(recorder, elapsed)
+    result = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': args.url or 'test_client',
+        'backend': app.config['DB_BACKEND'],
+        'users': args.users,
+        'admins': args.admins,
+        'duration_seconds': round(elapsed, 2),
+        'lots': len(lot_ids),
+        'routes': routes,
+        'total': total
+    }
+    print_report(result)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f'load-{datetime.now():%Y%m%d-%H%M%S}.json')
+    with open(output, 'w') as result_file:
+        json.dump(result, result_file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
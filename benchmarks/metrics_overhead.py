@@ -0,0 +1,82 @@
+"""Cost of the request and query instrumentation behind /metrics.
+
+    python benchmarks/metrics_overhead.py --iterations 20000
+
+Reports, in microseconds per call:
+  * recording one request or query timing, and fingerprinting a statement the first
+    time (cache miss) and again (cache hit);
+  * repository queries (find_user, lot_stats) over plain and over timed cursors;
+  * a full GET /dashboard through the test client with query timing switched off and
+    on. The request hooks run in both cases; their cost is the first line.
+"""
+import argparse
+import time
+
+from common import app, cleanup, connect, create_lots, create_user
+
+from metrics import Metrics, fingerprint
+from repository import create_repository
+
+
+def per_call(function, iterations):
+    """Best-of-3 average microseconds per call of ``function``"""
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        elapsed = (time.perf_counter() - started) / iterations * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(label, plain, timed):
+    overhead = (timed - plain) / plain * 100 if plain else 0
+    print(f'{label:<28} {plain:>10.1f} us {timed:>10.1f} us {overhead:>+8.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000, help='Calls per measurement.')
+    parser.add_argument('--requests', type=int, default=2000, help='Dashboard requests per measurement.')
+    parser.add_argument('--lots', type=int, default=50, help='Benchmark lots on the dashboard.')
+    args = parser.parse_args()
+
+    metrics = Metrics(slow_query_seconds=float('inf'))
+    query = f'SELECT * FROM parking_lots WHERE location = %s AND id IN ({", ".join(["%s"] * 20)})'
+    counter = iter(range(10 ** 9))
+    print(f'{"observe_request":<28} {per_call(lambda: metrics.observe_request("user_dashboard", "GET", 200, 0.004), args.iterations):>10.2f} us')
+    print(f'{"observe_query (cached)":<28} {per_call(lambda: metrics.observe_query(query, 0.0007), args.iterations):>10.2f} us')
+    print(f'{"fingerprint (cache miss)":<28} {per_call(lambda: fingerprint(query + f" LIMIT {next(counter)}"), args.iterations):>10.2f} us')
+    print(f'{"fingerprint (cache hit)":<28} {per_call(lambda: fingerprint(query), args.iterations):>10.2f} us')
+    print()
+
+    connection = connect()
+    cleanup(connection)
+    user_id = create_user(connection)
+    create_lots(connection, args.lots)
+    backend = app.config['DB_BACKEND']
+    plain = create_repository(backend, connection)
+    timed = create_repository(backend, connection, metrics.timed_cursor)
+    print(f'{"":<28} {"plain":>13} {"timed":>13} {"overhead":>9}')
+    report('find_user', per_call(lambda: plain.find_user('bench_user'), args.iterations),
+           per_call(lambda: timed.find_user('bench_user'), args.iterations))
+    report(f'lot_stats ({args.lots} lots)', per_call(plain.lot_stats, args.iterations // 10),
+           per_call(timed.lot_stats, args.iterations // 10))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(logged_in=True, user_id=user_id, username='bench_user', user_type='user')
+    installed = app.extensions.pop('metrics', None)
+    untimed = per_call(lambda: client.get('/dashboard'), args.requests)
+    app.extensions['metrics'] = installed or metrics
+    report('GET /dashboard', untimed, per_call(lambda: client.get('/dashboard'), args.requests))
+    if installed is None:
+        app.extensions.pop('metrics')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Nearest lots with room: scanning every lot vs. the in-memory k-d tree index.
+
+    python benchmarks/nearest_lots.py --lots 50000 --queries 200
+
+The script creates --lots benchmark lots scattered over a 90 km wide city, densest in
+the middle, and gives each lot a vacancy count in lot_occupancy; --full of them have
+no free slot. For N nearest lots with at least K free slots it then reports the
+mean time per search of:
+  * a scan: every lot with K free slots read with its coordinates, distances computed
+    for all of them and the N smallest kept;
+  * the index (nearby.NearbyLots): a best-first walk of the cached tree, with the
+    vacancy of only the nearest candidates read back by id.
+Both must return the same lots for every search. The index's build time and size
+are printed as well.
+"""
+import argparse
+import heapq
+import random
+import time
+
+from common import BENCH_LOCATION, cleanup, connect, repository
+
+from nearby import LotIndex, NearbyLots, distance_km
+
+CENTER = (40.7128, -74.0060)
+CHUNK_SIZE = 5000
+
+
+def create_lots(connection, lots, full_share, rng):
+    """Benchmark lots with coordinates and vacancy, without slot rows"""
+    cursor = repository(connection).cursor()
+    rows = []
+    for n in range(lots):
+        # Half the lots downtown, the rest spread over the city
+        spread = 0.05 if n % 2 else 0.4
+        rows.append((f'Bench Lot {n}', BENCH_LOCATION, 5,
+                     round(CENTER[0] + rng.uniform(-spread, spread), 6),
+                     round(CENTER[1] + rng.uniform(-spread, spread), 6)))
+    for offset in range(0, len(rows), CHUNK_SIZE):
+        cursor.executemany('''
+            INSERT INTO parking_lots (name, location, price_per_hour, latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', rows[offset:offset + CHUNK_SIZE])
+    cursor.execute('SELECT id FROM parking_lots WHERE location = %s', (BENCH_LOCATION,))
+    lot_ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    repository(connection).rebuild_occupancy()
+
+    counts = []
+    for lot_id in lot_ids:
+        total = rng.randint(20, 400)
+        vacant = 0 if rng.random() < full_share else rng.randint(1, total)
+        counts.append((total, vacant, total - vacant, lot_id))
+    for offset in range(0, len(counts), CHUNK_SIZE):
+        cursor.executemany('''
+            UPDATE lot_occupancy
+            SET total_slots = %s, vacant = %s, booked = %s
+            WHERE lot_id = %s
+        ''', counts[offset:offset + CHUNK_SIZE])
+    connection.commit()
+    cursor.close()
+    return lot_ids
+
+
+def scan_nearest(connection, latitude, longitude, limit, min_vacant):
+    rows = repository(connection)._fetchall('''
+        SELECT p.id, p.latitude, p.longitude
+        FROM lot_occupancy o
+        JOIN parking_lots p ON p.id = o.lot_id
+        WHERE p.deleted_at IS NULL AND p.latitude IS NOT NULL AND o.vacant >= %s
+    ''', (min_vacant,))
+    nearest = heapq.nsmallest(limit, ((distance_km(latitude, longitude, float(row['latitude']),
+                                                   float(row['longitude'])), row['id']) for row in rows))
+    return [lot_id for _, lot_id in nearest]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--full', type=float, default=0.6, help='Share of lots with no free slot.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    connection = connect()
+    cleanup(connection)
+    started = time.perf_counter()
+    create_lots(connection, args.lots, args.full, rng)
+    print(f'{args.lots} lots created in {time.perf_counter() - started:.1f}s')
+
+    coordinates = repository(connection).lot_coordinates()
+    started = time.perf_counter()
+    index = LotIndex(coordinates)
+    print(f'index of {len(index)} lots built in {(time.perf_counter() - started) * 1000:.0f}ms, '
+          f'{index.nbytes() / 1024:.0f} KB')
+
+    nearby = NearbyLots()
+    nearby.index(repository(connection))
+
+    def load(lot_ids):
+        return repository(connection).lot_stats('id', lot_ids=lot_ids)
+
+    points = [(CENTER[0] + rng.uniform(-0.4, 0.4), CENTER[1] + rng.uniform(-0.4, 0.4))
+              for _ in range(args.queries)]
+    print(f'{"N":>3} {"K":>3} {"scan":>10} {"index":>10} {"rows read":>10}')
+    for limit, min_vacant in ((1, 1), (10, 1), (10, 50), (50, 1)):
+        scan_seconds = index_seconds = 0
+        rows_before = nearby.rows_read
+        for latitude, longitude in points:
+            started = time.perf_counter()
+            expected = scan_nearest(connection, latitude, longitude, limit, min_vacant)
+            scan_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            found = nearby.nearest(repository(connection), load, latitude, longitude, limit, min_vacant)
+            index_seconds += time.perf_counter() - started
+            assert [lot['id'] for lot in found] == expected, (latitude, longitude, limit, min_vacant)
+        print(f'{limit:>3} {min_vacant:>3} {scan_seconds / args.queries * 1000:>8.2f}ms '
+              f'{index_seconds / args.queries * 1000:>8.2f}ms '
+              f'{(nearby.rows_read - rows_before) / args.queries:>10.0f}')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Occupancy heatmaps: interval scans of bookings vs. the sampled occupancy ring.
+
+    python benchmarks/occupancy_history.py --lots 200 --bookings 20000
+
+The script creates --lots benchmark lots with --bookings settled bookings each over
+the last year, and writes a year of occupancy samples for every lot straight into
+occupancy_history (one page per lot and day, with a weekday rush-hour pattern). It
+then reports:
+  * one sampler tick over all the lots;
+  * storage per lot-year, in the database and in memory;
+  * the hour-of-week heatmap of one lot over 4 and 52 weeks, computed from the
+    bookings overlapping each hour vs. loaded from the ring;
+  * the peak occupancy of one lot over the year from the ring.
+"""
+import argparse
+import math
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+import app as parking_app
+from occupancy_history import DAY, OccupancySampler, SCALE, encode, seconds
+
+CHUNK_SIZE = 2000
+
+
+def write_history(connection, lot_ids, interval, days, rng):
+    """A year of samples per lot: busy weekday daytimes, quiet nights and weekends"""
+    page_size = DAY // interval
+    today = seconds(datetime.now()) // DAY
+    cursor = repository(connection).cursor()
+    rows = []
+    for lot_id in lot_ids:
+        scale = rng.uniform(0.5, 1)
+        for day in range(today - days + 1, today + 1):
+            level = scale * (0.3 if (day + 3) % 7 >= 5 else 1)
+            samples = array('H')
+            for position in range(page_size):
+                # Rises from 6:00, peaks around 13:00, falls off by 20:00
+                daytime = max(0.05, math.sin(math.pi * (position * interval / 3600 - 6) / 14))
+                samples.append(1 + min(SCALE, int(SCALE * level * daytime * rng.uniform(0.8, 1))))
+            rows.append((day % days, lot_id, day, interval, encode(samples)))
+            if len(rows) == CHUNK_SIZE:
+                cursor.executemany('''
+                    INSERT INTO occupancy_history (page, lot_id, day, sample_interval, samples)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', rows)
+                rows = []
+    if rows:
+        cursor.executemany('''
+            INSERT INTO occupancy_history (page, lot_id, day, sample_interval, samples)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', rows)
+    connection.commit()
+    cursor.close()
+
+
+def heatmap_from_bookings(connection, lot_id, since, until):
+    """Mean share of the lot booked per hour of the week, from the bookings that
+    overlap each hour"""
+    total = repository(connection).slot_counts([lot_id])[lot_id]['total']
+    rows = repository(connection)._fetchall('''
+        SELECT actual_start_time, actual_end_time FROM bookings
+        WHERE parking_lot_id = %s AND actual_start_time < %s AND actual_end_time > %s
+    ''', (lot_id, until, since))
+    booked = {}
+    for row in rows:
+        start, end = row['actual_start_time'], row['actual_end_time']
+        if isinstance(start, str):
+            start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        start, end = max(start, since), min(end, until)
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            overlap = (min(end, hour + timedelta(hours=1)) - max(start, hour)).total_seconds()
+            booked[hour] = booked.get(hour, 0) + overlap / 3600
+            hour += timedelta(hours=1)
+    sums, counts = [0.0] * 168, [0] * 168
+    hour = since.replace(minute=0, second=0, microsecond=0)
+    while hour < until:
+        hour_of_week = hour.weekday() * 24 + hour.hour
+        sums[hour_of_week] += booked.get(hour, 0) / total
+        counts[hour_of_week] += 1
+        hour += timedelta(hours=1)
+    return [sums[hour] / counts[hour] if counts[hour] else None for hour in range(168)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=100, help='Slots per lot.')
+    parser.add_argument('--bookings', type=int, default=20000, help='Settled bookings per lot.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    config = parking_app.app.config
+    interval, days = config['OCCUPANCY_SAMPLE_INTERVAL'], config['OCCUPANCY_HISTORY_DAYS']
+    rng = random.Random(args.seed)
+    connection = connect()
+    cleanup(connection)
+    user_id = create_user(connection)
+    started = time.perf_counter()
+    lot_ids = create_lots(connection, args.lots, slots_per_lot=args.slots,
+                          bookings_per_lot=args.bookings, user_id=user_id)
+    write_history(connection, lot_ids, interval, days, rng)
+    print(f'{args.lots} lots, {args.bookings} bookings and {days} days of samples each, '
+          f'created in {time.perf_counter() - started:.0f}s')
+
+    sampler = OccupancySampler(parking_app.app, parking_app.get_repository, interval, days)
+    with parking_app.app.app_context():
+        # Every tick lands on an empty position: walk back one interval per run
+        moments = iter(datetime.now() - timedelta(seconds=interval * n) for n in range(1, 100))
+        tick_ms = timed(lambda: sampler.run_once(next(moments)))
+    print(f'sampler tick over {args.lots} lots: {tick_ms:.1f}ms')
+
+    lot_id = lot_ids[0]
+    stored = repository(connection)._fetchone('''
+        SELECT COUNT(*) as pages, SUM(LENGTH(samples)) as sample_bytes FROM occupancy_history WHERE lot_id = %s
+    ''', (lot_id,))
+    now = datetime.now()
+    with parking_app.app.app_context():
+        ring = sampler.ring(lot_id)
+    print(f'per lot-year: {stored["pages"]} pages, {int(stored["sample_bytes"]) / 1024:.0f} KB of samples stored, '
+          f'ring {ring.nbytes() / 1024:.0f} KB in memory ({DAY // interval} samples a day)')
+
+    print(f'{"weeks":>6} {"from bookings":>14} {"ring load":>10} {"heatmap":>9}')
+    for weeks in (4, 52):
+        since = now - timedelta(weeks=weeks)
+        bookings_ms = timed(lambda: heatmap_from_bookings(connection, lot_id, since, now), repeat=3)
+        with parking_app.app.app_context():
+            load_ms = timed(lambda: sampler.ring(lot_id, since))
+        heatmap_ms = timed(lambda: ring.heatmap(since, now))
+        print(f'{weeks:>6} {bookings_ms:>12.1f}ms {load_ms:>8.1f}ms {heatmap_ms:>7.1f}ms')
+
+    peak_ms = timed(lambda: ring.peak(now - timedelta(days=days), now))
+    moment, occupancy = ring.peak(now - timedelta(days=days), now)
+    print(f'peak over {days} days: {occupancy:.0%} at {moment:%Y-%m-%d %H:%M}, found in {peak_ms:.1f}ms')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Slot grids: full slot rows as dicts vs. the per-lot occupancy map.
+
+    python benchmarks/slot_map.py --slots 1000 5000 20000
+
+For every slot count the script creates one benchmark lot with every other slot held
+by an active booking, then reports the best-of-5 time and the Python memory of:
+  * the admin grid data: all slots LEFT JOINed with bookings and users (as before)
+    vs. the map plus booking details for one page of ADMIN_SLOTS_PAGE_SIZE slots;
+  * the booking page data: ``SELECT *`` of the vacant slots vs. the map;
+  * a nearest free slot lookup on the map.
+"Cold" builds the map from the database, "cached" reuses it after a version check.
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from common import cleanup, connect, create_lots, create_user, repository, timed
+
+import app as parking_app
+from occupancy import SlotMap, SlotMaps
+
+
+def admin_rows_before(connection, lot_id):
+    return repository(connection)._fetchall('''
+        SELECT ps.*, b.vehicle_number, b.vehicle_type,
+               b.start_time, b.end_time, u.username, u.email, u.phone
+        FROM parking_slots ps
+        LEFT JOIN bookings b ON ps.booking_id = b.id AND b.status = 'active'
+        LEFT JOIN users u ON b.user_id = u.id
+        WHERE ps.parking_lot_id = %s
+        ORDER BY ps.slot_number
+    ''', (lot_id,))
+
+
+def vacant_rows_before(connection, lot_id):
+    return repository(connection)._fetchall('''
+        SELECT * FROM parking_slots
+        WHERE parking_lot_id = %s AND status = 'vacant' AND deleted_at IS NULL
+        ORDER BY slot_number
+    ''', (lot_id,))
+
+
+def admin_rows_after(connection, slot_maps, lot_id, page_size):
+    slot_map = slot_maps.get(repository(connection), lot_id)
+    bookings = repository(connection).slot_bookings(lot_id, 1, page_size)
+    return slot_map, [dict(bookings.get(slot_number, {}), id=slot_id, slot_number=slot_number, status=status)
+                      for slot_number, slot_id, status in slot_map.slots(first=1, last=page_size)]
+
+
+def vacant_rows_after(connection, slot_maps, lot_id):
+    slot_map = slot_maps.get(repository(connection), lot_id)
+    return slot_map, [{'id': slot_id, 'slot_number': slot_number}
+                      for slot_number, slot_id, status in slot_map.slots('vacant')]
+
+
+def book_every_other_slot(connection, lot_id, user_id):
+    cursor = repository(connection).cursor()
+    cursor.execute('''
+        SELECT id FROM parking_slots
+        WHERE parking_lot_id = %s AND slot_number %% 2 = 0
+    ''', (lot_id,))
+    start = datetime.now()
+    end = start + timedelta(hours=2)
+    cursor.executemany('''
+        INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                              start_time, end_time, estimated_cost, status, actual_start_time)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ''', [(user_id, lot_id, row[0], 'BENCH', 'car', start, end, 10, 'active', start)
+          for row in cursor.fetchall()])
+    cursor.execute('''
+        UPDATE parking_slots
+        SET status = 'booked',
+            booking_id = (SELECT b.id FROM bookings b
+                          WHERE b.slot_id = parking_slots.id AND b.status = 'active')
+        WHERE parking_lot_id = %s AND slot_number %% 2 = 0
+    ''', (lot_id,))
+    connection.commit()
+    cursor.close()
+    repository(connection).rebuild_occupancy()
+
+
+def allocated_kb(build):
+    """Python memory held by the result of ``build()``, in KB"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return held / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, nargs='+', default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    page_size = parking_app.app.config['ADMIN_SLOTS_PAGE_SIZE']
+    connection = connect()
+    print(f'{"slots":>7} {"view":<8} {"rows":>10} {"map cold":>10} {"map cached":>11} '
+          f'{"rows KB":>9} {"map KB":>8}')
+    for slots in args.slots:
+        cleanup(connection)
+        user_id = create_user(connection)
+        lot_id = create_lots(connection, 1, slots_per_lot=slots)[0]
+        book_every_other_slot(connection, lot_id, user_id)
+
+        views = (
+            ('admin', lambda: admin_rows_before(connection, lot_id),
+             lambda maps: admin_rows_after(connection, maps, lot_id, page_size)),
+            ('booking', lambda: vacant_rows_before(connection, lot_id),
+             lambda maps: vacant_rows_after(connection, maps, lot_id)),
+        )
+        for label, before, after in views:
+            rows_ms = timed(before)
+            cold_ms = timed(lambda: after(SlotMaps()))
+            cached = SlotMaps()
+            after(cached)
+            cached_ms = timed(lambda: after(cached))
+            rows_kb = allocated_kb(before)
+            map_kb = allocated_kb(lambda: after(SlotMaps()))
+            print(f'{slots:>7} {label:<8} {rows_ms:>8.2f}ms {cold_ms:>8.2f}ms {cached_ms:>9.2f}ms '
+                  f'{rows_kb:>9.0f} {map_kb:>8.0f}')
+
+        slot_map = SlotMap(lot_id, 0, repository(connection).slot_map_rows(lot_id))
+        started = time.perf_counter()
+        for slot_number in range(2, slots + 1, 2):
+            slot_map.nearest_free(slot_number)
+        per_lookup = (time.perf_counter() - started) / (slots // 2) * 1e6
+        print(f'{slots:>7} nearest free slot: {per_lookup:.2f}us per lookup, map {slot_map.nbytes() / 1024:.0f} KB')
+
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Slot creation: one INSERT per slot vs. chunked multi-row inserts.
+
+    python benchmarks/slot_provisioning.py --slots 100 1000 10000
+
+Each size is created in a benchmark lot twice, once with the old per-slot loop and
+once through the repository's add_slots(), committing at the end like
+add_parking_lot() does. The gap is in round trips to the server: on SQLite, which
+runs in-process, both take about the same time.
+"""
+import argparse
+import time
+
+from common import cleanup, connect, create_lots, repository
+
+
+def loop_insert(connection, lot_id, count):
+    cursor = repository(connection).cursor()
+    for slot_number in range(1, count + 1):
+        cursor.execute('''
+            INSERT INTO parking_slots (parking_lot_id, slot_number, status)
+            VALUES (%s, %s, 'vacant')
+        ''', (lot_id, slot_number))
+    connection.commit()
+    cursor.close()
+
+
+def batched_insert(connection, lot_id, count):
+    repository(connection).add_slots(lot_id, count)
+
+
+def clear_slots(connection, lot_id):
+    cursor = repository(connection).cursor()
+    cursor.execute('DELETE FROM parking_slots WHERE parking_lot_id = %s', (lot_id,))
+    connection.commit()
+    cursor.close()
+
+
+def measure(function, connection, lot_id, count):
+    clear_slots(connection, lot_id)
+    started = time.perf_counter()
+    function(connection, lot_id, count)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    connection = connect()
+    cleanup(connection)
+    lot_id = create_lots(connection, 1, slots_per_lot=0)[0]
+    print(f'{"slots":>8} {"loop":>12} {"batched":>12} {"speedup":>8}')
+    for count in args.slots:
+        loop = measure(loop_insert, connection, lot_id, count)
+        batched = measure(batched_insert, connection, lot_id, count)
+        print(f'{count:>8} {loop:>10.1f}ms {batched:>10.1f}ms {loop / batched:>7.1f}x')
+    cleanup(connection)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
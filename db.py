@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+
+from flask import current_app, g
+
+from repository import connect_sqlite, create_repository
+
+
+class PoolTimeout(Exception):
+    """Raised when no database connection became free within the checkout timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of database connections shared by the threads of one process.
+
+    Idle connections are handed out most-recently-used first. A connection that has
+    been idle longer than ``ping_after`` seconds is pinged before reuse, and one older
+    than ``recycle`` seconds is closed and replaced, so connections dropped by the
+    server (wait_timeout, restarts) never reach a request. Either check is skipped when
+    set to None, as it is for SQLite.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=5, recycle=3600, ping_after=30):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = []  # (connection, created_at, last_used_at)
+        self._created_at = {}
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.created = 0
+        self.recycled = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._condition:
+            waited = False
+            while not self._idle and self._in_use >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s '
+                                      f'({self._in_use} of {self.max_size} in use)')
+                self._condition.wait(remaining)
+
+            wait = time.monotonic() - started
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            idle = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            return self._prepare(idle)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def _prepare(self, idle):
+        """Return a healthy connection, reusing ``idle`` when it still is one"""
+        now = time.monotonic()
+        if idle is not None:
+            connection, created_at, last_used_at = idle
+            if self.recycle is not None and now - created_at > self.recycle:
+                self._close(connection)
+                self.recycled += 1
+            elif self.ping_after is not None and now - last_used_at > self.ping_after:
+                try:
+                    connection.ping()
+                    return connection
+                except Exception:
+                    self._close(connection)
+                    self.recycled += 1
+            else:
+                return connection
+
+        connection = self.connect()
+        self._created_at[id(connection)] = now
+        self.created += 1
+        return connection
+
+    def release(self, connection, discard=False):
+        """Return a connection; any open transaction is rolled back first"""
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard:
+                self._close(connection)
+            else:
+                created_at = self._created_at.get(id(connection), time.monotonic())
+                self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def _close(self, connection):
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'recycled': self.recycled,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'total_wait_seconds': round(self.wait_time, 4),
+                'max_wait_seconds': round(self.max_wait, 4)
+            }
+
+
+def pool_size(config):
+    """Connections per process: an explicit DB_POOL_SIZE, or DB_MAX_CONNECTIONS split
+    over the gunicorn workers (WEB_CONCURRENCY), at least 2"""
+    if config['DB_BACKEND'] == 'sqlite' and config['SQLITE_PATH'] == ':memory:':
+        # Each connection would be a database of its own, so everyone shares one
+        return 1
+    if config.get('DB_POOL_SIZE'):
+        return config['DB_POOL_SIZE']
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    return max(2, config['DB_MAX_CONNECTIONS'] // workers)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def connect(config):
+    """Open a new connection to the configured backend"""
+    if config['DB_BACKEND'] == 'sqlite':
+        return connect_sqlite(config['SQLITE_PATH'])
+    import MySQLdb
+    return MySQLdb.connect(host=config['MYSQL_HOST'], user=config['MYSQL_USER'],
+                           passwd=config['MYSQL_PASSWORD'], db=config['MYSQL_DB'],
+                           charset='utf8mb4')
+
+
+def get_pool():
+    """The pool of the current process, created on first use (and again after a fork,
+    so gunicorn workers never share sockets with the master)"""
+    global _pool, _pool_pid
+    config = current_app.config
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # SQLite connections never time out, and a ':memory:' one must not be replaced
+            server = config['DB_BACKEND'] == 'mysql'
+            _pool = ConnectionPool(lambda: connect(config), max_size=pool_size(config),
+                                   timeout=config['DB_POOL_TIMEOUT'],
+                                   recycle=config['DB_POOL_RECYCLE'] if server else None,
+                                   ping_after=config['DB_POOL_PING_AFTER'] if server else None)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def get_db():
+    """The database connection of the current app context, checked out on first use"""
+    if '_db' not in g:
+        if current_app.config['DB_POOL_ENABLED']:
+            g._db = get_pool().acquire()
+        else:
+            g._db = connect(current_app.config)
+    return g._db
+
+
+def get_repository():
+    """The repository of the current app context, over its pooled connection (with
+    timed cursors when metrics are enabled)"""
+    if '_repository' not in g:
+        metrics = current_app.extensions.get('metrics')
+        g._repository = create_repository(current_app.config['DB_BACKEND'], get_db(),
+                                          metrics.timed_cursor if metrics else None)
+    return g._repository
+
+
+def _connection_lost(exception):
+    """Whether a request failed because its MySQL connection broke"""
+    if exception is None or current_app.config['DB_BACKEND'] != 'mysql':
+        return False
+    import MySQLdb
+    return isinstance(exception, MySQLdb.OperationalError)
+
+
+def close_db(exception=None):
+    """Return the app context's connection to the pool (teardown handler)"""
+    g.pop('_repository', None)
+    connection = g.pop('_db', None)
+    if connection is None:
+        return
+    if current_app.config['DB_POOL_ENABLED']:
+        get_pool().release(connection, discard=_connection_lost(exception))
+    else:
+        connection.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,101 @@
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+
+class ExpiryScheduler:
+    """Background worker that settles bookings as soon as their end time passes.
+
+    Upcoming end times are kept in a min-heap so the worker sleeps until the next
+    known expiry instead of polling. The heap is refilled from the database every
+    ``max_sleep`` seconds to pick up bookings made by other processes.
+    """
+
+    def __init__(self, app, get_repository, batch_size=500, max_sleep=60, bulk=True):
+        self.app = app
+        self.get_repository = get_repository
+        self.batch_size = batch_size
+        self.bulk = bulk
+        self.max_sleep = max_sleep
+        self.processed = 0
+        # Callables invoked with the (booking_id, parking_lot_id, slot_id) tuples of
+        # every batch of bookings settled, after the batch has committed
+        self.listeners = []
+        self._heap = []
+        self._known = set()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Only a running loop drains the heap: until then schedule() keeps nothing
+        self._running = False
+
+    def schedule(self, booking_id, end_time):
+        """Register a new booking's end time and wake the worker if it is the earliest.
+        A no-op in processes that do not run the worker (EXPIRY_SCHEDULER = 'off')."""
+        with self._condition:
+            if not self._running or booking_id in self._known:
+                return
+            self._known.add(booking_id)
+            heapq.heappush(self._heap, (end_time, booking_id))
+            if self._heap[0][1] == booking_id:
+                self._condition.notify()
+
+    def start(self):
+        """Start the worker thread once per process"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='expiry-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify()
+
+    def run(self):
+        """Main loop: settle everything that is due, then sleep until the next expiry"""
+        self._running = True
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self._refill()
+                    self.run_once()
+            except Exception:
+                self.app.logger.exception('Expiry scheduler iteration failed')
+            self._wait()
+
+    def run_once(self):
+        """Settle all due bookings in batches of ``batch_size``"""
+        total = 0
+        while True:
+            settled = []
+            count = self.get_repository().settle_expired(self.batch_size, self.bulk, settled)
+            if settled:
+                for listener in self.listeners:
+                    listener(settled)
+            total += count
+            if count < self.batch_size:
+                break
+        self.processed += total
+        return total
+
+    def _refill(self):
+        """Load active bookings ending before the next forced wake-up into the heap"""
+        for booking_id, end_time in self.get_repository().upcoming_expiries(self.max_sleep):
+            self.schedule(booking_id, end_time)
+
+    def _wait(self):
+        with self._condition:
+            # Drop entries that are already due, the batch query has handled them
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                _, booking_id = heapq.heappop(self._heap)
+                self._known.discard(booking_id)
+
+            timeout = self.max_sleep
+            if self._heap:
+                until_next = (self._heap[0][0] - now + timedelta(seconds=1)).total_seconds()
+                timeout = max(0, min(timeout, until_next))
+            if not self._stopped.is_set():
+                self._condition.wait(timeout)
@@ -0,0 +1,43 @@
+"""CSV exports that stream: rows are encoded a chunk at a time as they are read, so
+memory stays flat however many rows there are."""
+import csv
+import io
+import zlib
+
+# Columns of the bookings export, in order (see Repository.export_bookings)
+BOOKING_COLUMNS = (
+    'id', 'created_at', 'status', 'user_id', 'username', 'email', 'parking_lot_id',
+    'parking_lot_name', 'slot_number', 'vehicle_number', 'vehicle_type', 'start_time',
+    'end_time', 'actual_start_time', 'actual_end_time', 'estimated_cost', 'actual_cost',
+)
+
+
+def csv_chunks(columns, rows, compress=False, rows_per_chunk=1000):
+    """Encode ``rows`` as CSV with a ``columns`` header, yielding bytes about every
+    ``rows_per_chunk`` rows; gzip-compressed when ``compress`` is set"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits 31: a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            pending = 0
+            data = flush()
+            if data:
+                yield data
+    data = flush()
+    if compressor:
+        data += compressor.flush()
+    if data:
+        yield data
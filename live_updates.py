@@ -0,0 +1,195 @@
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+
+class SlotEventBroker:
+    """Fans slot state changes out to the Server-Sent Events streams of one process.
+
+    Every write that changes a slot logs the slot's new state to ``slot_events`` in its
+    own transaction, whichever process made it (see Repository._log_slot_events). A
+    single thread per process polls that log every ``poll_interval`` seconds and
+    appends new events to a bounded buffer per lot. A subscriber is only a position in
+    its lot's buffer and a wait on that lot's condition, so idle streams cost no
+    polling and an event wakes just the streams of its own lot.
+
+    Positions look like ``<token>-<sequence>``. The token is random per process, so a
+    client that reconnects to another worker, or that fell further behind than its
+    lot's buffer reaches, gets a ``reset`` event telling it to reload the lot state.
+    """
+
+    def __init__(self, app, get_repository, poll_interval=1, buffer_size=256,
+                 retention_minutes=60, gap_timeout=30):
+        self.app = app
+        self.get_repository = get_repository
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.retention_minutes = retention_minutes
+        self.gap_timeout = gap_timeout
+        self.token = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._buffers = {}  # lot_id -> deque of (sequence, event text)
+        self._conditions = {}  # lot_id -> Condition on self._lock
+        self._evicted = {}  # lot_id -> sequence of the newest event pushed out of the buffer
+        self._sequence = 0
+        self._last_id = None
+        # Log ids skipped while polling, as {id: first seen missing}: a MySQL transaction
+        # can commit a lower id after a higher one has been read
+        self._gaps = {}
+        self._last_prune = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        self.subscribers = 0
+        self.published = 0
+        self.resets = 0
+
+    def start(self):
+        """Start polling once per process; call from inside an app context"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='slot-event-poller', daemon=True)
+        # Events logged from here on reach the streams, so pages rendered after start()
+        # miss nothing
+        try:
+            self._last_id = self.get_repository().last_slot_event_id()
+        except Exception:
+            with self._lock:
+                self._thread = None
+            raise
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for condition in self._conditions.values():
+                condition.notify_all()
+
+    def position(self):
+        """The current stream position, for a page to resume from once it has loaded"""
+        with self._lock:
+            return f'{self.token}-{self._sequence}'
+
+    def run(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception:
+                self.app.logger.exception('Polling slot events failed')
+
+    def poll(self):
+        """Publish the events logged since the last poll; returns how many"""
+        repository = self.get_repository()
+        now = time.monotonic()
+        rows = repository.slot_events_after(self._last_id, missing=list(self._gaps))
+        fresh = []
+        for row in rows:
+            if row['id'] > self._last_id:
+                # Concurrent commits are only ever a few ids apart; larger holes are ids
+                # the server reserved for multi-row INSERTs and never used
+                for missing in range(max(self._last_id + 1, row['id'] - 100), row['id']):
+                    self._gaps[missing] = now
+                self._last_id = row['id']
+            elif self._gaps.pop(row['id'], None) is None:
+                continue  # published already
+            fresh.append(row)
+        for event_id, since in list(self._gaps.items()):
+            if now - since > self.gap_timeout:
+                # Rolled back, or never coming
+                del self._gaps[event_id]
+
+        for row in fresh:
+            self.publish(row['lot_id'], {'slot_id': row['slot_id'], 'slot_number': row['slot_number'],
+                                         'status': row['status']})
+
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            repository.prune_slot_events(datetime.now() - timedelta(minutes=self.retention_minutes))
+        return len(fresh)
+
+    def publish(self, lot_id, event):
+        """Append an event to the lot's buffer and wake its subscribers"""
+        data = json.dumps(event, separators=(',', ':'))
+        with self._lock:
+            self._sequence += 1
+            buffer = self._buffers.get(lot_id)
+            if buffer is None:
+                buffer = self._buffers[lot_id] = deque(maxlen=self.buffer_size)
+            if len(buffer) == buffer.maxlen:
+                self._evicted[lot_id] = buffer[0][0]
+            buffer.append((self._sequence, f'id: {self.token}-{self._sequence}\ndata: {data}\n\n'))
+            self.published += 1
+            condition = self._conditions.get(lot_id)
+            if condition is not None:
+                condition.notify_all()
+
+    def _resume_from(self, lot_id, position):
+        """The sequence a client at ``position`` continues after, or None when it must reset"""
+        token, _, sequence = (position or '').partition('-')
+        if token != self.token or not sequence.isdigit() or int(sequence) > self._sequence:
+            return None
+        if int(sequence) < self._evicted.get(lot_id, 0):
+            return None
+        return int(sequence)
+
+    def _pending(self, lot_id, after):
+        """Texts of the lot's events after sequence ``after``, oldest first"""
+        pending = []
+        for sequence, text in reversed(self._buffers.get(lot_id, ())):
+            if sequence <= after:
+                break
+            pending.append(text)
+        pending.reverse()
+        return pending
+
+    def subscribe(self, lot_id, position=None, heartbeat=15):
+        """Generate the event stream of one lot, starting after ``position``.
+
+        Sends a comment every ``heartbeat`` seconds while idle, so proxies keep the
+        connection open and a client that went away is noticed at the next write.
+        """
+        with self._lock:
+            condition = self._conditions.get(lot_id)
+            if condition is None:
+                condition = self._conditions[lot_id] = threading.Condition(self._lock)
+            after = self._resume_from(lot_id, position)
+            reset = after is None
+            if reset:
+                after = self._sequence
+                self.resets += 1
+            self.subscribers += 1
+
+        try:
+            yield 'retry: 3000\n\n'
+            if reset:
+                yield f'id: {self.token}-{after}\nevent: reset\ndata: {{}}\n\n'
+            while not self._stopped.is_set():
+                with self._lock:
+                    pending = self._pending(lot_id, after)
+                    if not pending:
+                        condition.wait(heartbeat)
+                        pending = self._pending(lot_id, after)
+                    if pending and after < self._evicted.get(lot_id, 0):
+                        # Too slow: events this client never saw are gone
+                        pending = [f'id: {self.token}-{self._sequence}\nevent: reset\ndata: {{}}\n\n']
+                        self.resets += 1
+                    after = self._sequence
+                yield ''.join(pending) if pending else ': keep-alive\n\n'
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self.subscribers,
+                'lots_buffered': len(self._buffers),
+                'published': self.published,
+                'resets': self.resets,
+                'last_event_id': self._last_id,
+                'pending_gaps': len(self._gaps)
+            }
@@ -0,0 +1,200 @@
+"""Request and query timing, exported in the Prometheus text format at /metrics.
+
+Every request is timed by endpoint and every statement a repository cursor runs by
+its fingerprint: the SQL with literals replaced by ``?`` and placeholder lists folded,
+so queries that differ only in their values or IN-list length share one series.
+Timings go into histograms with the fixed buckets in LATENCY_BUCKETS, so recording
+one is a bisect and two additions under a lock and memory stays bounded by the number
+of endpoints and fingerprints. Statements slower than ``slow_query_seconds`` are
+logged together with the route (or background thread) that ran them.
+"""
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_REPEATED_ROWS = re.compile(r'(\([^()]*\))(?:\s*,\s*\1)+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query):
+    """(id, normalized SQL) identifying a statement independent of its values"""
+    text = ' '.join(query.split())
+    text = _STRING_LITERAL.sub('?', text)
+    text = _NUMBER_LITERAL.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(%s, ...)', text)
+    text = _REPEATED_ROWS.sub(r'\1, ...', text)
+    return hashlib.md5(text.encode()).hexdigest()[:12], text
+
+
+class Histogram:
+    """Observation counts per LATENCY_BUCKETS bucket plus their sum"""
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class TimedCursor:
+    """Wraps a repository cursor and reports how long each statement took"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, query, params=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params)
+        finally:
+            self._metrics.observe_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, seq_of_params):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, seq_of_params)
+        finally:
+            self._metrics.observe_query(query, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_label(value)}"' for name, value in labels.items())
+
+
+class Metrics:
+    """Latency histograms for requests and queries, shared by the threads of one process"""
+
+    def __init__(self, slow_query_seconds=0.25, logger=None):
+        self.slow_query_seconds = slow_query_seconds
+        self.logger = logger
+        self._requests = {}  # (endpoint, method) -> Histogram
+        self._responses = {}  # (endpoint, method, status) -> count
+        self._queries = {}  # query id -> Histogram
+        self._statements = {}  # query id -> normalized SQL
+        self._slow_queries = {}  # query id -> count
+        self._lock = threading.Lock()
+
+    def timed_cursor(self, cursor):
+        return TimedCursor(cursor, self)
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            histogram = self._requests.get((endpoint, method))
+            if histogram is None:
+                histogram = self._requests[(endpoint, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def observe_query(self, query, seconds):
+        query_id, statement = fingerprint(query)
+        slow = seconds >= self.slow_query_seconds
+        with self._lock:
+            histogram = self._queries.get(query_id)
+            if histogram is None:
+                histogram = self._queries[query_id] = Histogram()
+                self._statements[query_id] = statement
+            histogram.observe(seconds)
+            if slow:
+                self._slow_queries[query_id] = self._slow_queries.get(query_id, 0) + 1
+        if slow and self.logger:
+            self.logger.warning('Slow query (%.1f ms) in %s [%s]: %s',
+                                seconds * 1000, _caller(), query_id, statement)
+
+    def render(self):
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            requests = {key: (list(h.counts), h.sum) for key, h in self._requests.items()}
+            responses = dict(self._responses)
+            queries = {key: (list(h.counts), h.sum) for key, h in self._queries.items()}
+            statements = dict(self._statements)
+            slow_queries = dict(self._slow_queries)
+
+        lines = ['# HELP parking_request_duration_seconds Time to handle a request, by endpoint',
+                 '# TYPE parking_request_duration_seconds histogram']
+        for (endpoint, method), (counts, total) in sorted(requests.items()):
+            lines.extend(_histogram_lines('parking_request_duration_seconds', counts, total,
+                                          _labels(endpoint=endpoint, method=method)))
+
+        lines += ['# HELP parking_responses_total Responses sent, by endpoint and status code',
+                  '# TYPE parking_responses_total counter']
+        for (endpoint, method, status), count in sorted(responses.items()):
+            lines.append(f'parking_responses_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+
+        lines += ['# HELP parking_query_duration_seconds Time to execute a statement, by query fingerprint',
+                  '# TYPE parking_query_duration_seconds histogram']
+        for query_id, (counts, total) in sorted(queries.items()):
+            lines.extend(_histogram_lines('parking_query_duration_seconds', counts, total,
+                                          _labels(query_id=query_id, statement=statements[query_id][:200])))
+
+        lines += ['# HELP parking_slow_queries_total Statements slower than the slow query threshold',
+                  '# TYPE parking_slow_queries_total counter']
+        for query_id, count in sorted(slow_queries.items()):
+            lines.append(f'parking_slow_queries_total{{{_labels(query_id=query_id)}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, counts, total, labels):
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, counts):
+        cumulative += count
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    cumulative += counts[-1]
+    yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+    yield f'{name}_sum{{{labels}}} {total:.6f}'
+    yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+def _caller():
+    """The route being served, or the background thread's name outside requests"""
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+
+def init_app(app, metrics):
+    """Time every request of ``app`` and instrument its repository cursors"""
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            metrics.observe_request(request.endpoint or 'unmatched', request.method,
+                                    response.status_code, time.perf_counter() - started)
+        return response
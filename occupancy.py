@@ -0,0 +1,192 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+# One byte per slot number; NONE marks numbers no slot of the lot has
+NONE, VACANT, BOOKED, DELETED = 0, 1, 2, 3
+STATES = {'vacant': VACANT, 'booked': BOOKED, 'deleted': DELETED}
+STATUS_NAMES = {VACANT: 'vacant', BOOKED: 'booked', DELETED: 'deleted'}
+# One character per state for ``SlotMap.codes``
+CODES = bytes.maketrans(bytes([NONE, VACANT, BOOKED, DELETED]), b'-vbd')
+
+
+class SlotMap:
+    """Occupancy of one lot's slots, indexed by slot number.
+
+    Statuses live in a bytearray and slot ids in a parallel ``array('q')``, so a
+    5,000-bay garage costs about 45 KB instead of 5,000 row dicts. Status checks are
+    an index, and searches and counts run in C through ``bytearray.find``, ``rfind``
+    and ``count`` rather than a Python loop.
+    """
+
+    def __init__(self, lot_id, version, rows):
+        """``rows`` are (slot_number, slot_id, status) tuples"""
+        self.lot_id = lot_id
+        self.version = version
+        rows = list(rows)
+        size = max((row[0] for row in rows), default=0) + 1
+        self._states = bytearray(size)
+        self._ids = array('q', bytes(8 * size))
+        for slot_number, slot_id, status in rows:
+            self._states[slot_number] = STATES[status]
+            self._ids[slot_number] = slot_id
+
+    def __len__(self):
+        """Number of slots, deleted ones included"""
+        return len(self._states) - self._states.count(NONE)
+
+    @property
+    def last_number(self):
+        return len(self._states) - 1
+
+    def status(self, slot_number):
+        """'vacant', 'booked', 'deleted', or None for a number the lot has no slot for"""
+        if 0 < slot_number < len(self._states):
+            return STATUS_NAMES.get(self._states[slot_number])
+        return None
+
+    def slot_id(self, slot_number):
+        if self.status(slot_number) is None:
+            return None
+        return self._ids[slot_number]
+
+    def slot_number(self, slot_id):
+        """Number of the slot with id ``slot_id``, or None"""
+        try:
+            slot_number = self._ids.index(slot_id)
+        except ValueError:
+            return None
+        return slot_number if self._states[slot_number] else None
+
+    def first_free(self, start=1):
+        """Lowest vacant slot number from ``start`` on, or None"""
+        found = self._states.find(VACANT, max(start, 1))
+        return found if found != -1 else None
+
+    def nearest_free(self, slot_number):
+        """Vacant slot number closest to ``slot_number`` (the lower one on a tie), or None"""
+        slot_number = min(max(slot_number, 1), len(self._states))
+        below = self._states.rfind(VACANT, 1, slot_number + 1)
+        above = self._states.find(VACANT, slot_number)
+        if below == -1:
+            return above if above != -1 else None
+        if above == -1 or slot_number - below <= above - slot_number:
+            return below
+        return above
+
+    def slots(self, status=None, first=1, last=None):
+        """(slot_number, slot_id, status) of the slots numbered ``first`` to ``last``,
+        only those in ``status`` when given"""
+        last = self.last_number if last is None else min(last, self.last_number)
+        states, ids = self._states, self._ids
+        if status is not None:
+            state = STATES[status]
+            found = states.find(state, max(first, 1), last + 1)
+            while found != -1:
+                yield found, ids[found], status
+                found = states.find(state, found + 1, last + 1)
+            return
+        for slot_number in range(max(first, 1), last + 1):
+            if states[slot_number]:
+                yield slot_number, ids[slot_number], STATUS_NAMES[states[slot_number]]
+
+    def summary(self, first=1, last=None):
+        """Slot counts by status for the numbers ``first`` to ``last``"""
+        last = self.last_number if last is None else min(last, self.last_number)
+        window = self._states[max(first, 1):last + 1]
+        return {name: window.count(state) for state, name in STATUS_NAMES.items()}
+
+    def ranges(self, size):
+        """Counts per block of ``size`` slot numbers: [(first, last, summary), ...]"""
+        return [(first, min(first + size - 1, self.last_number),
+                 self.summary(first, first + size - 1))
+                for first in range(1, self.last_number + 1, size)]
+
+    def codes(self):
+        """The statuses as a string, one character per slot number from 0: 'v'acant,
+        'b'ooked, 'd'eleted, or '-' for no slot"""
+        return self._states.translate(CODES).decode('ascii')
+
+    def nbytes(self):
+        return len(self._states) + self._ids.itemsize * len(self._ids)
+
+
+class SlotMaps:
+    """Per-process cache of the SlotMap of the most recently viewed lots.
+
+    A map is only reused while the lot's ``lot_occupancy.version`` is unchanged, which
+    every slot write bumps in its own transaction, so a view costs one primary key
+    lookup while nothing changed and a narrow (number, id, status) scan otherwise,
+    whichever process made the change. At most ``max_lots`` maps are kept.
+    """
+
+    def __init__(self, max_lots=200):
+        self.max_lots = max_lots
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, repository, lot_id):
+        """The current SlotMap of a lot, or None for an unknown lot"""
+        version = repository.lot_version(lot_id)
+        if version is None:
+            return None
+        with self._lock:
+            slot_map = self._maps.get(lot_id)
+            if slot_map is not None and slot_map.version == version:
+                self._maps.move_to_end(lot_id)
+                self.hits += 1
+                return slot_map
+
+        # Read the version first: a write landing in between only makes the next view reload
+        slot_map = SlotMap(lot_id, version, repository.slot_map_rows(lot_id))
+        with self._lock:
+            self.loads += 1
+            current = self._maps.get(lot_id)
+            if current is None or current.version <= version:
+                self._maps[lot_id] = slot_map
+                self._maps.move_to_end(lot_id)
+            while len(self._maps) > self.max_lots:
+                self._maps.popitem(last=False)
+        return slot_map
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lots_cached': len(self._maps),
+                'bytes': sum(slot_map.nbytes() for slot_map in self._maps.values()),
+                'hits': self.hits,
+                'loads': self.loads
+            }
+
+
+def parse_slot_ranges(text):
+    """Slot numbers typed as '1-300, 412' as [(1, 300), (412, 412)]; ValueError when
+    the text is not a list of numbers and ranges"""
+    ranges = []
+    for part in text.replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first, last = int(first), int(last or first)
+        if first < 1 or last < first:
+            raise ValueError(f'Invalid slot range: {part}')
+        ranges.append((first, last))
+    return ranges
+
+
+def format_ranges(numbers):
+    """Slot numbers or ids as short text, consecutive ones collapsed: '#1-3, #7'"""
+    parts = []
+    numbers = sorted(numbers)
+    start = previous = None
+    for number in numbers + [None]:
+        if start is not None and number == previous + 1:
+            previous = number
+            continue
+        if start is not None:
+            parts.append(f'#{start}' if start == previous else f'#{start}-{previous}')
+        start = previous = number
+    return ', '.join(parts)
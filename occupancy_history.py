@@ -0,0 +1,206 @@
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+# Samples are stored as occupancy in basis points plus one; 0 marks a missing sample
+NO_SAMPLE = 0
+SCALE = 10000
+DAY = 86400
+# 1970-01-01 was a Thursday: hours to add for Monday-based hours of the week
+WEEK_OFFSET_HOURS = 3 * 24
+DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def seconds(moment):
+    """A naive datetime as the whole seconds since 1970"""
+    return int((moment - EPOCH).total_seconds())
+
+
+def encode(samples):
+    """An ``array('H')`` as the little-endian bytes stored in occupancy_history"""
+    if sys.byteorder == 'big':
+        samples = array('H', samples)
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def decode(data):
+    samples = array('H', bytes(data))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+
+def check_interval(interval):
+    """ValueError unless samples every ``interval`` seconds fill whole hours"""
+    if interval <= 0 or 3600 % interval:
+        raise ValueError('the sample interval must divide an hour')
+
+
+def sample_value(booked, total):
+    """The stored value for ``booked`` of ``total`` slots taken"""
+    if not total:
+        return NO_SAMPLE
+    return min(SCALE, round(booked * SCALE / total)) + 1
+
+
+class OccupancyRing:
+    """Occupancy of one lot every ``interval`` seconds over the last ``days`` days.
+
+    Samples live in one ``array('H')`` of ``days`` pages of a day each: the sample of
+    a moment sits at a fixed position (day number modulo ``days``, then second of the
+    day divided by ``interval``), and ``_days`` records which day each page holds, so
+    old days are overwritten in place and nothing ever grows. A sample takes 2 bytes:
+    a lot-year at the default 5 minute interval is 365 x 288 samples, 210 KB, and the
+    database rows holding them are the same size (see Repository.record_occupancy).
+
+    Queries run on whole hours of a page at a time, with ``sum``, ``count`` and ``max``
+    on array slices, so a year's heatmap touches 8,760 slices, not 105,120 samples.
+    """
+
+    def __init__(self, lot_id, interval=300, days=365):
+        check_interval(interval)
+        self.lot_id = lot_id
+        self.interval = interval
+        self.days = days
+        self.page_size = DAY // interval
+        self.per_hour = 3600 // interval
+        self._samples = array('H', bytes(2 * self.page_size * days))
+        self._days = array('q', [-1]) * days
+
+    @classmethod
+    def from_pages(cls, lot_id, interval, days, pages):
+        """A ring filled from (day, samples bytes) rows of occupancy_history"""
+        ring = cls(lot_id, interval, days)
+        for day, data in pages:
+            samples = decode(data)
+            if len(samples) == ring.page_size:
+                ring._page(day)[:] = samples
+        return ring
+
+    def nbytes(self):
+        return self._samples.itemsize * len(self._samples) + self._days.itemsize * len(self._days)
+
+    def _page(self, day):
+        """The page of ``day``, emptied first when it still holds an older day"""
+        index = day % self.days
+        start = index * self.page_size
+        if self._days[index] != day:
+            self._samples[start:start + self.page_size] = array('H', bytes(2 * self.page_size))
+            self._days[index] = day
+        return memoryview(self._samples)[start:start + self.page_size]
+
+    def record(self, moment, booked, total):
+        """Store the occupancy at ``moment``"""
+        second = seconds(moment)
+        self._page(second // DAY)[second % DAY // self.interval] = sample_value(booked, total)
+
+    def _pages(self, since, until):
+        """(day, samples slice) of the stored days overlapping [since, until), oldest first"""
+        first, last = seconds(since) // DAY, (seconds(until) - 1) // DAY
+        for day in range(max(first, last - self.days + 1), last + 1):
+            index = day % self.days
+            if self._days[index] == day:
+                start = index * self.page_size
+                yield day, self._samples[start:start + self.page_size]
+
+    def heatmap(self, since, until):
+        """Mean occupancy (0 to 1) per day of the week and hour, as 7 rows of 24, with
+        None for hours without samples"""
+        totals = [0] * 168
+        counts = [0] * 168
+        for day, samples in self._pages(since, until):
+            first_hour = day * 24 + WEEK_OFFSET_HOURS
+            for hour in range(24):
+                chunk = samples[hour * self.per_hour:(hour + 1) * self.per_hour]
+                found = len(chunk) - chunk.count(NO_SAMPLE)
+                if found:
+                    hour_of_week = (first_hour + hour) % 168
+                    totals[hour_of_week] += sum(chunk) - found
+                    counts[hour_of_week] += found
+        return [[totals[hour] / counts[hour] / SCALE if counts[hour] else None
+                 for hour in range(day * 24, day * 24 + 24)] for day in range(7)]
+
+    def peak(self, since, until):
+        """(moment, occupancy) of the highest sample in [since, until), the earliest
+        one on ties, or None"""
+        start, end = seconds(since), seconds(until)
+        best = None
+        for day, samples in self._pages(since, until):
+            first = max(0, (start - day * DAY + self.interval - 1) // self.interval)
+            last = min(self.page_size, (end - day * DAY + self.interval - 1) // self.interval)
+            if first >= last:
+                continue
+            window = samples[first:last]
+            highest = max(window)
+            if highest != NO_SAMPLE and (best is None or highest > best[1]):
+                best = (day * DAY + (first + window.index(highest)) * self.interval, highest)
+        if best is None:
+            return None
+        return EPOCH + timedelta(seconds=best[0]), (best[1] - 1) / SCALE
+
+
+class OccupancySampler:
+    """Background worker recording every active lot's occupancy each ``interval``
+    seconds into the occupancy_history pages.
+
+    A tick reads the lot_occupancy counts once and writes one sample per lot in a
+    single transaction (Repository.record_occupancy), on the interval boundary so
+    that samples line up with the ring positions. Several processes may run it: a
+    position already filled by another process is left alone.
+    """
+
+    def __init__(self, app, get_repository, interval=300, days=365):
+        check_interval(interval)
+        self.app = app
+        self.get_repository = get_repository
+        self.interval = interval
+        self.days = days
+        self.samples = 0
+        self.last_sample = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread once per process"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='occupancy-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                self.app.logger.exception('Occupancy sampler tick failed')
+            # Wake just after the next interval boundary
+            self._stopped.wait(self.interval - time.time() % self.interval + 0.5)
+
+    def run_once(self, moment=None):
+        """Record the current occupancy of every active lot; returns the lots sampled"""
+        second = seconds(moment or datetime.now())
+        day = second // DAY
+        lots = self.get_repository().lot_stats('id')
+        written = self.get_repository().record_occupancy(
+            day, day % self.days, second % DAY // self.interval, DAY // self.interval, self.interval,
+            {lot['id']: sample_value(int(lot['occupied_slots']), int(lot['total_slots'])) for lot in lots})
+        self.samples += written
+        self.last_sample = EPOCH + timedelta(seconds=second)
+        return written
+
+    def ring(self, lot_id, since=None):
+        """The OccupancyRing of a lot, loaded with the days from ``since`` on (all the
+        days kept by default)"""
+        first_day = seconds(since) // DAY if since else None
+        return OccupancyRing.from_pages(lot_id, self.interval, self.days,
+                                        self.get_repository().occupancy_pages(lot_id, self.interval, first_day))
@@ -0,0 +1,165 @@
+"""Bulk user onboarding: validate, de-duplicate, hash and insert thousands of users.
+
+Fleet customers hand over their drivers as a CSV file (with a ``username, email,
+password, phone`` header) or as JSON lines with the same keys. ``import_users``
+checks every row with the rules ``register()`` applies to one user. Duplicates are
+caught in memory, against one read of the usernames and emails already taken, instead
+of a lookup per user. The passwords, which take the bulk of the time, are hashed
+across a pool of processes, and the users go in with multi-row INSERTs. Rows that
+are turned away are returned with their reason.
+"""
+import csv
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from werkzeug.security import generate_password_hash
+
+FIELDS = ('username', 'email', 'password', 'phone')
+EMAIL_PATTERN = re.compile(r'[^@]+@[^@]+\.[^@]+')
+MIN_PASSWORD_LENGTH = 6
+# Column widths of the users table
+MAX_LENGTHS = {'username': 50, 'email': 100, 'phone': 20}
+
+
+def registration_error(username, email, password, phone):
+    """Why a new account cannot be created from these values, or None"""
+    if not username or not phone:
+        return 'Username and phone are required'
+    if not EMAIL_PATTERN.match(email or ''):
+        return 'Invalid email address'
+    if len(password or '') < MIN_PASSWORD_LENGTH:
+        return f'Password must be at least {MIN_PASSWORD_LENGTH} characters long'
+    for field, value in (('username', username), ('email', email), ('phone', phone)):
+        if len(value) > MAX_LENGTHS[field]:
+            return f'{field.capitalize()} is longer than {MAX_LENGTHS[field]} characters'
+    return None
+
+
+def read_users(stream, file_format):
+    """Yield (line_number, row) from a text stream of CSV or JSON lines; a row is a dict
+    of FIELDS, or the reason it could not be read as a str"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [field for field in FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError('CSV header lacks ' + ', '.join(missing))
+        for row in reader:
+            yield reader.line_num, {field: (row[field] or '').strip() for field in FIELDS}
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, 'Not valid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, 'Not a JSON object'
+            continue
+        yield line_number, {field: str(row.get(field) or '').strip() for field in FIELDS}
+
+
+class ImportReport:
+    """Outcome of one import: users created and rows rejected with their reason"""
+
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        # (line_number, username, email, reason); passwords are never kept
+        self.rejected = []
+        self.seconds = {}
+
+    def reject(self, line_number, row, reason):
+        if isinstance(row, dict):
+            self.rejected.append((line_number, row['username'], row['email'], reason))
+        else:
+            self.rejected.append((line_number, '', '', reason))
+
+    def reasons(self):
+        return Counter(reason for _, _, _, reason in self.rejected)
+
+    def write_csv(self, stream):
+        writer = csv.writer(stream)
+        writer.writerow(('line', 'username', 'email', 'reason'))
+        writer.writerows(sorted(self.rejected))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_users(repository, rows, workers=None, chunk_size=1000, hash_method=None, dry_run=False):
+    """Create users from ``rows`` as ``read_users`` yields them; returns an ImportReport.
+
+    Usernames and emails are compared case-insensitively, as MySQL's unique keys do.
+    ``workers`` processes hash the passwords (all CPUs by default; 1 hashes in this
+    process) while this one inserts finished chunks of ``chunk_size`` users, each in
+    its own transaction. ``hash_method`` is passed on to ``generate_password_hash``.
+    A username or email taken by a registration during the import is reported rather
+    than failing the chunk. With ``dry_run`` rows are only checked.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    usernames, emails = repository.account_keys()
+    report.seconds['load_accounts'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    accepted = []
+    for line_number, row in rows:
+        report.read += 1
+        if not isinstance(row, dict):
+            report.reject(line_number, row, row)
+            continue
+        reason = registration_error(row['username'], row['email'], row['password'], row['phone'])
+        username, email = row['username'].lower(), row['email'].lower()
+        if reason is None and username in usernames:
+            reason = 'Username already taken'
+        if reason is None and email in emails:
+            reason = 'Email already registered'
+        if reason:
+            report.reject(line_number, row, reason)
+            continue
+        usernames.add(username)
+        emails.add(email)
+        accepted.append((line_number, row))
+    report.seconds['validate'] = time.perf_counter() - started
+    if dry_run or not accepted:
+        return report
+
+    started = time.perf_counter()
+    hash_password = partial(generate_password_hash, method=hash_method) if hash_method else generate_password_hash
+    passwords = (row['password'] for _, row in accepted)
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        if pool:
+            hashes = pool.map(hash_password, passwords, chunksize=max(1, min(chunk_size, len(accepted) // (workers * 4))))
+        else:
+            hashes = map(hash_password, passwords)
+        # Chunks are inserted as soon as their hashes are in, while the pool works on
+        for chunk in _chunks(zip(accepted, hashes), chunk_size):
+            lines = {row['username']: line_number for (line_number, row), _ in chunk}
+            skipped = repository.create_users((row['username'], row['email'], password_hash, row['phone'])
+                                              for (_, row), password_hash in chunk)
+            report.created += len(chunk) - len(skipped)
+            for username, email, _, _ in skipped:
+                report.rejected.append((lines[username], username, email, 'Username or email already taken'))
+    finally:
+        if pool:
+            pool.shutdown()
+    report.seconds['hash_and_insert'] = time.perf_counter() - started
+    return report
+
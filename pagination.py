@@ -0,0 +1,79 @@
+from datetime import datetime
+
+
+def encode_cursor(row, column='created_at'):
+    """Turn the (timestamp, id) sort key of a row into an opaque URL-safe cursor"""
+    return f"{row[column].strftime('%Y%m%d%H%M%S%f')}-{row['id']}"
+
+
+def decode_cursor(cursor_value):
+    """Parse a cursor made by ``encode_cursor``; returns None for missing or bad input"""
+    if not cursor_value:
+        return None
+    try:
+        timestamp, row_id = cursor_value.split('-', 1)
+        return datetime.strptime(timestamp, '%Y%m%d%H%M%S%f'), int(row_id)
+    except ValueError:
+        return None
+
+
+def keyset_page(cursor, query, where, params, order_column, after=None, before=None,
+                page_size=50):
+    """Fetch one page of a newest-first listing using keyset pagination.
+
+    ``query`` is the SELECT ... FROM ... part, ``where`` a list of filter conditions
+    and ``order_column`` the timestamp column (qualified like ``b.created_at``); the
+    id column next to it breaks ties. ``after`` continues past the given cursor (older
+    rows), ``before`` goes back towards newer rows. The cost of any page is one index
+    range scan of ``page_size`` rows, no matter how deep it is.
+
+    ``query`` may also be a list of queries over tables with the same columns (the
+    live and archived bookings): each is paged on its own index and the rows merged,
+    so a page costs one range scan per table.
+
+    Returns (rows, next_cursor, prev_cursor); a cursor is None when there is no page
+    in that direction.
+    """
+    id_column = order_column.rsplit('.', 1)[0] + '.id' if '.' in order_column else 'id'
+    column = order_column.rsplit('.', 1)[-1]
+    conditions = list(where)
+    params = list(params)
+
+    # Only a cursor that decodes picks the direction: bad input gets the first page
+    position = decode_cursor(after)
+    descending = True
+    if position is None:
+        position = decode_cursor(before)
+        descending = position is None
+    if position:
+        operator = '<' if descending else '>'
+        conditions.append(f'({order_column} {operator} %s OR ({order_column} = %s AND {id_column} {operator} %s))')
+        params.extend([position[0], position[0], position[1]])
+
+    direction = 'DESC' if descending else 'ASC'
+    params.append(page_size + 1)
+    rows = []
+    for table_query in [query] if isinstance(query, str) else query:
+        sql = table_query
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order_column} {direction}, {id_column} {direction} LIMIT %s'
+        cursor.execute(sql, params)
+        rows.extend(cursor.fetchall())
+    if not isinstance(query, str):
+        rows.sort(key=lambda row: (row[column], row['id']), reverse=descending)
+        rows = rows[:page_size + 1]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not descending:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+    if descending:
+        next_cursor = encode_cursor(rows[-1], column) if has_more else None
+        prev_cursor = encode_cursor(rows[0], column) if position else None
+    else:
+        next_cursor = encode_cursor(rows[-1], column)
+        prev_cursor = encode_cursor(rows[0], column) if has_more else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,2011 @@
+"""Data access layer: every query and transaction the app runs.
+
+``Repository`` holds the SQL shared by both storage backends, ``MySQLRepository``
+runs it on the production MySQL server and ``SQLiteRepository`` on an embedded
+SQLite database (a file, or ``:memory:``) so the app and the benchmarks can run
+without a database server. Queries use MySQLdb's ``%s`` placeholders everywhere; the
+few statements the engines cannot share (row locks, upserts, multi-table UPDATEs)
+are methods each backend implements, and the MySQL functions the shared SQL calls
+(NOW, DATE_FORMAT) are registered on every SQLite connection by ``connect_sqlite``.
+
+Methods that change data commit their own transaction, except the underscored
+helpers that take a cursor: those run inside the caller's transaction.
+"""
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from billing import Tariff, TariffTable, billed_start
+from pagination import keyset_page
+
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'scripts', 'sqlite_schema.sql')
+
+# Booking tiers: the live table, and settled history moved out of it by archive_bookings
+# (same columns in the same order). History reads run against both.
+BOOKING_TABLES = ('bookings', 'bookings_archive')
+ALL_BOOKINGS = '(SELECT * FROM bookings UNION ALL SELECT * FROM bookings_archive)'
+
+# Bookings that carry revenue: completed ones, and cancellations charged for time used
+REVENUE_BOOKINGS = '''
+    ((status = 'completed' AND actual_cost IS NOT NULL)
+     OR (status = 'cancelled' AND actual_cost > 0))
+'''
+
+ROLLUP_COLUMNS = '''
+    SUM(CASE WHEN status = 'completed' THEN actual_cost ELSE 0 END),
+    SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN status = 'cancelled' THEN actual_cost ELSE 0 END),
+    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END)
+'''
+
+# Revenue rollup tables: (table, period column, period of a booking's actual_end_time)
+ROLLUP_TABLES = (
+    ('revenue_daily', 'day', 'DATE(actual_end_time)'),
+    ('revenue_monthly', 'month', "DATE_FORMAT(actual_end_time, '%Y-%m-01')"),
+)
+
+# Reservations of slot {slot} that overlap a window: takes the window's end, its start and
+# the id of a reservation to ignore (0 for none)
+RESERVED_SQL = '''
+    SELECT 1 FROM reservations r
+    WHERE r.slot_id = {slot} AND r.status = 'reserved'
+      AND r.start_time < %s AND r.end_time > %s AND r.id <> %s
+'''
+
+# Recomputes lot_occupancy rows from parking_slots; {where} narrows it to some lots
+RECOUNT_SQL = '''
+    INSERT INTO lot_occupancy (lot_id, total_slots, vacant, booked, deleted)
+    SELECT p.id,
+           COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END),
+           SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+           SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+           COUNT(CASE WHEN ps.deleted_at IS NOT NULL THEN ps.id END)
+    FROM parking_lots p
+    LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+    {where}
+    GROUP BY p.id
+    {upsert}
+'''
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+class Repository:
+    """Queries shared by both backends, bound to one connection.
+
+    Subclasses provide ``_open_cursor``, the row-lock suffixes ``FOR_UPDATE`` and
+    ``FOR_UPDATE_SKIP_LOCKED``, the ``INSERT_IGNORE`` prefix that skips rows breaking
+    a unique key, and the engine-specific statements below.
+    ``wrap_cursor``, when given, wraps every cursor handed out (metrics.TimedCursor).
+    """
+
+    backend = None
+    FOR_UPDATE = ''
+    FOR_UPDATE_SKIP_LOCKED = ''
+    INSERT_IGNORE = 'INSERT'
+
+    def __init__(self, connection, wrap_cursor=None):
+        self.connection = connection
+        self.wrap_cursor = wrap_cursor
+
+    def cursor(self, dictionary=False, unbuffered=False):
+        """A cursor taking ``%s`` placeholders; ``dictionary`` returns rows as dicts.
+
+        An ``unbuffered`` cursor hands rows over as the server sends them instead of
+        reading the whole result first. The connection can run nothing else until
+        every row has been fetched or the cursor is closed.
+        """
+        cursor = self._open_cursor(dictionary, unbuffered)
+        return self.wrap_cursor(cursor) if self.wrap_cursor else cursor
+
+    def _open_cursor(self, dictionary=False, unbuffered=False):
+        raise NotImplementedError
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def _fetchall(self, query, params=None):
+        cursor = self.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = list(cursor.fetchall())
+        cursor.close()
+        return rows
+
+    def _fetchone(self, query, params=None):
+        cursor = self.cursor(dictionary=True)
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+
+    # Engine-specific statements
+
+    def _begin(self, cursor):
+        """Start a transaction that reads rows it is about to change"""
+
+    def _upsert(self, key_columns, columns, accumulate=False):
+        """Clause making an INSERT overwrite (or add to) ``columns`` of an existing row"""
+        raise NotImplementedError
+
+    def _microseconds(self, start, end):
+        """SQL for the whole microseconds from the ``start`` to the ``end`` expression"""
+        raise NotImplementedError
+
+    def _prepare_archive(self, cursor, before):
+        """Make room in bookings_archive for bookings made before ``before``"""
+
+    def _free_slots_occupancy(self, cursor, booking_ids):
+        """Move the booked slots of the given bookings to vacant in lot_occupancy.
+
+        Must run before the slots themselves are released, while they still point at
+        their bookings.
+        """
+        raise NotImplementedError
+
+    # Parking lots
+
+    def lot_stats(self, order_by='name', vacant_only=False, lot_ids=None):
+        """Active lots (only those among ``lot_ids`` when given) with their total,
+        available and occupied slot counts"""
+        where, params = self._lot_ids_filter('p.id', lot_ids)
+        return self._fetchall(f'''
+            SELECT p.*, o.total_slots, o.vacant as available_slots, o.booked as occupied_slots
+            FROM lot_occupancy o
+            JOIN parking_lots p ON p.id = o.lot_id
+            WHERE p.deleted_at IS NULL {'AND o.vacant > 0' if vacant_only else ''} {where}
+            ORDER BY p.{order_by}
+        ''', params)
+
+    def active_lots(self, order_by='name', lot_ids=None):
+        where, params = self._lot_ids_filter('id', lot_ids)
+        return self._fetchall(f'SELECT * FROM parking_lots WHERE deleted_at IS NULL {where} ORDER BY {order_by}',
+                              params)
+
+    def _lot_ids_filter(self, column, lot_ids):
+        if lot_ids is None:
+            return '', ()
+        if not lot_ids:
+            return 'AND FALSE', ()
+        return 'AND {} IN ({})'.format(column, ', '.join(['%s'] * len(lot_ids))), tuple(lot_ids)
+
+    def deleted_lots(self):
+        return self._fetchall('''
+            SELECT p.*,
+                   COUNT(ps.id) as total_slots,
+                   p.deleted_at as deletion_date
+            FROM parking_lots p
+            LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+            WHERE p.deleted_at IS NOT NULL
+            GROUP BY p.id
+            ORDER BY p.deleted_at DESC
+        ''')
+
+    def get_lot(self, lot_id, deleted=False):
+        """A lot that is active (or, with ``deleted``, soft deleted), else None"""
+        return self._fetchone(f'''
+            SELECT * FROM parking_lots
+            WHERE id = %s AND deleted_at IS {'NOT NULL' if deleted else 'NULL'}
+        ''', (lot_id,))
+
+    def slot_counts(self, lot_ids=None):
+        """Return {lot_id: {'total', 'vacant', 'booked'}} aggregated from parking_slots"""
+        cursor = self.cursor()
+        query = '''
+            SELECT parking_lot_id,
+                   COUNT(CASE WHEN deleted_at IS NULL THEN id END) as total_slots,
+                   SUM(CASE WHEN status = 'vacant' AND deleted_at IS NULL THEN 1 ELSE 0 END) as vacant,
+                   SUM(CASE WHEN status = 'booked' AND deleted_at IS NULL THEN 1 ELSE 0 END) as booked
+            FROM parking_slots
+        '''
+        params = ()
+        if lot_ids:
+            query += ' WHERE parking_lot_id IN ({})'.format(', '.join(['%s'] * len(lot_ids)))
+            params = tuple(lot_ids)
+        cursor.execute(query + ' GROUP BY parking_lot_id', params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return {row[0]: {'total': int(row[1]), 'vacant': int(row[2] or 0), 'booked': int(row[3] or 0)}
+                for row in rows}
+
+    def create_lot(self, name, location, price_per_hour, total_slots, chunk_size=1000,
+                   latitude=None, longitude=None):
+        """Create a lot with ``total_slots`` vacant slots and return its id"""
+        cursor = self.cursor()
+        cursor.execute('''
+            INSERT INTO parking_lots (name, location, price_per_hour, latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', (name, location, price_per_hour, latitude, longitude))
+        lot_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO lot_occupancy (lot_id, total_slots, vacant)
+            VALUES (%s, %s, %s)
+        ''', (lot_id, total_slots, total_slots))
+        self._provision_slots(cursor, lot_id, total_slots, chunk_size)
+        self.commit()
+        cursor.close()
+        return lot_id
+
+    def lot_coordinates(self):
+        """(id, latitude, longitude) of every active lot that has coordinates"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT id, latitude, longitude FROM parking_lots
+            WHERE deleted_at IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+        rows = list(cursor.fetchall())
+        cursor.close()
+        return rows
+
+    def set_lot_coordinates(self, lot_id, latitude, longitude):
+        """Place an active lot on the map (None, None removes it); False for an unknown lot"""
+        cursor = self.cursor()
+        self._begin(cursor)
+        cursor.execute(f'''
+            SELECT id FROM parking_lots
+            WHERE id = %s AND deleted_at IS NULL
+            {self.FOR_UPDATE}
+        ''', (lot_id,))
+        if not cursor.fetchone():
+            self.rollback()
+            cursor.close()
+            return False
+        cursor.execute('''
+            UPDATE parking_lots
+            SET latitude = %s, longitude = %s
+            WHERE id = %s
+        ''', (latitude, longitude, lot_id))
+        # lot_json carries the coordinates: new ETags for /api/lots and /api/lots/<id>
+        cursor.execute('UPDATE lot_occupancy SET version = version + 1 WHERE lot_id = %s', (lot_id,))
+        self.commit()
+        cursor.close()
+        return True
+
+    def add_slots(self, lot_id, count, chunk_size=1000):
+        """Add ``count`` slots to an active lot; returns the (first, last) slot numbers,
+        or None when the lot does not exist"""
+        cursor = self.cursor()
+        self._begin(cursor)
+        cursor.execute('''
+            SELECT id FROM parking_lots
+            WHERE id = %s AND deleted_at IS NULL
+        ''', (lot_id,))
+        if not cursor.fetchone():
+            self.rollback()
+            cursor.close()
+            return None
+        first, last = self._provision_slots(cursor, lot_id, count, chunk_size)
+        self._adjust_occupancy(cursor, lot_id, total=count, vacant=count)
+        self._log_slot_events(cursor, 'parking_lot_id = %s AND slot_number BETWEEN %s AND %s',
+                              (lot_id, first, last))
+        self.commit()
+        cursor.close()
+        return first, last
+
+    def _provision_slots(self, cursor, lot_id, count, chunk_size=1000):
+        """Create ``count`` vacant slots for a lot, numbered after its current highest slot.
+
+        Slots are written with multi-row INSERTs of up to ``chunk_size`` rows (MySQLdb
+        turns ``executemany`` on an INSERT ... VALUES into one statement per batch, but
+        only when every value is a placeholder), so a 2,000-bay garage costs a couple of
+        round trips instead of 2,000. Pass a plain (tuple) cursor. Returns the (first,
+        last) slot numbers created.
+        """
+        # Lock the lot's existing slots so concurrent additions cannot pick the same numbers
+        cursor.execute(f'''
+            SELECT COALESCE(MAX(slot_number), 0)
+            FROM parking_slots
+            WHERE parking_lot_id = %s
+            {self.FOR_UPDATE}
+        ''', (lot_id,))
+        highest = cursor.fetchone()[0]
+
+        first, last = highest + 1, highest + count
+        for chunk_start in range(first, last + 1, chunk_size):
+            chunk_end = min(chunk_start + chunk_size - 1, last)
+            cursor.executemany('''
+                INSERT INTO parking_slots (parking_lot_id, slot_number, status)
+                VALUES (%s, %s, %s)
+            ''', [(lot_id, slot_number, 'vacant') for slot_number in range(chunk_start, chunk_end + 1)])
+        return first, last
+
+    def delete_lot(self, lot_id):
+        """Soft delete a lot and all its slots; False when it still has active bookings
+        or reservations that have not ended"""
+        cursor = self.cursor()
+        self._begin(cursor)
+        cursor.execute('''
+            SELECT COUNT(*)
+            FROM bookings b
+            JOIN parking_slots ps ON b.slot_id = ps.id
+            WHERE ps.parking_lot_id = %s AND b.status = 'active'
+        ''', (lot_id,))
+        active = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT COUNT(*) FROM reservations
+            WHERE parking_lot_id = %s AND status = 'reserved' AND end_time > %s
+        ''', (lot_id, datetime.now()))
+        if active + cursor.fetchone()[0] > 0:
+            self.rollback()
+            cursor.close()
+            return False
+
+        cursor.execute('''
+            UPDATE parking_lots
+            SET deleted_at = NOW()
+            WHERE id = %s
+        ''', (lot_id,))
+        cursor.execute('''
+            UPDATE parking_slots
+            SET deleted_at = NOW(), status = 'deleted'
+            WHERE parking_lot_id = %s AND deleted_at IS NULL
+        ''', (lot_id,))
+        self._recount_occupancy(cursor, lot_id)
+        self._log_slot_events(cursor, 'parking_lot_id = %s', (lot_id,))
+        self.commit()
+        cursor.close()
+        return True
+
+    def restore_lot(self, lot_id):
+        """Restore a soft deleted lot with the slots deleted along with it; returns the
+        lot, or None when it was not deleted"""
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        cursor.execute('''
+            SELECT * FROM parking_lots
+            WHERE id = %s AND deleted_at IS NOT NULL
+        ''', (lot_id,))
+        parking_lot = cursor.fetchone()
+        if not parking_lot:
+            self.rollback()
+            cursor.close()
+            return None
+
+        cursor.execute('''
+            UPDATE parking_lots
+            SET deleted_at = NULL
+            WHERE id = %s
+        ''', (lot_id,))
+        cursor.execute('''
+            UPDATE parking_slots
+            SET deleted_at = NULL, status = 'vacant'
+            WHERE parking_lot_id = %s AND status = 'deleted'
+        ''', (lot_id,))
+        self._recount_occupancy(cursor, lot_id)
+        self._log_slot_events(cursor, 'parking_lot_id = %s', (lot_id,))
+        self.commit()
+        cursor.close()
+        return parking_lot
+
+    # Parking slots
+
+    def slot_map_rows(self, lot_id):
+        """(slot_number, id, status) of every slot of a lot, deleted ones as 'deleted';
+        plain tuples, to build an occupancy.SlotMap from"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT slot_number, id,
+                   CASE WHEN deleted_at IS NOT NULL THEN 'deleted' ELSE status END
+            FROM parking_slots
+            WHERE parking_lot_id = %s
+        ''', (lot_id,))
+        rows = list(cursor.fetchall())
+        cursor.close()
+        return rows
+
+    def slot_bookings(self, lot_id, first, last):
+        """Active bookings on the lot's slots numbered ``first`` to ``last``, with the
+        booking user, keyed by slot number"""
+        rows = self._fetchall('''
+            SELECT ps.slot_number, b.id as booking_id, b.vehicle_number, b.vehicle_type,
+                   b.start_time, b.end_time, u.username, u.email, u.phone
+            FROM parking_slots ps
+            JOIN bookings b ON ps.booking_id = b.id AND b.status = 'active'
+            JOIN users u ON b.user_id = u.id
+            WHERE ps.parking_lot_id = %s AND ps.slot_number BETWEEN %s AND %s
+              AND ps.status = 'booked' AND ps.deleted_at IS NULL
+        ''', (lot_id, first, last))
+        return {row['slot_number']: row for row in rows}
+
+    def slot_statuses(self, lot_id):
+        """Number and status of every slot of a lot that is not deleted"""
+        return self._fetchall('''
+            SELECT id, slot_number, status FROM parking_slots
+            WHERE parking_lot_id = %s AND deleted_at IS NULL
+            ORDER BY slot_number
+        ''', (lot_id,))
+
+    def get_slot(self, slot_id):
+        """A slot with the status of the booking it points at (``booking_status``)"""
+        return self._fetchone('''
+            SELECT ps.*, b.status as booking_status
+            FROM parking_slots ps
+            LEFT JOIN bookings b ON ps.booking_id = b.id
+            WHERE ps.id = %s
+        ''', (slot_id,))
+
+    def delete_slot(self, slot):
+        """Soft delete a slot read with ``get_slot``; returns False when it was already
+        deleted or changed state in the meantime"""
+        cursor = self.cursor()
+        cursor.execute('''
+            UPDATE parking_slots
+            SET deleted_at = NOW(), status = 'deleted'
+            WHERE id = %s AND status = %s AND deleted_at IS NULL
+        ''', (slot['id'], slot['status']))
+        deleted = cursor.rowcount == 1
+        if deleted and slot['status'] in ('vacant', 'booked'):
+            self._adjust_occupancy(cursor, slot['parking_lot_id'], total=-1, deleted=1,
+                                   **{slot['status']: -1})
+        if deleted:
+            self._log_slot_events(cursor, 'id = %s', (slot['id'],))
+        self.commit()
+        cursor.close()
+        return deleted
+
+    def restore_slot(self, slot_id):
+        """Restore a soft deleted slot as vacant; returns it, or None when it was not deleted"""
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        cursor.execute(f'''
+            SELECT * FROM parking_slots
+            WHERE id = %s AND deleted_at IS NOT NULL
+            {self.FOR_UPDATE}
+        ''', (slot_id,))
+        slot = cursor.fetchone()
+        if not slot:
+            self.rollback()
+            cursor.close()
+            return None
+
+        cursor.execute('''
+            UPDATE parking_slots
+            SET deleted_at = NULL, status = 'vacant', booking_id = NULL
+            WHERE id = %s
+        ''', (slot_id,))
+        self._adjust_occupancy(cursor, slot['parking_lot_id'], total=1, vacant=1, deleted=-1)
+        self._log_slot_events(cursor, 'id = %s', (slot_id,))
+        self.commit()
+        cursor.close()
+        return slot
+
+    def _select_slots(self, cursor, lot_id, ranges=(), slot_ids=()):
+        """Lock and read the lot's slots numbered in any of the (first, last) ``ranges``
+        or with an id in ``slot_ids``, with the status of the booking they point at"""
+        terms = ['ps.slot_number BETWEEN %s AND %s'] * len(ranges)
+        params = [lot_id] + [number for number_range in ranges for number in number_range]
+        if slot_ids:
+            terms.append('ps.id IN ({})'.format(', '.join(['%s'] * len(slot_ids))))
+            params.extend(slot_ids)
+        if not terms:
+            return []
+        cursor.execute('''
+            SELECT ps.id, ps.slot_number, ps.status, ps.deleted_at, b.status as booking_status
+            FROM parking_slots ps
+            LEFT JOIN bookings b ON ps.booking_id = b.id
+            WHERE ps.parking_lot_id = %s AND ({terms})
+            ORDER BY ps.slot_number
+            {for_update}
+        '''.format(terms=' OR '.join(terms), for_update=self.FOR_UPDATE), params)
+        return cursor.fetchall()
+
+    def delete_slots(self, lot_id, ranges=(), slot_ids=()):
+        """Soft delete many slots of a lot in one transaction.
+
+        Slots are picked by (first, last) slot number ``ranges`` and/or ``slot_ids``
+        and locked first. As with ``delete_slot``, slots holding an active booking are
+        left alone. Returns one {'slot_number', 'slot_id', 'result'} per selected slot,
+        ``result`` being 'deleted', 'active booking' or 'already deleted'.
+        """
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        results = []
+        for slot in self._select_slots(cursor, lot_id, ranges, slot_ids):
+            if slot['deleted_at'] is not None:
+                result = 'already deleted'
+            elif slot['booking_status'] == 'active':
+                result = 'active booking'
+            else:
+                result = 'deleted'
+            results.append({'slot_number': slot['slot_number'], 'slot_id': slot['id'], 'result': result})
+
+        deleted = [item['slot_id'] for item in results if item['result'] == 'deleted']
+        if deleted:
+            selected = 'id IN ({})'.format(', '.join(['%s'] * len(deleted)))
+            cursor.execute(f'''
+                UPDATE parking_slots
+                SET deleted_at = NOW(), status = 'deleted'
+                WHERE {selected} AND deleted_at IS NULL
+            ''', deleted)
+            self._recount_occupancy(cursor, lot_id)
+            self._log_slot_events(cursor, selected, deleted)
+        self.commit()
+        cursor.close()
+        return results
+
+    def restore_slots(self, lot_id, ranges=(), slot_ids=()):
+        """Restore many soft deleted slots of a lot as vacant in one transaction; takes
+        the same selection as ``delete_slots`` and returns one {'slot_number', 'slot_id',
+        'result'} per selected slot, ``result`` being 'restored' or 'not deleted'"""
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        results = [{'slot_number': slot['slot_number'], 'slot_id': slot['id'],
+                    'result': 'restored' if slot['deleted_at'] is not None else 'not deleted'}
+                   for slot in self._select_slots(cursor, lot_id, ranges, slot_ids)]
+
+        restored = [item['slot_id'] for item in results if item['result'] == 'restored']
+        if restored:
+            selected = 'id IN ({})'.format(', '.join(['%s'] * len(restored)))
+            cursor.execute(f'''
+                UPDATE parking_slots
+                SET deleted_at = NULL, status = 'vacant', booking_id = NULL
+                WHERE {selected}
+            ''', restored)
+            self._recount_occupancy(cursor, lot_id)
+            self._log_slot_events(cursor, selected, restored)
+        self.commit()
+        cursor.close()
+        return results
+
+    # Users
+
+    def find_user(self, username):
+        return self._fetchone('SELECT * FROM users WHERE username = %s', (username,))
+
+    def find_account(self, username, email):
+        """The user holding ``username`` or ``email``, if any"""
+        return self._fetchone('SELECT * FROM users WHERE username = %s OR email = %s', (username, email))
+
+    def create_user(self, username, email, password_hash, phone):
+        cursor = self.cursor()
+        cursor.execute('''
+            INSERT INTO users (username, email, password, phone)
+            VALUES (%s, %s, %s, %s)
+        ''', (username, email, password_hash, phone))
+        user_id = cursor.lastrowid
+        self.commit()
+        cursor.close()
+        return user_id
+
+    def account_keys(self):
+        """Every username and email taken, lowercased, as two sets"""
+        usernames, emails = set(), set()
+        cursor = self.cursor(unbuffered=True)
+        cursor.execute('SELECT username, email FROM users')
+        for username, email in cursor:
+            usernames.add(username.lower())
+            emails.add(email.lower())
+        cursor.close()
+        return usernames, emails
+
+    def create_users(self, users):
+        """Insert (username, email, password_hash, phone) rows with one multi-row INSERT
+        and return the rows that were skipped because their username or email had been
+        taken in the meantime"""
+        users = list(users)
+        if not users:
+            return []
+        cursor = self.cursor()
+        cursor.executemany(f'''
+            {self.INSERT_IGNORE} INTO users (username, email, password, phone)
+            VALUES (%s, %s, %s, %s)
+        ''', users)
+        # A skipped row's username is missing or carries somebody else's (salted) hash
+        cursor.execute('''
+            SELECT username, password FROM users WHERE username IN ({})
+        '''.format(', '.join(['%s'] * len(users))), tuple(user[0] for user in users))
+        inserted = set(cursor.fetchall())
+        self.commit()
+        cursor.close()
+        return [user for user in users if (user[0], user[2]) not in inserted]
+
+    # Bookings
+
+    def create_booking(self, user_id, lot_id, vehicle_number, vehicle_type, hours, slot_id=None):
+        """Claim a vacant slot and create an active booking for it in one transaction.
+
+        With ``slot_id`` only that slot is claimed, otherwise the first vacant slot of the
+        lot; slots reserved for any part of the stay are passed over (see ``_claim_slot``).
+
+        Returns the new booking as a dict, or None when no slot could be claimed (the
+        transaction is rolled back in that case).
+        """
+        cursor = self.cursor(dictionary=True)
+        try:
+            self._begin(cursor)
+            start_time = datetime.now()
+            end_time = start_time + timedelta(hours=hours)
+            slot_id = self._claim_slot(cursor, lot_id, start_time, end_time, slot_id)
+            if slot_id is None:
+                self.rollback()
+                return None
+
+            estimated_cost = self.lot_tariffs([lot_id]).price([lot_id], [start_time], [end_time])[0]
+            booking_id, slot_number = self._insert_booking(cursor, user_id, lot_id, slot_id, vehicle_number,
+                                                           vehicle_type, start_time, end_time, estimated_cost)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return {
+            'booking_id': booking_id,
+            'slot_id': slot_id,
+            'slot_number': slot_number,
+            'start_time': start_time,
+            'end_time': end_time,
+            'estimated_cost': estimated_cost
+        }
+
+    def _claim_slot(self, cursor, lot_id, start_time, end_time, slot_id=None, reservation_id=0):
+        """Mark a vacant slot of the lot booked for a stay from ``start_time`` to
+        ``end_time``; returns its id, or None when no slot could be claimed.
+
+        ``slot_id`` is claimed under its row lock, so only one of several concurrent
+        requests can win it. Without ``slot_id`` the first vacant slot of the lot is
+        picked with ``FOR UPDATE SKIP LOCKED`` on MySQL, letting concurrent callers fan
+        out over different slots instead of queueing on the same row (SQLite serializes
+        the whole transaction instead). Slots reserved for part of the stay are not
+        claimed, except for reservation ``reservation_id`` itself. ``cursor`` must
+        return dicts.
+        """
+        if slot_id is None:
+            cursor.execute(f'''
+                SELECT ps.id FROM parking_slots ps
+                WHERE ps.parking_lot_id = %s AND ps.status = 'vacant' AND ps.deleted_at IS NULL
+                  AND NOT EXISTS ({RESERVED_SQL.format(slot='ps.id')})
+                ORDER BY ps.slot_number
+                LIMIT 1
+                {self.FOR_UPDATE_SKIP_LOCKED}
+            ''', (lot_id, end_time, start_time, reservation_id))
+        else:
+            cursor.execute(f'''
+                SELECT id FROM parking_slots
+                WHERE id = %s AND parking_lot_id = %s AND status = 'vacant' AND deleted_at IS NULL
+                {self.FOR_UPDATE}
+            ''', (slot_id, lot_id))
+        free_slot = cursor.fetchone()
+        if not free_slot:
+            return None
+        slot_id = free_slot['id']
+
+        # With the slot locked, look for a reservation committed since it was picked
+        if self._slot_reserved(cursor, slot_id, start_time, end_time, reservation_id):
+            return None
+
+        cursor.execute('''
+            UPDATE parking_slots
+            SET status = 'booked'
+            WHERE id = %s
+        ''', (slot_id,))
+        self._adjust_occupancy(cursor, lot_id, vacant=-1, booked=1)
+        self._log_slot_events(cursor, 'id = %s', (slot_id,))
+        return slot_id
+
+    def _insert_booking(self, cursor, user_id, lot_id, slot_id, vehicle_number, vehicle_type,
+                        start_time, end_time, estimated_cost):
+        """Create the active booking of a slot just claimed; returns (booking_id,
+        slot_number). ``cursor`` must return dicts."""
+        # Create booking (no actual cost yet)
+        cursor.execute('''
+            INSERT INTO bookings (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                                start_time, end_time, estimated_cost, status, actual_start_time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'active', %s)
+        ''', (user_id, lot_id, slot_id, vehicle_number, vehicle_type,
+              start_time, end_time, estimated_cost, start_time))
+        booking_id = cursor.lastrowid
+
+        cursor.execute('''
+            UPDATE parking_slots
+            SET booking_id = %s
+            WHERE id = %s
+        ''', (booking_id, slot_id))
+
+        cursor.execute('SELECT slot_number FROM parking_slots WHERE id = %s', (slot_id,))
+        return booking_id, cursor.fetchone()['slot_number']
+
+    def cancel_booking(self, booking_id, user_id=None):
+        """Cancel an active booking, charging for the time used, and free its slot.
+
+        With ``user_id`` only a booking of that user qualifies. Returns the booking with
+        a ``slot_freed`` flag, or None when there is no such active booking.
+        """
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        params = [booking_id]
+        owner = ''
+        if user_id is not None:
+            owner = 'AND b.user_id = %s'
+            params.append(user_id)
+        cursor.execute(f'''
+            SELECT b.*, p.price_per_hour
+            FROM bookings b
+            JOIN parking_lots p ON b.parking_lot_id = p.id
+            WHERE b.id = %s {owner} AND b.status = 'active'
+            {self.FOR_UPDATE}
+        ''', params)
+        booking = cursor.fetchone()
+        if not booking:
+            self.rollback()
+            cursor.close()
+            return None
+
+        # Cancel booking, charging for the time used (if any)
+        self._cancel_bookings(cursor, [booking_id], datetime.now())
+        self._record_revenue(cursor, [booking_id])
+
+        # Free up the parking slot
+        booking['slot_freed'] = False
+        if booking['slot_id']:
+            cursor.execute('''
+                UPDATE parking_slots
+                SET status = 'vacant', booking_id = NULL
+                WHERE id = %s AND status = 'booked'
+            ''', (booking['slot_id'],))
+            booking['slot_freed'] = cursor.rowcount == 1
+            if booking['slot_freed']:
+                self._adjust_occupancy(cursor, booking['parking_lot_id'], vacant=1, booked=-1)
+                self._log_slot_events(cursor, 'id = %s', (booking['slot_id'],))
+
+        self.commit()
+        cursor.close()
+        return booking
+
+    def cancel_bookings(self, filters, chunk_size=1000):
+        """Cancel every active booking matching the admin ``filters`` (see
+        ``search_bookings``) in one transaction, charging each for the time used like
+        ``cancel_booking`` and freeing their slots with set-based statements.
+
+        At least one filter besides the status is required. Returns one
+        {'booking_id', 'parking_lot_id', 'slot_id', 'slot_number', 'username',
+        'vehicle_number', 'actual_cost', 'slot_freed'} per cancelled booking.
+        """
+        where, params = self._booking_filters(dict(filters, status='active'))
+        if len(where) < 2:
+            raise ValueError('Refusing to cancel every active booking without a filter')
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        cursor.execute('''
+            SELECT b.id as booking_id, b.parking_lot_id, b.slot_id, b.vehicle_number,
+                   u.username
+            FROM bookings b
+            JOIN users u ON b.user_id = u.id
+            WHERE {where}
+            ORDER BY b.id
+            {for_update}
+        '''.format(where=' AND '.join(where), for_update=self.FOR_UPDATE), params)
+        cancelled = {row['booking_id']: row for row in cursor.fetchall()}
+        booking_ids = list(cancelled)
+
+        actual_end = datetime.now()
+        for offset in range(0, len(booking_ids), chunk_size):
+            chunk = booking_ids[offset:offset + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            self._cancel_bookings(cursor, chunk, actual_end)
+            self._record_revenue(cursor, chunk)
+
+            # Free up their parking slots
+            cursor.execute(f'''
+                SELECT id, booking_id, slot_number FROM parking_slots
+                WHERE booking_id IN ({placeholders}) AND status = 'booked'
+            ''', chunk)
+            freed = cursor.fetchall()
+            self._free_slots_occupancy(cursor, chunk)
+            cursor.execute(f'''
+                UPDATE parking_slots
+                SET status = 'vacant', booking_id = NULL
+                WHERE booking_id IN ({placeholders}) AND status = 'booked'
+            ''', chunk)
+            if freed:
+                self._log_slot_events(cursor, 'id IN ({})'.format(', '.join(['%s'] * len(freed))),
+                                      [slot['id'] for slot in freed])
+            for slot in freed:
+                cancelled[slot['booking_id']].update(slot_number=slot['slot_number'], slot_freed=True)
+
+            cursor.execute(f'''
+                SELECT id, actual_cost FROM bookings WHERE id IN ({placeholders})
+            ''', chunk)
+            for row in cursor.fetchall():
+                cancelled[row['id']]['actual_cost'] = row['actual_cost']
+
+        self.commit()
+        cursor.close()
+        for booking in cancelled.values():
+            booking.setdefault('slot_number', None)
+            booking.setdefault('slot_freed', False)
+        return list(cancelled.values())
+
+    def settle_expired(self, limit=500, bulk=True, settled=None):
+        """Complete up to ``limit`` active bookings whose end time has passed, bill them and
+        free their slots; returns how many were settled.
+
+        ``bulk`` settles the whole chunk with a fixed number of set-based statements,
+        otherwise every booking is updated on its own. When ``settled`` is a list, a
+        (booking_id, parking_lot_id, slot_id) tuple is appended for every booking
+        completed, with slot_id None unless the settlement freed the booking's slot.
+        """
+        if bulk:
+            return self._settle_chunk(limit, settled)
+        return self._settle_rows(limit, settled)
+
+    def _settle_rows(self, limit=None, settled=None):
+        cursor = self.cursor(dictionary=True)
+
+        # Find expired bookings, oldest first so a limited batch drains the backlog in order
+        query = '''
+            SELECT * FROM bookings
+            WHERE status = 'active' AND end_time <= %s
+            ORDER BY end_time
+        '''
+        if limit:
+            query += ' LIMIT %d' % int(limit)
+        cursor.execute(query, (datetime.now(),))
+        expired_bookings = cursor.fetchall()
+
+        expired_count = 0
+        for booking in expired_bookings:
+            # Only settle the booking if nobody else (cancel, another worker) got there first
+            if self._complete_bookings(cursor, [booking['id']], datetime.now()) == 0:
+                continue
+            self._record_revenue(cursor, [booking['id']])
+
+            # Free up the parking slot
+            cursor.execute('''
+                UPDATE parking_slots
+                SET status = 'vacant', booking_id = NULL
+                WHERE booking_id = %s AND status = 'booked'
+            ''', (booking['id'],))
+            freed = cursor.rowcount > 0
+            if freed:
+                self._adjust_occupancy(cursor, booking['parking_lot_id'], vacant=1, booked=-1)
+                self._log_slot_events(cursor, 'id = %s', (booking['slot_id'],))
+            expired_count += 1
+            if settled is not None:
+                settled.append((booking['id'], booking['parking_lot_id'], booking['slot_id'] if freed else None))
+
+        self.commit()
+        cursor.close()
+        return expired_count
+
+    def _settle_chunk(self, chunk_size=500, settled=None):
+        """Settle a chunk of expired bookings in one short transaction.
+
+        On MySQL the chunk is locked with ``FOR UPDATE SKIP LOCKED`` so several workers
+        can drain a large backlog in parallel without settling the same booking twice.
+        """
+        cursor = self.cursor()
+        actual_end = datetime.now()
+
+        self._begin(cursor)
+        cursor.execute(f'''
+            SELECT id, parking_lot_id, slot_id
+            FROM bookings
+            WHERE status = 'active' AND end_time <= %s
+            ORDER BY end_time
+            LIMIT %s
+            {self.FOR_UPDATE_SKIP_LOCKED}
+        ''', (actual_end, int(chunk_size)))
+        due_bookings = [tuple(row) for row in cursor.fetchall()]
+        booking_ids = [row[0] for row in due_bookings]
+
+        if not booking_ids:
+            self.commit()
+            cursor.close()
+            return 0
+
+        settled_count = self._complete_bookings(cursor, booking_ids, actual_end)
+        self._record_revenue(cursor, booking_ids)
+
+        # Free up their parking slots; a slot already freed or handed to another
+        # booking is left alone and reported as not freed
+        placeholders = ', '.join(['%s'] * len(booking_ids))
+        cursor.execute(f'''
+            SELECT id FROM parking_slots
+            WHERE booking_id IN ({placeholders}) AND status = 'booked'
+            {self.FOR_UPDATE}
+        ''', booking_ids)
+        freed = {row[0] for row in cursor.fetchall()}
+        self._free_slots_occupancy(cursor, booking_ids)
+        cursor.execute(f'''
+            UPDATE parking_slots
+            SET status = 'vacant', booking_id = NULL
+            WHERE booking_id IN ({placeholders}) AND status = 'booked'
+        ''', booking_ids)
+        if freed:
+            self._log_slot_events(cursor, 'id IN ({})'.format(', '.join(['%s'] * len(freed))), list(freed))
+
+        self.commit()
+        cursor.close()
+        if settled is not None:
+            settled.extend((booking_id, lot_id, slot_id if slot_id in freed else None)
+                           for booking_id, lot_id, slot_id in due_bookings)
+        return settled_count
+
+    def upcoming_expiries(self, seconds):
+        """(booking_id, end_time) of active bookings ending within ``seconds`` from now"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT id, end_time
+            FROM bookings
+            WHERE status = 'active' AND end_time <= %s
+            ORDER BY end_time
+        ''', (datetime.now() + timedelta(seconds=seconds),))
+        upcoming = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return upcoming
+
+    def _booking_filters(self, filters):
+        """WHERE conditions and parameters for the admin booking filters, over bookings
+        ``b`` joined with users ``u``"""
+        where = []
+        params = []
+        if filters.get('status') in ('active', 'completed', 'cancelled'):
+            where.append('b.status = %s')
+            params.append(filters['status'])
+        if filters.get('lot_id'):
+            where.append('b.parking_lot_id = %s')
+            params.append(filters['lot_id'])
+        if filters.get('user'):
+            where.append('(u.username LIKE %s OR u.email LIKE %s)')
+            params.extend([filters['user'] + '%', filters['user'] + '%'])
+        if filters.get('vehicle_number'):
+            where.append('b.vehicle_number LIKE %s')
+            params.append(filters['vehicle_number'] + '%')
+        date_from = _parse_date(filters.get('date_from'))
+        if date_from:
+            where.append('b.created_at >= %s')
+            params.append(date_from)
+        date_to = _parse_date(filters.get('date_to'))
+        if date_to:
+            where.append('b.created_at < %s')
+            params.append(date_to + timedelta(days=1))
+        return where, params
+
+    def search_bookings(self, filters, after=None, before=None, page_size=50):
+        """One keyset page of all bookings, live and archived, newest first, narrowed by
+        the admin filters (status, lot_id, user, vehicle_number, date_from, date_to);
+        see ``keyset_page``"""
+        where, params = self._booking_filters(filters)
+        # Only settled bookings are ever archived
+        tables = BOOKING_TABLES[:1] if filters.get('status') == 'active' else BOOKING_TABLES
+
+        cursor = self.cursor(dictionary=True)
+        page = keyset_page(cursor, ['''
+            SELECT b.*, u.username, u.email, u.phone,
+                   p.name as parking_lot_name, p.location,
+                   ps.slot_number
+            FROM {table} b
+            JOIN users u ON b.user_id = u.id
+            JOIN parking_lots p ON b.parking_lot_id = p.id
+            LEFT JOIN parking_slots ps ON b.slot_id = ps.id
+        '''.format(table=table) for table in tables], where, params, 'b.created_at',
+            after=after, before=before, page_size=page_size)
+        cursor.close()
+        return page
+
+    def export_bookings(self, filters, chunk_size=1000):
+        """Every booking matching the admin filters as a tuple of
+        ``export.BOOKING_COLUMNS``: the archived ones, then the live ones, each ordered
+        by id.
+
+        Rows are read through an unbuffered cursor ``chunk_size`` at a time, so neither
+        side holds the whole result; the connection stays busy until the generator is
+        exhausted or closed.
+        """
+        where, params = self._booking_filters(filters)
+        cursor = self.cursor(unbuffered=True)
+        try:
+            for table in reversed(BOOKING_TABLES):
+                # Ordered by the primary key, so the server streams it without sorting
+                cursor.execute('''
+                    SELECT b.id, b.created_at, b.status, b.user_id, u.username, u.email,
+                           b.parking_lot_id, p.name, ps.slot_number, b.vehicle_number, b.vehicle_type,
+                           b.start_time, b.end_time, b.actual_start_time, b.actual_end_time,
+                           b.estimated_cost, b.actual_cost
+                    FROM {table} b
+                    JOIN users u ON b.user_id = u.id
+                    JOIN parking_lots p ON b.parking_lot_id = p.id
+                    LEFT JOIN parking_slots ps ON b.slot_id = ps.id
+                    {where}
+                    ORDER BY b.id
+                '''.format(table=table, where='WHERE ' + ' AND '.join(where) if where else ''), params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield from rows
+        finally:
+            cursor.close()
+
+    # {table} is one of BOOKING_TABLES
+    USER_BOOKINGS_QUERY = '''
+        SELECT b.*, p.name as parking_lot_name, p.location,
+               ps.slot_number
+        FROM {table} b
+        JOIN parking_lots p ON b.parking_lot_id = p.id
+        LEFT JOIN parking_slots ps ON b.slot_id = ps.id
+    '''
+
+    def user_active_bookings(self, user_id):
+        """A user's active bookings, newest first, read through the (user_id, status)
+        index so completed history is never scanned for them"""
+        return self._fetchall(self.USER_BOOKINGS_QUERY.format(table='bookings') + '''
+            WHERE b.user_id = %s AND b.status = 'active'
+            ORDER BY b.created_at DESC, b.id DESC
+        ''', (user_id,))
+
+    def user_booking_history(self, user_id, after=None, before=None, page_size=50):
+        """One keyset page of a user's finished bookings, live and archived, newest first"""
+        cursor = self.cursor(dictionary=True)
+        page = keyset_page(cursor, [self.USER_BOOKINGS_QUERY.format(table=table) for table in BOOKING_TABLES],
+                           ['b.user_id = %s', "b.status <> 'active'"], [user_id], 'b.created_at',
+                           after=after, before=before, page_size=page_size)
+        cursor.close()
+        return page
+
+    def booking_summary(self):
+        """Number of active bookings and completed revenue per month (newest first),
+        read in one round trip"""
+        rows = self._fetchall('''
+            SELECT 'active' as kind, NULL as month, COUNT(*) as value
+            FROM bookings
+            WHERE status = 'active'
+            UNION ALL
+            SELECT 'revenue', DATE_FORMAT(month, '%Y-%m'), SUM(completed_revenue)
+            FROM revenue_monthly
+            WHERE completed_bookings > 0
+            GROUP BY month
+        ''')
+        active_bookings = sum(row['value'] for row in rows if row['kind'] == 'active')
+        months = sorted((row for row in rows if row['kind'] == 'revenue'),
+                        key=lambda row: row['month'], reverse=True)
+        return active_bookings, [{'month': row['month'], 'revenue': row['value']} for row in months]
+
+    # Reservations
+
+    def _slot_reserved(self, cursor, slot_id, start_time, end_time, reservation_id=0):
+        """Whether a reservation other than ``reservation_id`` holds the slot for part of
+        the window; a locking read, so it sees reservations committed by others"""
+        cursor.execute(f'''
+            {RESERVED_SQL.format(slot='%s')}
+            LIMIT 1
+            {self.FOR_UPDATE}
+        ''', (slot_id, end_time, start_time, reservation_id))
+        return cursor.fetchone() is not None
+
+    def _lock_free_slot(self, cursor, lot_id, slot_id, start_time, end_time):
+        """Lock a slot of the lot that is free from ``start_time`` to ``end_time`` and
+        return it; None when it is not, or is locked by another transaction (MySQL).
+
+        A booked slot is free once the booking holding it ends, even if it overruns.
+        """
+        cursor.execute(f'''
+            SELECT id, slot_number, status, booking_id FROM parking_slots
+            WHERE id = %s AND parking_lot_id = %s AND deleted_at IS NULL
+            {self.FOR_UPDATE_SKIP_LOCKED}
+        ''', (slot_id, lot_id))
+        slot = cursor.fetchone()
+        if not slot:
+            return None
+        if slot['status'] == 'booked':
+            # A booking never changes its end time, so no lock is needed here
+            cursor.execute('''
+                SELECT end_time FROM bookings
+                WHERE id = %s AND status = 'active'
+            ''', (slot['booking_id'],))
+            booking = cursor.fetchone()
+            if not booking or booking['end_time'] > start_time:
+                return None
+        if self._slot_reserved(cursor, slot_id, start_time, end_time):
+            return None
+        return slot
+
+    def _bump_reservation_version(self, cursor, lot_id):
+        """Count a reservation change in the lot and return its new reservation_version"""
+        cursor.execute('''
+            UPDATE lot_occupancy
+            SET reservation_version = reservation_version + 1
+            WHERE lot_id = %s
+        ''', (lot_id,))
+        cursor.execute('SELECT reservation_version FROM lot_occupancy WHERE lot_id = %s', (lot_id,))
+        row = cursor.fetchone()
+        return row['reservation_version'] if row else None
+
+    def free_slots(self, lot_id, start_time, end_time, limit=None):
+        """(slot_number, slot_id) of the lot's slots free from ``start_time`` to
+        ``end_time``, by slot number, straight from the database (see
+        ``reservations.SlotSchedule.free_slots`` for the in-memory search)"""
+        query = f'''
+            SELECT ps.slot_number, ps.id
+            FROM parking_slots ps
+            LEFT JOIN bookings b ON b.id = ps.booking_id
+            WHERE ps.parking_lot_id = %s AND ps.deleted_at IS NULL
+              AND (ps.status = 'vacant' OR b.end_time <= %s)
+              AND NOT EXISTS ({RESERVED_SQL.format(slot='ps.id')})
+            ORDER BY ps.slot_number
+        '''
+        if limit:
+            query += ' LIMIT %d' % int(limit)
+        cursor = self.cursor()
+        cursor.execute(query, (lot_id, start_time, end_time, start_time, 0))
+        slots = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return slots
+
+    def _lock_first_free_slot(self, cursor, lot_id, slot_ids, start_time, end_time, attempts):
+        for slot_id in islice(slot_ids, attempts):
+            slot = self._lock_free_slot(cursor, lot_id, slot_id, start_time, end_time)
+            if slot:
+                return slot
+        return None
+
+    def create_reservation(self, user_id, lot_id, vehicle_number, vehicle_type, start_time, end_time,
+                           slot_ids=None, attempts=20):
+        """Reserve a slot of the lot from ``start_time`` to ``end_time`` in one transaction.
+
+        ``slot_ids`` lists candidate slots in order of preference, normally the free ones
+        of the lot's ``reservations.SlotSchedule``. Up to ``attempts`` of them are tried;
+        when there are none, or all were taken since they were looked up, candidates are
+        looked up again with ``free_slots`` inside the transaction. Each one is locked
+        (skipped when another transaction holds it, on MySQL) and checked against the
+        booking holding it and its reservations before the reservation is written, so
+        concurrent callers can never reserve overlapping windows of one slot, and a
+        candidate taken in the meantime just moves on to the next.
+
+        Returns the reservation as a dict, with the lot's new ``reservation_version``,
+        or None when no candidate was free (the transaction is rolled back then).
+        """
+        cursor = self.cursor(dictionary=True)
+        try:
+            self._begin(cursor)
+            slot = self._lock_first_free_slot(cursor, lot_id, slot_ids or (), start_time, end_time, attempts)
+            if not slot:
+                slot_ids = [slot_id for _, slot_id in self.free_slots(lot_id, start_time, end_time, attempts)]
+                slot = self._lock_first_free_slot(cursor, lot_id, slot_ids, start_time, end_time, attempts)
+            if not slot:
+                self.rollback()
+                return None
+
+            estimated_cost = self.lot_tariffs([lot_id]).price([lot_id], [start_time], [end_time])[0]
+            cursor.execute('''
+                INSERT INTO reservations (user_id, parking_lot_id, slot_id, vehicle_number, vehicle_type,
+                                          start_time, end_time, estimated_cost, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'reserved')
+            ''', (user_id, lot_id, slot['id'], vehicle_number, vehicle_type,
+                  start_time, end_time, estimated_cost))
+            reservation_id = cursor.lastrowid
+            reservation_version = self._bump_reservation_version(cursor, lot_id)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return {
+            'reservation_id': reservation_id,
+            'parking_lot_id': lot_id,
+            'slot_id': slot['id'],
+            'slot_number': slot['slot_number'],
+            'start_time': start_time,
+            'end_time': end_time,
+            'estimated_cost': estimated_cost,
+            'reservation_version': reservation_version
+        }
+
+    def get_reservation(self, reservation_id, user_id=None):
+        """A reservation with its slot number; with ``user_id`` only one of that user"""
+        params = [reservation_id]
+        owner = ''
+        if user_id is not None:
+            owner = 'AND r.user_id = %s'
+            params.append(user_id)
+        return self._fetchone(f'''
+            SELECT r.*, ps.slot_number
+            FROM reservations r
+            JOIN parking_slots ps ON r.slot_id = ps.id
+            WHERE r.id = %s {owner}
+        ''', params)
+
+    def user_reservations(self, user_id):
+        """A user's reservations that have not ended yet and are neither checked in nor
+        cancelled, soonest first"""
+        return self._fetchall('''
+            SELECT r.*, p.name as parking_lot_name, p.location, ps.slot_number
+            FROM reservations r
+            JOIN parking_lots p ON r.parking_lot_id = p.id
+            JOIN parking_slots ps ON r.slot_id = ps.id
+            WHERE r.user_id = %s AND r.status = 'reserved' AND r.end_time > %s
+            ORDER BY r.start_time, r.id
+        ''', (user_id, datetime.now()))
+
+    def _lock_reservation(self, cursor, reservation_id, user_id=None):
+        params = [reservation_id]
+        owner = ''
+        if user_id is not None:
+            owner = 'AND user_id = %s'
+            params.append(user_id)
+        cursor.execute(f'''
+            SELECT * FROM reservations
+            WHERE id = %s {owner} AND status = 'reserved'
+            {self.FOR_UPDATE}
+        ''', params)
+        return cursor.fetchone()
+
+    def check_in_reservation(self, reservation_id, user_id=None, early=timedelta(0)):
+        """Turn a reservation into an active booking lasting until its end time, from
+        ``early`` before its start on.
+
+        The reserved slot is claimed when it is vacant. When it is not (a stay before
+        overran, or the slot was deleted since) any slot of the lot free until the end
+        time is claimed instead. Returns the booking as ``create_booking`` does, with the
+        checked in ``reservation`` (carrying the lot's new ``reservation_version``), or
+        None when there is no such reservation open for check-in now or no slot is free.
+        """
+        cursor = self.cursor(dictionary=True)
+        try:
+            self._begin(cursor)
+            reservation = self._lock_reservation(cursor, reservation_id, user_id)
+            start_time = datetime.now()
+            if not reservation or not reservation['start_time'] - early <= start_time < reservation['end_time']:
+                self.rollback()
+                return None
+
+            lot_id = reservation['parking_lot_id']
+            end_time = reservation['end_time']
+            slot_id = (self._claim_slot(cursor, lot_id, start_time, end_time, reservation['slot_id'], reservation_id)
+                       or self._claim_slot(cursor, lot_id, start_time, end_time, reservation_id=reservation_id))
+            if slot_id is None:
+                self.rollback()
+                return None
+
+            booking_id, slot_number = self._insert_booking(
+                cursor, reservation['user_id'], lot_id, slot_id, reservation['vehicle_number'],
+                reservation['vehicle_type'], start_time, end_time, reservation['estimated_cost'])
+            cursor.execute('''
+                UPDATE reservations
+                SET status = 'checked_in', booking_id = %s
+                WHERE id = %s
+            ''', (booking_id, reservation_id))
+            reservation['reservation_version'] = self._bump_reservation_version(cursor, lot_id)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return {
+            'booking_id': booking_id,
+            'slot_id': slot_id,
+            'slot_number': slot_number,
+            'start_time': start_time,
+            'end_time': end_time,
+            'estimated_cost': reservation['estimated_cost'],
+            'reservation': reservation
+        }
+
+    def cancel_reservation(self, reservation_id, user_id=None):
+        """Cancel a reservation that is not checked in yet, free of charge; returns it
+        with the lot's new ``reservation_version``, or None when there is no such
+        reservation"""
+        cursor = self.cursor(dictionary=True)
+        self._begin(cursor)
+        reservation = self._lock_reservation(cursor, reservation_id, user_id)
+        if not reservation:
+            self.rollback()
+            cursor.close()
+            return None
+
+        cursor.execute('''
+            UPDATE reservations
+            SET status = 'cancelled'
+            WHERE id = %s
+        ''', (reservation_id,))
+        reservation['reservation_version'] = self._bump_reservation_version(cursor, reservation['parking_lot_id'])
+        self.commit()
+        cursor.close()
+        return reservation
+
+    def schedule_versions(self, lot_id):
+        """(version, reservation_version) of a lot, or None for an unknown lot"""
+        row = self._fetchone('''
+            SELECT version, reservation_version FROM lot_occupancy WHERE lot_id = %s
+        ''', (lot_id,))
+        return (row['version'], row['reservation_version']) if row else None
+
+    def schedule_slots(self, lot_id):
+        """(slot_number, slot_id, status, booked_until) of the lot's slots that are not
+        deleted, ``booked_until`` being the end time of the booking holding the slot"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT ps.slot_number, ps.id, ps.status, b.end_time
+            FROM parking_slots ps
+            LEFT JOIN bookings b ON b.id = ps.booking_id AND b.status = 'active'
+            WHERE ps.parking_lot_id = %s AND ps.deleted_at IS NULL
+            ORDER BY ps.slot_number
+        ''', (lot_id,))
+        slots = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return slots
+
+    def schedule_reservations(self, lot_id, after):
+        """Yield (slot_id, start_time, end_time) of the lot's reservations ending after
+        ``after``, by slot and start time"""
+        cursor = self.cursor(unbuffered=True)
+        try:
+            cursor.execute('''
+                SELECT slot_id, start_time, end_time
+                FROM reservations
+                WHERE parking_lot_id = %s AND status = 'reserved' AND end_time > %s
+                ORDER BY slot_id, start_time
+            ''', (lot_id, after))
+            for row in cursor:
+                yield tuple(row)
+        finally:
+            cursor.close()
+
+    def overlapping_reservations(self, lot_id):
+        """Pairs of reservations of one slot of the lot whose windows overlap (there
+        should be none): [(reservation_id, reservation_id), ...]"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT a.id, b.id
+            FROM reservations a
+            JOIN reservations b ON b.slot_id = a.slot_id AND b.id > a.id
+            WHERE a.parking_lot_id = %s AND a.status = 'reserved' AND b.status = 'reserved'
+              AND a.start_time < b.end_time AND b.start_time < a.end_time
+        ''', (lot_id,))
+        pairs = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return pairs
+
+    # Archive (bookings_archive)
+
+    def archive_bookings(self, before, batch_size=1000, pause=0.1, max_batches=None):
+        """Move completed and cancelled bookings made before ``before`` from bookings to
+        bookings_archive; returns how many were moved.
+
+        Each batch of ``batch_size`` bookings is copied and deleted in its own short
+        transaction, oldest first, with a ``pause`` in seconds between batches so the
+        live table's writers keep getting through. ``max_batches`` stops early; the
+        next run carries on where this one stopped.
+        """
+        cursor = self.cursor()
+        self._prepare_archive(cursor, before)
+        moved = 0
+        batches = 0
+        position = None
+        while max_batches is None or batches < max_batches:
+            self._begin(cursor)
+            # Walk the (created_at, id) index in order from where the last batch ended,
+            # so neither a sort nor the old active bookings skipped are repeated
+            after = ''
+            params = [before]
+            if position:
+                after = 'AND created_at >= %s AND (created_at > %s OR id > %s)'
+                params.extend([position[0], position[0], position[1]])
+            cursor.execute(f'''
+                SELECT id, created_at
+                FROM bookings
+                WHERE created_at < %s {after} AND status <> 'active'
+                ORDER BY created_at, id
+                LIMIT %s
+                {self.FOR_UPDATE}
+            ''', params + [batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                self.rollback()
+                break
+
+            booking_ids = [row[0] for row in rows]
+            placeholders = ', '.join(['%s'] * len(booking_ids))
+            cursor.execute(f'''
+                INSERT INTO bookings_archive
+                SELECT * FROM bookings WHERE id IN ({placeholders})
+            ''', booking_ids)
+            cursor.execute(f'DELETE FROM bookings WHERE id IN ({placeholders})', booking_ids)
+            self.commit()
+            moved += len(booking_ids)
+            batches += 1
+            position = tuple(rows[-1])
+            if len(rows) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        cursor.close()
+        return moved
+
+    def booking_tier_counts(self):
+        """Number of bookings in each of BOOKING_TABLES"""
+        return {table: self._fetchone(f'SELECT COUNT(*) as count FROM {table}')['count']
+                for table in BOOKING_TABLES}
+
+    # Billing (lot_tariffs; prices come from billing.TariffTable)
+
+    def lot_tariffs(self, lot_ids=None):
+        """TariffTable of the given lots, or of every lot (deleted ones included)"""
+        where, params = '', None
+        if lot_ids is not None:
+            lot_ids = list(lot_ids)
+            where = 'WHERE p.id IN ({})'.format(', '.join(['%s'] * len(lot_ids)) or 'NULL')
+            params = lot_ids
+        rows = self._fetchall(f'''
+            SELECT p.id, p.price_per_hour, t.hourly_rates, t.daily_cap, t.grace_minutes
+            FROM parking_lots p
+            LEFT JOIN lot_tariffs t ON t.lot_id = p.id
+            {where}
+        ''', params)
+        return TariffTable({row['id']: Tariff.from_row(row) for row in rows})
+
+    def set_lot_tariff(self, lot_id, tariff):
+        """Store a lot's rate table, daily cap and grace period; None reverts the lot to
+        its flat price_per_hour"""
+        cursor = self.cursor()
+        cursor.execute('DELETE FROM lot_tariffs WHERE lot_id = %s', (lot_id,))
+        if tariff is not None:
+            cursor.execute('''
+                INSERT INTO lot_tariffs (lot_id, hourly_rates, daily_cap, grace_minutes)
+                VALUES (%s, %s, %s, %s)
+            ''', (lot_id, tariff.rates_text(), tariff.daily_cap, tariff.grace_minutes))
+        self.commit()
+        cursor.close()
+
+    def _bill_bookings(self, cursor, booking_ids, actual_end, status):
+        """Close active bookings as ``status`` at ``actual_end``, each charged by its lot's
+        tariff in one batch and written with one UPDATE; returns how many changed"""
+        placeholders = ', '.join(['%s'] * len(booking_ids))
+        bookings = self._fetchall(f'''
+            SELECT id, parking_lot_id, actual_start_time, start_time
+            FROM bookings
+            WHERE id IN ({placeholders}) AND status = 'active'
+        ''', list(booking_ids))
+        if not bookings:
+            return 0
+
+        lot_ids = [booking['parking_lot_id'] for booking in bookings]
+        starts = [billed_start(status, booking['actual_start_time'], booking['start_time'], actual_end)
+                  for booking in bookings]
+        costs = self.lot_tariffs(set(lot_ids)).price(lot_ids, starts, [actual_end] * len(bookings))
+
+        cursor.execute('''
+            UPDATE bookings
+            SET status = %s,
+                actual_end_time = %s,
+                actual_cost = CASE id {cases} END,
+                updated_at = NOW()
+            WHERE id IN ({placeholders}) AND status = 'active'
+        '''.format(cases=' '.join(['WHEN %s THEN %s'] * len(bookings)), placeholders=placeholders),
+            [status, actual_end]
+            + [value for booking, cost in zip(bookings, costs) for value in (booking['id'], cost)]
+            + list(booking_ids))
+        return cursor.rowcount
+
+    def _complete_bookings(self, cursor, booking_ids, actual_end):
+        """Mark active bookings completed and bill them up to ``actual_end``"""
+        return self._bill_bookings(cursor, booking_ids, actual_end, 'completed')
+
+    def _cancel_bookings(self, cursor, booking_ids, actual_end):
+        """Mark active bookings cancelled, charging for the time used up to ``actual_end``
+        (nothing when they never started)"""
+        return self._bill_bookings(cursor, booking_ids, actual_end, 'cancelled')
+
+    def booking_stays(self, lot_id=None, start_date=None, end_date=None, chunk_size=50000):
+        """Finished bookings as (lot_ids, durations, charged) column lists of up to
+        ``chunk_size`` rows, for ``TariffTable.rerate``: the microseconds each booking
+        was billed for (-1 for a cancellation that never started) and the cents it was
+        charged. Dates filter on the booking's end."""
+        where = ["status IN ('completed', 'cancelled')", 'actual_end_time IS NOT NULL']
+        params = []
+        if lot_id:
+            where.append('parking_lot_id = %s')
+            params.append(lot_id)
+        if start_date:
+            where.append('actual_end_time >= %s')
+            params.append(start_date)
+        if end_date:
+            where.append('actual_end_time < %s')
+            params.append(end_date + timedelta(days=1))
+        cursor = self.cursor(unbuffered=True)
+        try:
+            for table in reversed(BOOKING_TABLES):
+                # The stay billing.billed_start picks, measured by the database so the
+                # columns reach NumPy as plain integers
+                cursor.execute('''
+                    SELECT parking_lot_id,
+                           CASE WHEN status = 'completed' THEN {completed}
+                                WHEN actual_start_time < actual_end_time THEN {cancelled}
+                                ELSE -1
+                           END,
+                           CAST(ROUND(COALESCE(actual_cost, 0) * 100) AS SIGNED)
+                    FROM {table}
+                    WHERE {where}
+                '''.format(completed=self._microseconds('COALESCE(actual_start_time, start_time)', 'actual_end_time'),
+                           cancelled=self._microseconds('actual_start_time', 'actual_end_time'),
+                           table=table, where=' AND '.join(where)), params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield tuple(list(column) for column in zip(*rows))
+        finally:
+            cursor.close()
+
+    # Occupancy summary (lot_occupancy)
+
+    def _adjust_occupancy(self, cursor, lot_id, total=0, vacant=0, booked=0, deleted=0):
+        """Apply a delta to one lot's counts"""
+        cursor.execute('''
+            UPDATE lot_occupancy
+            SET total_slots = total_slots + %s,
+                vacant = vacant + %s,
+                booked = booked + %s,
+                deleted = deleted + %s,
+                version = version + 1
+            WHERE lot_id = %s
+        ''', (total, vacant, booked, deleted, lot_id))
+
+    def _recount_occupancy(self, cursor, lot_id=None):
+        """Recompute summary rows from parking_slots, for one lot or all of them"""
+        upsert = self._upsert(['lot_id'], ['total_slots', 'vacant', 'booked', 'deleted'])
+        if lot_id is None:
+            cursor.execute(RECOUNT_SQL.format(where='WHERE TRUE', upsert=upsert))
+            cursor.execute('UPDATE lot_occupancy SET version = version + 1')
+        else:
+            cursor.execute(RECOUNT_SQL.format(where='WHERE p.id = %s', upsert=upsert), (lot_id,))
+            cursor.execute('UPDATE lot_occupancy SET version = version + 1 WHERE lot_id = %s', (lot_id,))
+
+    def lot_version(self, lot_id):
+        """Change counter of one lot, or None for an unknown lot.
+
+        Every write that changes a lot's slots bumps ``lot_occupancy.version`` in the
+        same transaction, so an unchanged version means unchanged slots.
+        """
+        row = self._fetchone('SELECT version FROM lot_occupancy WHERE lot_id = %s', (lot_id,))
+        return row['version'] if row else None
+
+    def lots_version(self):
+        """A value that changes whenever any lot or its slots change: the number of lots,
+        the highest lot id and the sum of the (only ever growing) lot versions"""
+        row = self._fetchone('''
+            SELECT COUNT(*) as lots, MAX(lot_id) as last_lot, SUM(version) as versions
+            FROM lot_occupancy
+        ''')
+        return f"{row['lots']}-{row['last_lot'] or 0}-{row['versions'] or 0}"
+
+    def rebuild_occupancy(self):
+        cursor = self.cursor()
+        self._recount_occupancy(cursor)
+        self.commit()
+        cursor.close()
+
+    def verify_occupancy(self):
+        """Compare lot_occupancy with parking_slots and return the rows that differ"""
+        mismatches = []
+        for row in self._fetchall('''
+            SELECT p.id as lot_id,
+                   o.total_slots, o.vacant, o.booked, o.deleted,
+                   COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END) as actual_total_slots,
+                   SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as actual_vacant,
+                   SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END) as actual_booked,
+                   COUNT(CASE WHEN ps.deleted_at IS NOT NULL THEN ps.id END) as actual_deleted
+            FROM parking_lots p
+            LEFT JOIN lot_occupancy o ON o.lot_id = p.id
+            LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+            GROUP BY p.id, o.total_slots, o.vacant, o.booked, o.deleted
+        '''):
+            for column in ('total_slots', 'vacant', 'booked', 'deleted'):
+                if row[column] is None or int(row[column]) != int(row['actual_' + column] or 0):
+                    mismatches.append(row)
+                    break
+        return mismatches
+
+    # Occupancy history (occupancy_history)
+
+    def record_occupancy(self, day, page, position, page_size, interval, values):
+        """Write one occupancy sample per lot, given as {lot_id: value}, at ``position``
+        of page ``page`` (day ``day``, ``page_size`` samples every ``interval``
+        seconds); returns the number of samples written.
+
+        Each lot keeps one row per page, so the table is a ring: a page holding an
+        older day, or samples taken at another interval, starts over empty. A sample
+        another process already wrote at the position is kept.
+        """
+        cursor = self.cursor()
+        self._begin(cursor)
+        cursor.execute(f'''
+            SELECT lot_id, day, sample_interval, samples FROM occupancy_history
+            WHERE page = %s
+            {self.FOR_UPDATE}
+        ''', (page,))
+        pages = {row[0]: row[1:] for row in cursor.fetchall()}
+        rows = []
+        for lot_id, value in values.items():
+            if not value:
+                continue
+            current = pages.get(lot_id)
+            if current and current[0] == day and current[1] == interval and len(current[2]) == 2 * page_size:
+                samples = bytearray(current[2])
+                if samples[2 * position:2 * position + 2] != b'\0\0':
+                    continue
+            else:
+                samples = bytearray(2 * page_size)
+            struct.pack_into('<H', samples, 2 * position, value)
+            rows.append((page, lot_id, day, interval, bytes(samples)))
+        if rows:
+            cursor.executemany(f'''
+                INSERT INTO occupancy_history (page, lot_id, day, sample_interval, samples)
+                VALUES (%s, %s, %s, %s, %s)
+                {self._upsert(['page', 'lot_id'], ['day', 'sample_interval', 'samples'])}
+            ''', rows)
+        self.commit()
+        cursor.close()
+        return len(rows)
+
+    def occupancy_pages(self, lot_id, interval, first_day=None):
+        """(day, samples) of a lot's pages taken every ``interval`` seconds, from day
+        ``first_day`` on when given"""
+        cursor = self.cursor()
+        cursor.execute('''
+            SELECT day, samples FROM occupancy_history
+            WHERE lot_id = %s AND sample_interval = %s AND day >= %s
+            ORDER BY day
+        ''', (lot_id, interval, first_day if first_day is not None else 0))
+        rows = list(cursor.fetchall())
+        cursor.close()
+        return rows
+
+    # Live slot updates (slot_events)
+
+    def _log_slot_events(self, cursor, where, params):
+        """Append the current state of the slots matching ``where`` to slot_events.
+
+        Call after the change, inside its transaction, so the log holds exactly the
+        committed slot states.
+        """
+        cursor.execute(f'''
+            INSERT INTO slot_events (lot_id, slot_id, slot_number, status)
+            SELECT parking_lot_id, id, slot_number, status
+            FROM parking_slots
+            WHERE {where}
+        ''', params)
+
+    def last_slot_event_id(self):
+        row = self._fetchone('SELECT MAX(id) as last_id FROM slot_events')
+        return row['last_id'] or 0
+
+    def slot_events_after(self, event_id, limit=1000, missing=()):
+        """Up to ``limit`` logged slot changes with an id above ``event_id``, plus those
+        with an id in ``missing``, oldest first"""
+        extra = ''
+        if missing:
+            extra = 'OR id IN ({})'.format(', '.join(['%s'] * len(missing)))
+        return self._fetchall(f'''
+            SELECT id, lot_id, slot_id, slot_number, status
+            FROM slot_events
+            WHERE id > %s {extra}
+            ORDER BY id
+            LIMIT %s
+        ''', [event_id] + list(missing) + [int(limit) + len(missing)])
+
+    def prune_slot_events(self, before):
+        """Delete slot_events logged before ``before``; returns how many"""
+        cursor = self.cursor()
+        cursor.execute('DELETE FROM slot_events WHERE created_at < %s', (before,))
+        pruned = cursor.rowcount
+        self.commit()
+        cursor.close()
+        return pruned
+
+    # Revenue rollups (revenue_daily, revenue_monthly)
+
+    def _record_revenue(self, cursor, booking_ids):
+        """Add just-settled bookings to the rollups"""
+        if not booking_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(booking_ids))
+        for table, period, period_expression in ROLLUP_TABLES:
+            cursor.execute('''
+                INSERT INTO {table} (lot_id, {period}, completed_revenue, completed_bookings,
+                                     cancelled_revenue, cancelled_bookings)
+                SELECT parking_lot_id, {period_expression}, {columns}
+                FROM bookings
+                WHERE id IN ({placeholders}) AND {revenue_bookings}
+                GROUP BY parking_lot_id, {period_expression}
+                {upsert}
+            '''.format(table=table, period=period, columns=ROLLUP_COLUMNS,
+                       period_expression=period_expression.replace('%', '%%'),
+                       placeholders=placeholders, revenue_bookings=REVENUE_BOOKINGS,
+                       upsert=self._upsert(['lot_id', period],
+                                           ['completed_revenue', 'completed_bookings',
+                                            'cancelled_revenue', 'cancelled_bookings'],
+                                           accumulate=True)),
+                list(booking_ids))
+
+    def backfill_revenue(self):
+        """Rebuild both rollup tables from the full booking history, archive included"""
+        cursor = self.cursor()
+        for table, period, period_expression in ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute('''
+                INSERT INTO {table} (lot_id, {period}, completed_revenue, completed_bookings,
+                                     cancelled_revenue, cancelled_bookings)
+                SELECT parking_lot_id, {period_expression}, {columns}
+                FROM {all_bookings} bookings
+                WHERE {revenue_bookings}
+                GROUP BY parking_lot_id, {period_expression}
+            '''.format(table=table, period=period, columns=ROLLUP_COLUMNS, all_bookings=ALL_BOOKINGS,
+                       period_expression=period_expression, revenue_bookings=REVENUE_BOOKINGS))
+        self.commit()
+        cursor.execute('SELECT COUNT(*) FROM revenue_daily')
+        daily_rows = cursor.fetchone()[0]
+        cursor.close()
+        return daily_rows
+
+    def lot_daily_revenue(self, lot_id=None, start_date=None, end_date=None):
+        """Completed and cancellation revenue per lot per day, newest first"""
+        conditions = []
+        params = []
+        if lot_id is not None:
+            conditions.append('lot_id = %s')
+            params.append(lot_id)
+        if start_date is not None:
+            conditions.append('day >= %s')
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append('day <= %s')
+            params.append(end_date)
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+        return self._fetchall(f'''
+            SELECT lot_id, day, completed_revenue, completed_bookings,
+                   cancelled_revenue, cancelled_bookings
+            FROM revenue_daily
+            {where}
+            ORDER BY day DESC, lot_id
+        ''', params)
+
+
+# MySQL backend
+
+
+class MySQLRepository(Repository):
+    """Repository over a MySQLdb connection (InnoDB row locks, ON DUPLICATE KEY upserts)"""
+
+    backend = 'mysql'
+    FOR_UPDATE = 'FOR UPDATE'
+    FOR_UPDATE_SKIP_LOCKED = 'FOR UPDATE SKIP LOCKED'
+    INSERT_IGNORE = 'INSERT IGNORE'
+
+    def _open_cursor(self, dictionary=False, unbuffered=False):
+        # Imported here so the SQLite backend runs without the MySQL client library
+        import MySQLdb.cursors
+        if unbuffered:
+            return self.connection.cursor(MySQLdb.cursors.SSDictCursor if dictionary else MySQLdb.cursors.SSCursor)
+        return self.connection.cursor(MySQLdb.cursors.DictCursor if dictionary else None)
+
+    def _upsert(self, key_columns, columns, accumulate=False):
+        template = '{0} = {0} + VALUES({0})' if accumulate else '{0} = VALUES({0})'
+        return 'ON DUPLICATE KEY UPDATE ' + ', '.join(template.format(column) for column in columns)
+
+    def _microseconds(self, start, end):
+        return f'TIMESTAMPDIFF(MICROSECOND, {start}, {end})'
+
+    def _prepare_archive(self, cursor, before):
+        # One partition per month up to the month of ``before``, split off the empty
+        # p_future partition; months older than the first partition all land in it
+        cursor.execute('''
+            SELECT PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bookings_archive'
+              AND PARTITION_NAME <> 'p_future'
+        ''')
+        bounds = [row[0].strip("'") for row in cursor.fetchall()]
+        if bounds:
+            month = datetime.strptime(max(bounds)[:10], '%Y-%m-%d')
+        else:
+            cursor.execute('''
+                SELECT MIN(created_at) FROM bookings
+                WHERE created_at < %s AND status <> 'active'
+            ''', (before,))
+            oldest = cursor.fetchone()[0]
+            if oldest is None:
+                return
+            month = oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        partitions = []
+        while month <= before:
+            following = (month + timedelta(days=32)).replace(day=1)
+            partitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{following:%Y-%m-%d}')")
+            month = following
+        if partitions:
+            # DDL commits implicitly, so this runs before the first batch
+            cursor.execute('''
+                ALTER TABLE bookings_archive REORGANIZE PARTITION p_future INTO (
+                    {}, PARTITION p_future VALUES LESS THAN (MAXVALUE))
+            '''.format(', '.join(partitions)))
+
+    def _free_slots_occupancy(self, cursor, booking_ids):
+        cursor.execute('''
+            UPDATE lot_occupancy o
+            JOIN (
+                SELECT parking_lot_id, COUNT(*) as freed
+                FROM parking_slots
+                WHERE booking_id IN ({placeholders}) AND status = 'booked'
+                GROUP BY parking_lot_id
+            ) f ON o.lot_id = f.parking_lot_id
+            SET o.vacant = o.vacant + f.freed,
+                o.booked = o.booked - f.freed,
+                o.version = o.version + 1
+        '''.format(placeholders=', '.join(['%s'] * len(booking_ids))), list(booking_ids))
+
+
+# SQLite backend
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+
+
+def _sqlite_date_format(value, format):
+    """MySQL's DATE_FORMAT for the specifiers the queries use (%Y, %m, %d)"""
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).strftime(format)
+
+
+_schema_lock = threading.Lock()
+
+
+def connect_sqlite(path):
+    """Open a SQLite database for SQLiteRepository, creating the schema if it is empty.
+
+    Every ``:memory:`` connection is a separate, freshly seeded database, so the pool
+    keeps exactly one of them (see db.pool_size).
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                 detect_types=sqlite3.PARSE_DECLTYPES)
+    connection.execute('PRAGMA foreign_keys = ON')
+    if path != ':memory:':
+        # Readers keep going while a writer commits
+        connection.execute('PRAGMA journal_mode = WAL')
+    connection.create_function('NOW', 0, lambda: datetime.now().isoformat(' '))
+    connection.create_function('DATE_FORMAT', 2, _sqlite_date_format, deterministic=True)
+
+    # The schema goes in as one transaction, and one thread at a time checks for it,
+    # so no connection sees a half-created database
+    with _schema_lock:
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone():
+            with open(SQLITE_SCHEMA) as schema:
+                connection.executescript('BEGIN;\n' + schema.read() + '\nCOMMIT;')
+    return connection
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that takes MySQLdb-style ``%s`` placeholders and ``%%`` escapes"""
+
+    PLACEHOLDER = re.compile(r'%([s%])')
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = lambda cursor, row: {
+                column[0]: value for column, value in zip(cursor.description, row)}
+
+    def _translate(self, query):
+        return self.PLACEHOLDER.sub(lambda match: '?' if match.group(1) == 's' else '%', query)
+
+    def execute(self, query, params=None):
+        # Like MySQLdb, placeholders and escapes are only processed when params are given
+        if params is None:
+            self._cursor.execute(query)
+        else:
+            self._cursor.execute(self._translate(query), tuple(params))
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(self._translate(query), [tuple(params) for params in seq_of_params])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteRepository(Repository):
+    """Repository over a connection from ``connect_sqlite``.
+
+    SQLite has no row locks: transactions that read rows they are about to change take
+    the database write lock up front (BEGIN IMMEDIATE), which serializes writers and
+    gives the same guarantees the MySQL backend gets from FOR UPDATE.
+    """
+
+    backend = 'sqlite'
+    INSERT_IGNORE = 'INSERT OR IGNORE'
+
+    def _open_cursor(self, dictionary=False, unbuffered=False):
+        # sqlite3 cursors always step through results row by row
+        return SQLiteCursor(self.connection.cursor(), dictionary)
+
+    def _begin(self, cursor):
+        if not self.connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+
+    def _upsert(self, key_columns, columns, accumulate=False):
+        template = '{0} = {0} + excluded.{0}' if accumulate else '{0} = excluded.{0}'
+        return 'ON CONFLICT ({}) DO UPDATE SET {}'.format(
+            ', '.join(key_columns), ', '.join(template.format(column) for column in columns))
+
+    def _microseconds(self, start, end):
+        # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]' text: whole seconds
+        # from strftime plus the fraction, padded when there is none
+        return (f"((CAST(strftime('%%s', {end}) AS INTEGER) - CAST(strftime('%%s', {start}) AS INTEGER)) * 1000000"
+                f" + CAST(substr({end} || '.000000', 21, 6) AS INTEGER)"
+                f" - CAST(substr({start} || '.000000', 21, 6) AS INTEGER))")
+
+    def _free_slots_occupancy(self, cursor, booking_ids):
+        cursor.execute('''
+            UPDATE lot_occupancy
+            SET vacant = vacant + f.freed,
+                booked = booked - f.freed,
+                version = version + 1
+            FROM (
+                SELECT parking_lot_id, COUNT(*) as freed
+                FROM parking_slots
+                WHERE booking_id IN ({placeholders}) AND status = 'booked'
+                GROUP BY parking_lot_id
+            ) f
+            WHERE lot_occupancy.lot_id = f.parking_lot_id
+        '''.format(placeholders=', '.join(['%s'] * len(booking_ids))), list(booking_ids))
+
+
+BACKENDS = {
+    'mysql': MySQLRepository,
+    'sqlite': SQLiteRepository,
+}
+
+
+def create_repository(backend, connection, wrap_cursor=None):
+    """Repository of the given backend ('mysql' or 'sqlite') over ``connection``"""
+    return BACKENDS[backend](connection, wrap_cursor)
@@ -0,0 +1,231 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+EPOCH = datetime(1970, 1, 1)
+# Held until further notice: a booked slot whose booking has no end time
+FOREVER = 2 ** 62
+
+
+def seconds(moment):
+    """A naive datetime as the whole seconds since 1970 the schedules store"""
+    return int((moment - EPOCH).total_seconds())
+
+
+class SlotSchedule:
+    """When each slot of one lot is taken: the reservations not ended yet, and the end
+    of the booking holding the slot now.
+
+    Per slot, the reservations live in two ``array('q')`` of start and end seconds
+    sorted by start. The reservations of a slot never overlap (Repository checks that
+    under the slot's row lock), so their ends are sorted as well and whether a slot is
+    free for a window is one bisection of its ends: O(log n) in the slot's
+    reservations, with no query. 100,000 reservations take about 1.5 MB.
+
+    ``version`` and ``reservation_version`` are the lot_occupancy counters the slots
+    and the reservations were read at (see SlotSchedules).
+    """
+
+    def __init__(self, lot_id, version, slots, reservation_version, reservations):
+        """``slots`` as ``Repository.schedule_slots`` and ``reservations`` as
+        ``Repository.schedule_reservations`` return them"""
+        self.lot_id = lot_id
+        self.reservation_version = reservation_version
+        self.loaded_at = time.monotonic()
+        # Changes applied ahead of reservation_version, by version
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._starts = {}
+        self._ends = {}
+        for slot_id, start_time, end_time in reservations:
+            if slot_id not in self._starts:
+                self._starts[slot_id] = array('q')
+                self._ends[slot_id] = array('q')
+            self._starts[slot_id].append(seconds(start_time))
+            self._ends[slot_id].append(seconds(end_time))
+        self.set_slots(version, slots)
+
+    def set_slots(self, version, slots):
+        """Replace the lot's slots and the bookings holding them, read at ``version``"""
+        numbered = []
+        booked_until = {}
+        for slot_number, slot_id, status, end_time in slots:
+            numbered.append((slot_number, slot_id))
+            if status == 'booked':
+                booked_until[slot_id] = seconds(end_time) if end_time else FOREVER
+        with self._lock:
+            self.version = version
+            self._slots = numbered
+            self._slot_ids = {slot_id for _, slot_id in numbered}
+            self._booked_until = booked_until
+
+    def _free(self, slot_id, start, end):
+        if self._booked_until.get(slot_id, 0) > start:
+            return False
+        ends = self._ends.get(slot_id)
+        if not ends:
+            return True
+        # The first reservation ending after the window starts must start after it ends
+        index = bisect_right(ends, start)
+        return index == len(ends) or self._starts[slot_id][index] >= end
+
+    def is_free(self, slot_id, start_time, end_time):
+        """Whether the slot is free for the whole window"""
+        start, end = seconds(start_time), seconds(end_time)
+        with self._lock:
+            return slot_id in self._slot_ids and self._free(slot_id, start, end)
+
+    def free_slots(self, start_time, end_time, limit=None):
+        """(slot_number, slot_id) of the slots free for the whole window, by slot number"""
+        start, end = seconds(start_time), seconds(end_time)
+        free = []
+        with self._lock:
+            for slot_number, slot_id in self._slots:
+                if self._free(slot_id, start, end):
+                    free.append((slot_number, slot_id))
+                    if len(free) == limit:
+                        break
+        return free
+
+    def apply(self, reservation_version, slot_id, start_time, end_time, reserved):
+        """Add (``reserved``) or remove a reservation written at ``reservation_version``.
+
+        Changes may arrive out of order from concurrent requests: ``reservation_version``
+        only moves on once every change up to it has been applied.
+        """
+        start, end = seconds(start_time), seconds(end_time)
+        with self._lock:
+            if reservation_version <= self.reservation_version:
+                # Already part of the reservations this schedule was loaded from
+                return
+            starts = self._starts.setdefault(slot_id, array('q'))
+            ends = self._ends.setdefault(slot_id, array('q'))
+            index = bisect_left(starts, start)
+            present = index < len(starts) and starts[index] == start and ends[index] == end
+            if reserved and not present:
+                starts.insert(index, start)
+                ends.insert(index, end)
+            elif not reserved and present:
+                del starts[index]
+                del ends[index]
+            self._pending[reservation_version] = (slot_id, start_time, end_time, reserved)
+            while self.reservation_version + 1 in self._pending:
+                self.reservation_version += 1
+                del self._pending[self.reservation_version]
+
+    def replay(self, other):
+        """Apply the changes ``other`` holds ahead of its reservation_version, when
+        this schedule replaces it"""
+        with other._lock:
+            pending = sorted(other._pending.items())
+        for reservation_version, change in pending:
+            self.apply(reservation_version, *change)
+
+    def __len__(self):
+        """Number of reservations held"""
+        return sum(len(starts) for starts in self._starts.values())
+
+    def nbytes(self):
+        return sum(starts.itemsize * len(starts) * 2 for starts in self._starts.values())
+
+
+class SlotSchedules:
+    """Per-process cache of the SlotSchedule of the most recently searched lots.
+
+    As with occupancy.SlotMaps, every use first reads the lot's counters from
+    lot_occupancy. A changed ``version`` (any slot change, walk-in bookings included)
+    reloads the lot's slots, one row each. The reservations, which can run into the
+    hundreds of thousands, are applied in place when they are made, checked in or
+    cancelled through this process (``reserved``, ``released``), and only reloaded
+    when ``reservation_version`` shows changes the schedule lacks and it is more than
+    ``max_staleness`` seconds old. A stale schedule can offer a slot that has just been
+    reserved, which Repository.create_reservation then skips, but can never cause a
+    double reservation. At most ``max_lots`` schedules are kept.
+    """
+
+    def __init__(self, max_lots=50, max_staleness=1.0):
+        self.max_lots = max_lots
+        self.max_staleness = max_staleness
+        self._schedules = OrderedDict()
+        # Changes made while a lot with nothing cached loads, for the loads to apply
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.slot_loads = 0
+        self.loads = 0
+
+    def get(self, repository, lot_id):
+        """The current SlotSchedule of a lot, or None for an unknown lot"""
+        versions = repository.schedule_versions(lot_id)
+        if versions is None:
+            return None
+        version, reservation_version = versions
+        with self._lock:
+            schedule = self._schedules.get(lot_id)
+            if schedule is not None:
+                self._schedules.move_to_end(lot_id)
+            else:
+                missed = self._loading.setdefault(lot_id, [])
+
+        # Versions are read first: a write landing in between only makes a later use reload
+        if schedule is None or (schedule.reservation_version < reservation_version
+                                and time.monotonic() - schedule.loaded_at > self.max_staleness):
+            schedule = SlotSchedule(lot_id, version, repository.schedule_slots(lot_id), reservation_version,
+                                    repository.schedule_reservations(lot_id, datetime.now()))
+            with self._lock:
+                self.loads += 1
+                current = self._schedules.get(lot_id)
+                if current is not None and current.reservation_version > schedule.reservation_version:
+                    # Another request loaded a newer one meanwhile
+                    schedule = current
+                else:
+                    # Keep what was applied to the schedule being replaced while this one loaded
+                    if current is not None:
+                        schedule.replay(current)
+                    else:
+                        for change in missed:
+                            schedule.apply(*change)
+                        self._loading.pop(lot_id, None)
+                    self._schedules[lot_id] = schedule
+                self._schedules.move_to_end(lot_id)
+                while len(self._schedules) > self.max_lots:
+                    self._schedules.popitem(last=False)
+        elif schedule.version < version:
+            schedule.set_slots(version, repository.schedule_slots(lot_id))
+            self.slot_loads += 1
+        else:
+            self.hits += 1
+        return schedule
+
+    def _apply(self, reservation, reserved):
+        # Under the cache lock, so a schedule cannot be replaced halfway
+        with self._lock:
+            change = (reservation['reservation_version'], reservation['slot_id'],
+                      reservation['start_time'], reservation['end_time'], reserved)
+            schedule = self._schedules.get(reservation['parking_lot_id'])
+            if schedule is not None:
+                schedule.apply(*change)
+            elif reservation['parking_lot_id'] in self._loading:
+                self._loading[reservation['parking_lot_id']].append(change)
+
+    # Write-through hooks, called with the reservation returned by the repository
+
+    def reserved(self, reservation):
+        self._apply(reservation, True)
+
+    def released(self, reservation):
+        self._apply(reservation, False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lots_cached': len(self._schedules),
+                'reservations': sum(len(schedule) for schedule in self._schedules.values()),
+                'bytes': sum(schedule.nbytes() for schedule in self._schedules.values()),
+                'hits': self.hits,
+                'slot_loads': self.slot_loads,
+                'loads': self.loads
+            }
@@ -21,6 +21,8 @@ CREATE TABLE IF NOT EXISTS parking_lots (
     name VARCHAR(100) NOT NULL,
     location VARCHAR(255) NOT NULL,
     price_per_hour DECIMAL(10, 2) NOT NULL,
+    latitude DECIMAL(9, 6) NULL DEFAULT NULL,
+    longitude DECIMAL(9, 6) NULL DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     deleted_at TIMESTAMP NULL DEFAULT NULL
@@ -62,6 +64,138 @@ CREATE TABLE IF NOT EXISTS bookings (
     FOREIGN KEY (slot_id) REFERENCES parking_slots(id) ON DELETE SET NULL
 );
 
+-- Per-lot slot counts, kept in step with parking_slots by every slot state change
+CREATE TABLE IF NOT EXISTS lot_occupancy (
+    lot_id INT PRIMARY KEY,
+    total_slots INT NOT NULL DEFAULT 0,
+    vacant INT NOT NULL DEFAULT 0,
+    booked INT NOT NULL DEFAULT 0,
+    deleted INT NOT NULL DEFAULT 0,
+    -- Bumped by every change to the lot's slots; the availability API's ETags use it
+    version BIGINT NOT NULL DEFAULT 0,
+    -- Bumped by every reservation made, checked in or cancelled in the lot
+    reservation_version BIGINT NOT NULL DEFAULT 0,
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+-- Revenue rollups per lot and day/month of actual_end_time, updated when a booking is
+-- completed or cancelled with a charge (`flask revenue backfill` rebuilds them)
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    lot_id INT NOT NULL,
+    day DATE NOT NULL,
+    completed_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, day),
+    KEY idx_revenue_daily_day (day),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS revenue_monthly (
+    lot_id INT NOT NULL,
+    month DATE NOT NULL,
+    completed_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, month),
+    KEY idx_revenue_monthly_month (month),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+-- Slot status changes for the live update streams (/api/lots/<id>/events): every write
+-- that changes a slot appends its new state here in the same transaction. The app
+-- polls it and deletes rows older than LIVE_UPDATES_RETENTION_MINUTES.
+CREATE TABLE IF NOT EXISTS slot_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    lot_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    slot_number INT NOT NULL,
+    status ENUM('vacant', 'booked', 'deleted') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_slot_events_created_at (created_at)
+);
+
+-- Occupancy sampled every OCCUPANCY_SAMPLE_INTERVAL seconds, one row per lot and day
+-- of a ring of OCCUPANCY_HISTORY_DAYS pages (page = day number modulo that). samples
+-- holds a little-endian uint16 per sample: occupancy in basis points plus one, 0 for
+-- none. 288 samples a day at 5 minutes make 576 bytes per lot and day.
+CREATE TABLE IF NOT EXISTS occupancy_history (
+    page INT NOT NULL,
+    lot_id INT NOT NULL,
+    day INT NOT NULL,
+    sample_interval INT NOT NULL,
+    samples BLOB NOT NULL,
+    PRIMARY KEY (page, lot_id),
+    KEY idx_occupancy_history_lot_day (lot_id, day),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+-- Optional per-lot tariffs (see billing.Tariff); lots without a row charge their flat
+-- price_per_hour. hourly_rates lists the price of the 1st, 2nd, ... hour of each day,
+-- the last one repeating
+CREATE TABLE IF NOT EXISTS lot_tariffs (
+    lot_id INT PRIMARY KEY,
+    hourly_rates VARCHAR(255) NOT NULL,
+    daily_cap DECIMAL(10, 2) NULL,
+    grace_minutes INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+-- Settled bookings moved out of the live table by `flask archive-bookings` once they
+-- are ARCHIVE_AFTER_DAYS old. Same columns in the same order as bookings, partitioned
+-- by the month the booking was made; the archiver adds partitions as it needs them,
+-- splitting p_future. Partitioned tables cannot have foreign keys.
+CREATE TABLE IF NOT EXISTS bookings_archive (
+    id INT NOT NULL,
+    user_id INT NOT NULL,
+    parking_lot_id INT NOT NULL,
+    slot_id INT NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type ENUM('car', 'motorcycle', 'truck', 'van') NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    actual_start_time DATETIME NULL,
+    actual_end_time DATETIME NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    actual_cost DECIMAL(10, 2) NULL,
+    status ENUM('active', 'completed', 'cancelled') NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id, created_at),
+    KEY idx_bookings_archive_created_at_id (created_at, id),
+    KEY idx_bookings_archive_status_created_at_id (status, created_at, id),
+    KEY idx_bookings_archive_lot_created_at_id (parking_lot_id, created_at, id),
+    KEY idx_bookings_archive_user_created_at_id (user_id, created_at, id),
+    KEY idx_bookings_archive_vehicle_number (vehicle_number)
+)
+PARTITION BY RANGE COLUMNS (created_at) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- Advance reservations: a slot held for a future [start_time, end_time) window until it
+-- is checked in as an active booking (booking_id) or cancelled. Reservations of one slot
+-- never overlap: they are only written while holding the slot's row lock.
+CREATE TABLE IF NOT EXISTS reservations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    parking_lot_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type ENUM('car', 'motorcycle', 'truck', 'van') NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    status ENUM('reserved', 'checked_in', 'cancelled') DEFAULT 'reserved',
+    booking_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (parking_lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE,
+    FOREIGN KEY (slot_id) REFERENCES parking_slots(id) ON DELETE CASCADE
+);
+
 -- Drop old tables if they exist (migration)
 -- DROP TABLE IF EXISTS old_bookings;
 -- DROP TABLE IF EXISTS old_parking_lots;
@@ -139,6 +273,17 @@ SELECT 5, n, 'vacant' FROM (
     WHERE a.n + b.n * 10 + 1 <= 80
 ) numbers;
 
+-- Fill the occupancy summary for the sample lots
+INSERT INTO lot_occupancy (lot_id, total_slots, vacant, booked, deleted)
+SELECT p.id,
+       COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END),
+       SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       COUNT(CASE WHEN ps.deleted_at IS NOT NULL THEN ps.id END)
+FROM parking_lots p
+LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+GROUP BY p.id;
+
 -- Create indexes for better performance
 CREATE INDEX idx_bookings_user_id ON bookings(user_id);
 CREATE INDEX idx_bookings_parking_lot_id ON bookings(parking_lot_id);
@@ -150,3 +295,16 @@ CREATE INDEX idx_parking_slots_status ON parking_slots(status);
 CREATE INDEX idx_parking_slots_booking_id ON parking_slots(booking_id);
 CREATE INDEX idx_parking_lots_deleted_at ON parking_lots(deleted_at);
 CREATE INDEX idx_parking_slots_deleted_at ON parking_slots(deleted_at);
+CREATE INDEX idx_lot_occupancy_vacant ON lot_occupancy(vacant);
+-- Keyset pagination of the admin booking list, newest first, optionally per status or lot
+CREATE INDEX idx_bookings_created_at_id ON bookings(created_at, id);
+CREATE INDEX idx_bookings_status_created_at_id ON bookings(status, created_at, id);
+CREATE INDEX idx_bookings_lot_created_at_id ON bookings(parking_lot_id, created_at, id);
+CREATE INDEX idx_bookings_vehicle_number ON bookings(vehicle_number);
+-- Booking history per user: newest-first pages and the active-bookings lookup
+CREATE INDEX idx_bookings_user_created_at_id ON bookings(user_id, created_at, id);
+CREATE INDEX idx_bookings_user_status_created_at_id ON bookings(user_id, status, created_at, id);
+-- Reservations: overlap checks per slot, a lot's schedule, a user's upcoming ones
+CREATE INDEX idx_reservations_slot_status_start ON reservations(slot_id, status, start_time);
+CREATE INDEX idx_reservations_lot_status_end ON reservations(parking_lot_id, status, end_time);
+CREATE INDEX idx_reservations_user_status_start ON reservations(user_id, status, start_time);
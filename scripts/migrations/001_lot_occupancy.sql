@@ -0,0 +1,27 @@
+-- Adds the lot_occupancy summary table to an existing parking_app database.
+-- Run once: mysql -u root -p parking_app < scripts/migrations/001_lot_occupancy.sql
+-- Afterwards `flask occupancy verify` should report 0 mismatched lots.
+USE parking_app;
+
+CREATE TABLE IF NOT EXISTS lot_occupancy (
+    lot_id INT PRIMARY KEY,
+    total_slots INT NOT NULL DEFAULT 0,
+    vacant INT NOT NULL DEFAULT 0,
+    booked INT NOT NULL DEFAULT 0,
+    deleted INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+INSERT INTO lot_occupancy (lot_id, total_slots, vacant, booked, deleted)
+SELECT p.id,
+       COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END),
+       SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       COUNT(CASE WHEN ps.deleted_at IS NOT NULL THEN ps.id END)
+FROM parking_lots p
+LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+GROUP BY p.id
+ON DUPLICATE KEY UPDATE total_slots = VALUES(total_slots), vacant = VALUES(vacant),
+                        booked = VALUES(booked), deleted = VALUES(deleted);
+
+CREATE INDEX idx_lot_occupancy_vacant ON lot_occupancy(vacant);
@@ -0,0 +1,29 @@
+-- Adds the revenue_daily / revenue_monthly rollups to an existing parking_app database.
+-- Run once, then fill them from history with `flask revenue backfill`.
+USE parking_app;
+
+-- Revenue rollups per lot and day/month of actual_end_time, updated when a booking is
+-- completed or cancelled with a charge (`flask revenue backfill` rebuilds them)
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    lot_id INT NOT NULL,
+    day DATE NOT NULL,
+    completed_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, day),
+    KEY idx_revenue_daily_day (day),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS revenue_monthly (
+    lot_id INT NOT NULL,
+    month DATE NOT NULL,
+    completed_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, month),
+    KEY idx_revenue_monthly_month (month),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
@@ -0,0 +1,8 @@
+-- Indexes for keyset pagination and filtering on /admin/bookings.
+USE parking_app;
+
+-- Keyset pagination of the admin booking list, newest first, optionally per status or lot
+CREATE INDEX idx_bookings_created_at_id ON bookings(created_at, id);
+CREATE INDEX idx_bookings_status_created_at_id ON bookings(status, created_at, id);
+CREATE INDEX idx_bookings_lot_created_at_id ON bookings(parking_lot_id, created_at, id);
+CREATE INDEX idx_bookings_vehicle_number ON bookings(vehicle_number);
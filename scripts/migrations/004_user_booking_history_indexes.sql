@@ -0,0 +1,6 @@
+-- Indexes for the paginated /my-bookings history.
+USE parking_app;
+
+-- Booking history per user: newest-first pages and the active-bookings lookup
+CREATE INDEX idx_bookings_user_created_at_id ON bookings(user_id, created_at, id);
+CREATE INDEX idx_bookings_user_status_created_at_id ON bookings(user_id, status, created_at, id);
@@ -0,0 +1,4 @@
+-- Per-lot change counter behind the ETags of the /api/lots availability API.
+USE parking_app;
+
+ALTER TABLE lot_occupancy ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
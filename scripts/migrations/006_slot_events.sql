@@ -0,0 +1,12 @@
+-- Adds the slot_events log behind the live slot update streams.
+USE parking_app;
+
+CREATE TABLE IF NOT EXISTS slot_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    lot_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    slot_number INT NOT NULL,
+    status ENUM('vacant', 'booked', 'deleted') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_slot_events_created_at (created_at)
+);
@@ -0,0 +1,10 @@
+-- Adds per-lot tariffs (rate tables, daily caps, grace periods) for the billing engine.
+USE parking_app;
+
+CREATE TABLE IF NOT EXISTS lot_tariffs (
+    lot_id INT PRIMARY KEY,
+    hourly_rates VARCHAR(255) NOT NULL,
+    daily_cap DECIMAL(10, 2) NULL,
+    grace_minutes INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
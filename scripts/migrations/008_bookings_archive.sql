@@ -0,0 +1,29 @@
+-- Adds the archive tier for settled bookings (see `flask archive-bookings`).
+USE parking_app;
+
+CREATE TABLE IF NOT EXISTS bookings_archive (
+    id INT NOT NULL,
+    user_id INT NOT NULL,
+    parking_lot_id INT NOT NULL,
+    slot_id INT NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type ENUM('car', 'motorcycle', 'truck', 'van') NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    actual_start_time DATETIME NULL,
+    actual_end_time DATETIME NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    actual_cost DECIMAL(10, 2) NULL,
+    status ENUM('active', 'completed', 'cancelled') NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id, created_at),
+    KEY idx_bookings_archive_created_at_id (created_at, id),
+    KEY idx_bookings_archive_status_created_at_id (status, created_at, id),
+    KEY idx_bookings_archive_lot_created_at_id (parking_lot_id, created_at, id),
+    KEY idx_bookings_archive_user_created_at_id (user_id, created_at, id),
+    KEY idx_bookings_archive_vehicle_number (vehicle_number)
+)
+PARTITION BY RANGE COLUMNS (created_at) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
@@ -0,0 +1,27 @@
+-- Adds advance reservations and the per-lot counter their schedules are cached by.
+USE parking_app;
+
+ALTER TABLE lot_occupancy ADD COLUMN reservation_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS reservations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    parking_lot_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type ENUM('car', 'motorcycle', 'truck', 'van') NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    status ENUM('reserved', 'checked_in', 'cancelled') DEFAULT 'reserved',
+    booking_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (parking_lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE,
+    FOREIGN KEY (slot_id) REFERENCES parking_slots(id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_reservations_slot_status_start ON reservations(slot_id, status, start_time);
+CREATE INDEX idx_reservations_lot_status_end ON reservations(parking_lot_id, status, end_time);
+CREATE INDEX idx_reservations_user_status_start ON reservations(user_id, status, start_time);
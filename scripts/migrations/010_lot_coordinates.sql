@@ -0,0 +1,6 @@
+-- Adds lot coordinates for the nearest-lot search (see `flask lot-coordinates`).
+USE parking_app;
+
+ALTER TABLE parking_lots
+    ADD COLUMN latitude DECIMAL(9, 6) NULL DEFAULT NULL,
+    ADD COLUMN longitude DECIMAL(9, 6) NULL DEFAULT NULL;
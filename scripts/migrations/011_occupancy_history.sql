@@ -0,0 +1,13 @@
+-- Adds the ring of per-lot occupancy samples behind the admin occupancy heatmap.
+USE parking_app;
+
+CREATE TABLE IF NOT EXISTS occupancy_history (
+    page INT NOT NULL,
+    lot_id INT NOT NULL,
+    day INT NOT NULL,
+    sample_interval INT NOT NULL,
+    samples BLOB NOT NULL,
+    PRIMARY KEY (page, lot_id),
+    KEY idx_occupancy_history_lot_day (lot_id, day),
+    FOREIGN KEY (lot_id) REFERENCES parking_lots(id) ON DELETE CASCADE
+);
@@ -0,0 +1,199 @@
+-- Schema and sample data for the embedded SQLite backend (DB_BACKEND = 'sqlite').
+-- The app loads this file into any SQLite database that has no tables yet; it mirrors
+-- enhanced_database_setup.sql. Timestamps are stored as ISO 8601 text in local time.
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS parking_lots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    location VARCHAR(255) NOT NULL,
+    price_per_hour DECIMAL(10, 2) NOT NULL,
+    latitude DECIMAL(9, 6) NULL DEFAULT NULL,
+    longitude DECIMAL(9, 6) NULL DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    deleted_at TIMESTAMP NULL DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS parking_slots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    parking_lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    slot_number INT NOT NULL,
+    status VARCHAR(10) DEFAULT 'vacant' CHECK (status IN ('vacant', 'booked', 'deleted')),
+    booking_id INT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    deleted_at TIMESTAMP NULL DEFAULT NULL,
+    UNIQUE (parking_lot_id, slot_number)
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    parking_lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    slot_id INT NULL REFERENCES parking_slots(id) ON DELETE SET NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type VARCHAR(10) NOT NULL CHECK (vehicle_type IN ('car', 'motorcycle', 'truck', 'van')),
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    actual_start_time DATETIME NULL,
+    actual_end_time DATETIME NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    actual_cost DECIMAL(10, 2) NULL,
+    status VARCHAR(10) DEFAULT 'active' CHECK (status IN ('active', 'completed', 'cancelled')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS lot_occupancy (
+    lot_id INT PRIMARY KEY REFERENCES parking_lots(id) ON DELETE CASCADE,
+    total_slots INT NOT NULL DEFAULT 0,
+    vacant INT NOT NULL DEFAULT 0,
+    booked INT NOT NULL DEFAULT 0,
+    deleted INT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    reservation_version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    completed_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS revenue_monthly (
+    lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    completed_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    completed_bookings INT NOT NULL DEFAULT 0,
+    cancelled_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    cancelled_bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot_id, month)
+);
+
+CREATE TABLE IF NOT EXISTS occupancy_history (
+    page INT NOT NULL,
+    lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    day INT NOT NULL,
+    sample_interval INT NOT NULL,
+    samples BLOB NOT NULL,
+    PRIMARY KEY (page, lot_id)
+);
+
+CREATE TABLE IF NOT EXISTS slot_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lot_id INT NOT NULL,
+    slot_id INT NOT NULL,
+    slot_number INT NOT NULL,
+    status VARCHAR(10) NOT NULL CHECK (status IN ('vacant', 'booked', 'deleted')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS lot_tariffs (
+    lot_id INT PRIMARY KEY REFERENCES parking_lots(id) ON DELETE CASCADE,
+    hourly_rates VARCHAR(255) NOT NULL,
+    daily_cap DECIMAL(10, 2),
+    grace_minutes INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS bookings_archive (
+    id INTEGER NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    parking_lot_id INT NOT NULL,
+    slot_id INT NULL,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type VARCHAR(10) NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    actual_start_time DATETIME NULL,
+    actual_end_time DATETIME NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    actual_cost DECIMAL(10, 2) NULL,
+    status VARCHAR(10) NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    parking_lot_id INT NOT NULL REFERENCES parking_lots(id) ON DELETE CASCADE,
+    slot_id INT NOT NULL REFERENCES parking_slots(id) ON DELETE CASCADE,
+    vehicle_number VARCHAR(20) NOT NULL,
+    vehicle_type VARCHAR(10) NOT NULL CHECK (vehicle_type IN ('car', 'motorcycle', 'truck', 'van')),
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    estimated_cost DECIMAL(10, 2) NOT NULL,
+    status VARCHAR(10) DEFAULT 'reserved' CHECK (status IN ('reserved', 'checked_in', 'cancelled')),
+    booking_id INT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- Sample parking lots and their slots
+INSERT OR IGNORE INTO parking_lots (id, name, location, price_per_hour) VALUES
+(1, 'Downtown Plaza', '123 Main Street, Downtown', 5.00),
+(2, 'Shopping Mall Parking', '456 Mall Avenue, City Center', 3.50),
+(3, 'Airport Parking', '789 Airport Road, Terminal 1', 8.00),
+(4, 'University Campus', '321 College Street, Campus', 2.00),
+(5, 'Business District', '654 Corporate Blvd, Business Area', 6.00);
+
+INSERT OR IGNORE INTO parking_slots (parking_lot_id, slot_number, status)
+WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers WHERE n < 200),
+     sizes(lot_id, slots) AS (VALUES (1, 50), (2, 100), (3, 200), (4, 75), (5, 80))
+SELECT sizes.lot_id, numbers.n, 'vacant'
+FROM sizes
+JOIN numbers ON numbers.n <= sizes.slots;
+
+INSERT OR IGNORE INTO lot_occupancy (lot_id, total_slots, vacant, booked, deleted)
+SELECT p.id,
+       COUNT(CASE WHEN ps.deleted_at IS NULL THEN ps.id END),
+       SUM(CASE WHEN ps.status = 'vacant' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       SUM(CASE WHEN ps.status = 'booked' AND ps.deleted_at IS NULL THEN 1 ELSE 0 END),
+       COUNT(CASE WHEN ps.deleted_at IS NOT NULL THEN ps.id END)
+FROM parking_lots p
+LEFT JOIN parking_slots ps ON p.id = ps.parking_lot_id
+GROUP BY p.id;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_user_id ON bookings(user_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_parking_lot_id ON bookings(parking_lot_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_slot_id ON bookings(slot_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status);
+CREATE INDEX IF NOT EXISTS idx_bookings_end_time ON bookings(end_time);
+CREATE INDEX IF NOT EXISTS idx_parking_slots_lot_id ON parking_slots(parking_lot_id);
+CREATE INDEX IF NOT EXISTS idx_parking_slots_status ON parking_slots(status);
+CREATE INDEX IF NOT EXISTS idx_parking_slots_booking_id ON parking_slots(booking_id);
+CREATE INDEX IF NOT EXISTS idx_parking_lots_deleted_at ON parking_lots(deleted_at);
+CREATE INDEX IF NOT EXISTS idx_parking_slots_deleted_at ON parking_slots(deleted_at);
+CREATE INDEX IF NOT EXISTS idx_lot_occupancy_vacant ON lot_occupancy(vacant);
+CREATE INDEX IF NOT EXISTS idx_revenue_daily_day ON revenue_daily(day);
+CREATE INDEX IF NOT EXISTS idx_revenue_monthly_month ON revenue_monthly(month);
+CREATE INDEX IF NOT EXISTS idx_slot_events_created_at ON slot_events(created_at);
+CREATE INDEX IF NOT EXISTS idx_occupancy_history_lot_day ON occupancy_history(lot_id, day);
+CREATE INDEX IF NOT EXISTS idx_bookings_created_at_id ON bookings(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_status_created_at_id ON bookings(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_lot_created_at_id ON bookings(parking_lot_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_vehicle_number ON bookings(vehicle_number);
+CREATE INDEX IF NOT EXISTS idx_bookings_user_created_at_id ON bookings(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_user_status_created_at_id ON bookings(user_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_created_at_id ON bookings_archive(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_status_created_at_id ON bookings_archive(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_lot_created_at_id ON bookings_archive(parking_lot_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_user_created_at_id ON bookings_archive(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_archive_vehicle_number ON bookings_archive(vehicle_number);
+CREATE INDEX IF NOT EXISTS idx_reservations_slot_status_start ON reservations(slot_id, status, start_time);
+CREATE INDEX IF NOT EXISTS idx_reservations_lot_status_end ON reservations(parking_lot_id, status, end_time);
+CREATE INDEX IF NOT EXISTS idx_reservations_user_status_start ON reservations(user_id, status, start_time);
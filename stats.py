@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class StatsSnapshot:
+    """Caches the result of an expensive computation for ``ttl`` seconds.
+
+    Only one caller computes a new snapshot at a time; callers arriving meanwhile wait
+    for it and reuse the result, so many admins refreshing the dashboard at once cost a
+    single computation. Write paths call ``invalidate`` to drop the snapshot early.
+    """
+
+    def __init__(self, compute, ttl=10):
+        self.compute = compute
+        self.ttl = ttl
+        self._value = None
+        self._computed_at = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.computations = 0
+        self.hits = 0
+
+    def _fresh(self):
+        return self._computed_at is not None and time.monotonic() - self._computed_at < self.ttl
+
+    def get(self):
+        if self._fresh():
+            self.hits += 1
+            return self._value
+
+        with self._lock:
+            # Another request may have refreshed it while we waited for the lock
+            if self._fresh():
+                self.hits += 1
+                return self._value
+
+            generation = self._generation
+            value = self.compute()
+            self.computations += 1
+            # Do not cache a result that an invalidation raced with
+            if generation == self._generation:
+                self._value = value
+                self._computed_at = time.monotonic()
+            return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._computed_at = None